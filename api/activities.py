@@ -1,59 +1,83 @@
 """GET /api/activities — Fetch recent running activities from Garmin."""
 
-from fastapi.responses import JSONResponse
 # Add the api/ directory to Python's search path so lib._shared can be found
 # when running as a Vercel serverless function (cwd is project root, not api/)
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from lib._shared import _get_garmin_client, create_app
+from lib._shared import JSONResponse, create_app
+from lib._garmin import (
+    _get_async_garmin_client, _fetch_activities_page, _sync_activity_store,
+    ACTIVITY_BACKFILL_PAGE, ACTIVITY_STORE_MAX,
+)
+from lib._payloads import build_activities, decode_cursor
 
 # create_app() wraps the app with prefix-stripping + CORS middleware for
 # Vercel file-based mode (strips /api/activities so routes at "/" match)
 app = create_app("activities")
 
+# Hard cap on upstream backfill batches while filling a single page
+ACTIVITY_PAGE_MAX_BACKFILLS = 5
+
 
 @app.get("/")
-async def activities(token: str = "", limit: int = 10, offset: int = 0):
-    """Fetch recent activities from Garmin, filtered to running only.
+async def activities(
+    token: str = "", limit: int = 10, cursor: str = "", offset: int = 0, refresh: bool = False,
+):
+    """Fetch one page of running activities, newest first.
+
+    Pagination uses the opaque next_cursor returned with each page — a
+    (start time, activityId) position, so pages never repeat or skip runs
+    even when new activities arrive in between. Each page holds exactly
+    `limit` running activities unless the history runs out: if the stored
+    activities don't contain enough runs (e.g. a week of cycling), older
+    history is pulled into the per-user activity store one batch at a time,
+    up to ACTIVITY_PAGE_MAX_BACKFILLS batches per request. Pages are read
+    from the store, so "load more" never refetches activities it has seen.
+
+    The store keeps at most ACTIVITY_STORE_MAX activities; history older
+    than that is paged straight from Garmin, from the account offset the
+    cursor carries. If the backfill budget runs out before a page fills, the
+    page comes back short but still with a next_cursor — next_cursor is
+    None only at the start of the account's history.
 
-    Supports pagination via the offset parameter. The Garmin API's
-    get_activities(start, limit) uses 0-based indexing, so offset maps
-    directly to the start parameter. We fetch more than requested to
-    account for non-running activities that get filtered out.
+    The old `offset` parameter is still accepted; it now counts running
+    activities (which is what the frontend always sent).
     """
-    client = _get_garmin_client(token)
-    # Over-fetch to compensate for non-running activities that will be
-    # filtered out. Fetch 3x the requested limit so we have a buffer.
-    fetch_limit = max(limit * 3, 30) if offset == 0 else limit * 3
     try:
-        activities = client.get_activities(offset, fetch_limit)
+        after, hint = decode_cursor(cursor) if cursor else (None, None)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    garmin = await _get_async_garmin_client(token, refresh)
+    try:
+        # Over-fetch to compensate for non-running activities that will be
+        # filtered out. Cursor pages only need older history — no delta sync.
+        min_count = min(max(limit * 3, 30) + offset, ACTIVITY_STORE_MAX)
+        store = await garmin.run(_sync_activity_store, min_count=min_count, delta=after is None)
+        activities, first_offset, complete = store["activities"], 0, store["complete"]
+        if hint is not None and hint > len(activities):
+            # The cursor is past the end of the store — page Garmin from there
+            activities, first_offset, complete = [], hint, False
+
+        page = build_activities(activities, limit, after, offset, first_offset, more=not complete)
+        for _ in range(ACTIVITY_PAGE_MAX_BACKFILLS):
+            if len(page["activities"]) >= limit or complete:
+                break
+            if first_offset == 0 and len(activities) + ACTIVITY_BACKFILL_PAGE <= ACTIVITY_STORE_MAX:
+                store = await garmin.run(
+                    _sync_activity_store, min_count=len(activities) + ACTIVITY_BACKFILL_PAGE, delta=False
+                )
+                # No growth means we reached the start of the account's history
+                complete = store["complete"] or len(store["activities"]) == len(activities)
+                activities = store["activities"]
+            else:
+                older = await garmin.run(_fetch_activities_page, first_offset + len(activities))
+                seen = {a.get("activityId") for a in activities}
+                activities = activities + [a for a in older if a.get("activityId") not in seen]
+                complete = len(older) < ACTIVITY_BACKFILL_PAGE
+            page = build_activities(activities, limit, after, offset, first_offset, more=not complete)
     except Exception as e:
         return JSONResponse(status_code=502, content={"error": f"Failed to fetch activities: {str(e)}"})
 
-    # Filter to running activities only — exclude hiking, cycling, walking, etc.
-    running_types = {"running", "trail_running", "track_running", "treadmill_running", "virtual_run"}
-    slim = []
-    for a in activities:
-        type_key = a.get("activityType", {}).get("typeKey", "unknown")
-        if type_key.lower() not in running_types:
-            continue
-        slim.append({
-            "id": a.get("activityId"),
-            "name": a.get("activityName", "Unnamed"),
-            "type": type_key,
-            "start_time": a.get("startTimeLocal"),
-            "distance": round(a.get("distance", 0) / 1000, 2),
-            "duration": round(a.get("duration", 0) / 60, 1),
-            "avg_pace": a.get("averageSpeed", 0),
-            "avg_hr": a.get("averageHR"),
-            "max_hr": a.get("maxHR"),
-            "calories": a.get("calories"),
-            "elevation_gain": round(a.get("elevationGain", 0), 1),
-            "training_effect": a.get("aerobicTrainingEffect"),
-            "avg_cadence": a.get("averageRunningCadenceInStepsPerMinute"),
-            "elapsed_duration": round(a.get("elapsedDuration", 0) / 60, 1) if a.get("elapsedDuration") else None,
-        })
-    # Trim to the requested limit after filtering
-    slim = slim[:limit]
-    return JSONResponse(content={"activities": slim})
+    return JSONResponse(content=page)
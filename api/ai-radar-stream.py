@@ -0,0 +1,126 @@
+"""GET /api/ai-radar-stream — AI race readiness ratings streamed as server-sent events."""
+
+from fastapi.responses import StreamingResponse
+import os
+import json
+import time
+# Add the api/ directory to Python's search path so lib._shared can be found
+# when running as a Vercel serverless function (cwd is project root, not api/)
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from lib._shared import JSONResponse, _get_openai_client, _get_session, _openai_call, _run_blocking, _user_id, create_app
+from lib._garmin import _get_async_garmin_client
+from lib._ai_radar import (
+    AI_RADAR_COMPLETION_PARAMS, DimensionParser, analysis_key, build_messages,
+    collect_activity_data, get_cached_analysis, save_analysis, usage_summary,
+)
+
+# create_app() wraps the app with prefix-stripping + CORS middleware for
+# Vercel file-based mode (strips /api/ai-radar-stream so routes at "/" match)
+app = create_app("ai-radar-stream")
+
+# Stop proxies (and Vercel's edge) from buffering the stream — the whole
+# point is that each event reaches the browser as soon as it's written.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _sse(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _replay(cached: dict):
+    """Stream a cached analysis — every dimension at once, then done."""
+    for dim in cached.get("dimensions", []):
+        yield _sse("dimension", dim)
+    yield _sse("done", cached)
+
+
+async def _stream_analysis(api_key: str, messages: list, user_id, key: str):
+    """Forward the model's reply as one "dimension" event per rated dimension.
+
+    Each dimension is emitted as soon as its closing brace arrives (see
+    DimensionParser), followed by a "done" event carrying the full result in
+    the same shape /api/ai-radar returns (including "usage"). Failures after
+    the stream has started can't change the HTTP status, so they're sent as
+    an "error" event.
+    """
+    parser = DimensionParser()
+    dims = []
+    usage = None
+    started = time.perf_counter()
+    try:
+        ai_client = _get_openai_client(api_key)
+        # The headers are long gone by the time this ends, so the span only
+        # makes the request's log line and metrics, not its Server-Timing header
+        with _openai_call() as call:
+            stream = await ai_client.chat.completions.create(
+                messages=messages, stream=True, stream_options={"include_usage": True},
+                **AI_RADAR_COMPLETION_PARAMS,
+            )
+            async for chunk in stream:
+                # With include_usage the last chunk has no choices, only usage
+                usage = call.usage = getattr(chunk, "usage", None) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                for dim in parser.feed(delta):
+                    dims.append(dim)
+                    yield _sse("dimension", dim)
+    except Exception as e:
+        yield _sse("error", {"error": f"AI radar failed: {str(e)}"})
+        return
+
+    try:
+        result = json.loads(parser.text)
+    except json.JSONDecodeError:
+        # Every dimension that parsed was already delivered — keep them, but
+        # don't cache a partial reply (e.g. one cut off by max tokens)
+        if not dims:
+            yield _sse("error", {"error": "AI returned unparseable response."})
+            return
+        result = {"dimensions": dims}
+    else:
+        await _run_blocking(save_analysis, user_id, key, result)
+    yield _sse("done", {
+        **result, "cached": False, "cache_age_s": 0,
+        "usage": usage_summary(usage, started, messages),
+    })
+
+
+@app.get("/")
+async def ai_radar_stream(token: str = "", refresh: bool = False):
+    """Streaming variant of /api/ai-radar for progressive rendering.
+
+    Same inputs, prompt and result cache as /api/ai-radar, but the response is
+    a text/event-stream: a "dimension" event per rated dimension as soon as it
+    parses, then "done" with the full result (including "cached" and
+    "cache_age_s"), or "error". Errors before the stream starts (invalid
+    session, Garmin failure, missing API key) are plain JSON responses with
+    the same status codes as /api/ai-radar.
+    """
+    garmin = await _get_async_garmin_client(token, refresh)
+    sess = _get_session(token)
+    race_goal = sess.get("race_goal")
+
+    try:
+        activities_data = await garmin.run(collect_activity_data)
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"error": f"Failed to fetch activities: {str(e)}"})
+
+    user_id = _user_id(sess)
+    key = analysis_key(activities_data, race_goal)
+    cached = await _run_blocking(get_cached_analysis, user_id, key)
+    if cached:
+        return StreamingResponse(_replay(cached), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    api_key = os.getenv("RACE_GOAL_OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return JSONResponse(status_code=500, content={"error": "OpenAI API key not configured."})
+
+    return StreamingResponse(
+        _stream_analysis(api_key, build_messages(activities_data, race_goal), user_id, key),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
@@ -1,22 +1,150 @@
 """POST /api/analyse — Running posture analysis via GPT-4o Vision."""
 
 from fastapi import File, UploadFile, Form
-from fastapi.responses import JSONResponse
-from typing import List
+from typing import List, Tuple
+import io
 import os
 import base64
 import json
-from openai import AsyncOpenAI
+import hashlib
+from PIL import Image, ImageOps
 # Add the api/ directory to Python's search path so lib._shared can be found
 # when running as a Vercel serverless function (cwd is project root, not api/)
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from lib._shared import create_app
+from lib._shared import JSONResponse, _BoundedResultCache, _get_openai_client, _openai_call, _run_blocking, create_app
+
+# Upload limits. Phone photos are typically 3–15 MB. The whole multipart
+# body is capped before Starlette parses (and spools) it; each image is then
+# also checked against MAX_IMAGE_BYTES, and read into memory one at a time.
+MAX_IMAGES = 4
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_BODY_BYTES = MAX_IMAGES * MAX_IMAGE_BYTES + 1024 * 1024  # + multipart framing and profile
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Refuse to decode absurd pixel counts (decompression bombs). Checked in
+# _downscale_image rather than through the process-wide Image.MAX_IMAGE_PIXELS.
+MAX_IMAGE_PIXELS = 60_000_000
 
 # create_app() wraps the app with prefix-stripping + CORS middleware for
-# Vercel file-based mode (strips /api/analyse so routes at "/" match)
-app = create_app("analyse")
+# Vercel file-based mode (strips /api/analyse so routes at "/" match), and
+# refuses request bodies over MAX_BODY_BYTES before the form is parsed
+app = create_app("analyse", max_body_bytes=MAX_BODY_BYTES)
+
+# With detail "high" the vision model first fits the image within 2048×2048
+# and then scales the short side down to 768 px — anything larger is thrown
+# away upstream after we've paid to upload it. Resizing to the same bounds
+# here sends the model exactly the pixels it would have used.
+VISION_MAX_LONG_EDGE = 2048
+VISION_MAX_SHORT_EDGE = 768
+JPEG_QUALITY = 85
+
+
+# Bump whenever the prompt, model or generation settings change so results
+# cached under the old prompt are no longer served.
+POSTURE_PROMPT_VERSION = "1"
+
+# Resubmissions (a retry, or one profile field tweaked and back) are served
+# from here instead of another multi-image GPT-4o call.
+_posture_results = _BoundedResultCache(
+    prefix="race:posture:",
+    ttl=3600 * 24 * 7,  # 7 days
+    max_entries=2000,
+    local_max=64,
+)
+
+
+def _analysis_key(image_digests: List[bytes], profile_text: str, kind: str) -> str:
+    """Content hash of the images, profile text and prompt version.
+
+    kind says what the image digests were taken over: "upload" (the raw
+    bytes — checked first, before any decoding, so a retry of the exact same
+    request is answered in milliseconds) or "image" (the normalized,
+    downscaled bytes — so the same photo still matches after an EXIF strip or
+    a re-save by the browser). The profile text is whitespace- and
+    case-normalized so cosmetic differences don't miss the cache.
+    """
+    h = hashlib.sha256(f"{POSTURE_PROMPT_VERSION}:{kind}".encode())
+    for digest in image_digests:
+        h.update(digest)
+    h.update(" ".join(profile_text.split()).casefold().encode())
+    return h.hexdigest()
+
+
+class _UploadTooLarge(Exception):
+    pass
+
+
+class _ImageTooLarge(Exception):
+    pass
+
+
+async def _hash_upload(upload: UploadFile) -> bytes:
+    """SHA-256 of an upload, read from its spool file in chunks; rewinds after.
+
+    Raises _UploadTooLarge past MAX_IMAGE_BYTES.
+    """
+    h = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_IMAGE_BYTES:
+            raise _UploadTooLarge(upload.filename or "image")
+        h.update(chunk)
+    await upload.seek(0)
+    return h.digest()
+
+
+async def _read_capped(upload: UploadFile) -> bytes:
+    """Read an upload in chunks, raising _UploadTooLarge past MAX_IMAGE_BYTES."""
+    buf = bytearray()
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            return bytes(buf)
+        buf += chunk
+        if len(buf) > MAX_IMAGE_BYTES:
+            raise _UploadTooLarge(upload.filename or "image")
+
+
+def _vision_size(width: int, height: int) -> Tuple[int, int]:
+    """Size the vision model would downscale (width, height) to."""
+    scale = min(
+        1.0,
+        VISION_MAX_LONG_EDGE / max(width, height),
+        VISION_MAX_SHORT_EDGE / min(width, height),
+    )
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _downscale_image(data: bytes) -> Tuple[bytes, str]:
+    """Decode, orient, resize and re-encode one photo as a compact JPEG.
+
+    draft() lets the JPEG decoder skip straight to a reduced scale (1/2, 1/4,
+    1/8), so a 12 MP photo is never fully expanded in memory. EXIF rotation
+    is applied before the orientation tag is dropped by re-encoding.
+    Returns (jpeg_bytes, "image/jpeg"). Raises _ImageTooLarge past
+    MAX_IMAGE_PIXELS, before any pixel data is decoded.
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        if img.width * img.height > MAX_IMAGE_PIXELS:
+            raise _ImageTooLarge(f"{img.width}×{img.height}")
+        target = _vision_size(*img.size)
+        img.draft("RGB", target)
+        img = ImageOps.exif_transpose(img)
+        # exif_transpose may swap the axes — recompute for the oriented image
+        target = _vision_size(*img.size)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if img.size != target:
+            img = img.resize(target, Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue(), "image/jpeg"
+
 
 POSTURE_SYSTEM_INSTRUCTION = """You are an expert running coach and sports biomechanics analyst.
 You analyse side-view running photographs to provide qualitative, actionable feedback on running form.
@@ -116,48 +244,108 @@ async def analyse_posture(
     images: List[UploadFile] = File(...),
     profile: str = Form(default='{}')
 ):
-    """Accept up to 4 side-view running photos and a JSON runner profile, return GPT-4o posture analysis."""
+    """Accept up to 4 side-view running photos and a JSON runner profile, return GPT-4o posture analysis.
+
+    Each photo is read with a size cap and downscaled to the resolution the
+    vision model actually uses before being base64-encoded (see
+    _downscale_image). The response includes "image_bytes" — per-image upload
+    size before and after — so the savings are visible. Identical
+    resubmissions are answered from a result cache (see _analysis_key) and
+    flagged with "cached" and "cache_age_s"; "image_bytes" then describes the
+    original run, which processed the same photos.
+    """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         return JSONResponse(status_code=500, content={"error": "OPENAI_API_KEY is not configured."})
 
-    capped_images = images[:4]
+    capped_images = images[:MAX_IMAGES]
     if not capped_images:
         return JSONResponse(status_code=400, content={"error": "At least one image is required."})
 
-    image_content = []
+    try:
+        profile_obj = json.loads(profile)
+    except (json.JSONDecodeError, TypeError):
+        profile_obj = {}
+    profile_text = build_profile_text(profile_obj)
+
+    def cached_response(cached):
+        result, age = cached
+        return JSONResponse(content={**result, "cached": True, "cache_age_s": age})
+
+    # Fast path: an exact resubmission hits on the raw upload hash, before
+    # any image is decoded
+    try:
+        upload_digests = [await _hash_upload(f) for f in capped_images]
+    except _UploadTooLarge as e:
+        limit_mb = MAX_IMAGE_BYTES // (1024 * 1024)
+        return JSONResponse(status_code=413, content={"error": f"{e} is larger than {limit_mb} MB."})
+    upload_key = _analysis_key(upload_digests, profile_text, "upload")
+    cached = await _run_blocking(_posture_results.get, upload_key)
+    if cached:
+        return cached_response(cached)
+
+    # One image at a time, so only one raw upload is held in memory at once
+    normalized = []
+    image_bytes_report = []
     for image_file in capped_images:
-        image_bytes = await image_file.read()
-        mime = image_file.content_type or "image/jpeg"
+        raw = await _read_capped(image_file)
+        name = image_file.filename or "image"
+        try:
+            # Decoding and resizing is CPU-bound — keep it off the event loop
+            image_bytes, mime = await _run_blocking(_downscale_image, raw)
+        except (_ImageTooLarge, Image.DecompressionBombError):
+            limit_mp = MAX_IMAGE_PIXELS // 1_000_000
+            return JSONResponse(status_code=413, content={"error": f"{name} is larger than {limit_mp} megapixels."})
+        except Exception:
+            # Never forward bytes we couldn't decode — they'd only fail (or
+            # be billed) upstream
+            return JSONResponse(status_code=400, content={"error": f"{name} is not a readable image."})
+        image_bytes_report.append({"before": len(raw), "after": len(image_bytes)})
+        del raw
+        normalized.append((image_bytes, mime))
+
+    image_key = _analysis_key(
+        [hashlib.sha256(data).digest() for data, _ in normalized], profile_text, "image",
+    )
+    cached = await _run_blocking(_posture_results.get, image_key)
+    if cached:
+        # Same photos, different container bytes — alias this upload too,
+        # keeping the original result's age (and leaving an existing alias be)
+        result, age = cached
+        await _run_blocking(_posture_results.set, upload_key, result, age=age, if_missing=True)
+        return cached_response(cached)
+
+    image_content = []
+    for image_bytes, mime in normalized:
         b64 = base64.b64encode(image_bytes).decode("utf-8")
         image_content.append({
             "type": "image_url",
             "image_url": {"url": f"data:{mime};base64,{b64}", "detail": "high"}
         })
-
-    try:
-        profile_obj = json.loads(profile)
-    except (json.JSONDecodeError, TypeError):
-        profile_obj = {}
-
-    profile_text = build_profile_text(profile_obj)
     prompt_text = build_posture_prompt(profile_text, len(capped_images))
     user_content = [{"type": "text", "text": prompt_text}] + image_content
 
     try:
-        client = AsyncOpenAI(api_key=api_key)
-        response = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": POSTURE_SYSTEM_INSTRUCTION},
-                {"role": "user", "content": user_content}
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=4096,
-            temperature=0.3
-        )
+        client = _get_openai_client(api_key)
+        with _openai_call() as call:
+            response = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": POSTURE_SYSTEM_INSTRUCTION},
+                    {"role": "user", "content": user_content}
+                ],
+                response_format={"type": "json_object"},
+                max_tokens=4096,
+                temperature=0.3
+            )
+            call.usage = getattr(response, "usage", None)
         result = json.loads(response.choices[0].message.content)
-        return JSONResponse(content=result)
+        result["image_bytes"] = image_bytes_report
+        # Only cache well-formed analyses — a malformed reply should be retried
+        if isinstance(result.get("elements"), list):
+            await _run_blocking(_posture_results.set, image_key, result)
+            await _run_blocking(_posture_results.set, upload_key, result)
+        return JSONResponse(content={**result, "cached": False, "cache_age_s": 0})
     except json.JSONDecodeError as e:
         return JSONResponse(status_code=500, content={"error": "AI returned unparseable JSON.", "detail": str(e)})
     except Exception as e:
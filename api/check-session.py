@@ -1,13 +1,12 @@
 """GET /api/check-session — Check if a session token is still valid."""
 
-from fastapi.responses import JSONResponse
 import re
 # Add the api/ directory to Python's search path so lib._shared can be found
 # when running as a Vercel serverless function (cwd is project root, not api/)
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from lib._shared import _session_exists, _get_session, create_app
+from lib._shared import JSONResponse, _find_session, create_app
 
 # create_app() wraps the app with prefix-stripping + CORS middleware for
 # Vercel file-based mode (strips /api/check-session so routes at "/" match)
@@ -22,10 +21,12 @@ async def check_session(token: str = ""):
     screen or skip straight to the dashboard. Also applies a UUID check on
     display_name — if it looks like a UUID, fall back to full_name instead.
     This fixes sessions created before the UUID detection was added.
+
+    A single GETEX both checks the token and refreshes its TTL.
     """
-    if not token or not _session_exists(token):
+    sess = _find_session(token)
+    if not sess:
         return JSONResponse(content={"valid": False})
-    sess = _get_session(token)
     raw_display = sess.get("display_name", "")
     full_name = sess.get("full_name", "")
     # If display_name looks like a UUID, prefer full_name
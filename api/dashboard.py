@@ -0,0 +1,64 @@
+"""GET /api/dashboard — Metrics, activities and weekly mileage in one response."""
+
+# Add the api/ directory to Python's search path so lib._shared can be found
+# when running as a Vercel serverless function (cwd is project root, not api/)
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from lib._shared import JSONResponse, _get_session, create_app
+from lib._garmin import _get_async_garmin_client, _sync_activity_store
+from lib._payloads import (
+    WEEKLY_MILEAGE_MAX_WEEKS, build_activities, build_metrics, build_weekly_mileage, weekly_start_date,
+)
+
+# create_app() wraps the app with prefix-stripping + CORS middleware for
+# Vercel file-based mode (strips /api/dashboard so routes at "/" match)
+app = create_app("dashboard")
+
+
+@app.get("/")
+async def dashboard(token: str = "", limit: int = 10, weeks: int = 12, refresh: bool = False):
+    """Return the metrics, first activities page and weekly mileage together.
+
+    The dashboard used to call metrics, activities and weekly-mileage in
+    parallel on load — three cold starts, three session reads, three Garmin
+    logins and overlapping activity fetches. This endpoint builds the same
+    three payloads from one authenticated client and ONE activity sync that
+    covers both the activities page and the weekly-mileage window. The sync
+    runs concurrently with the metric groups inside build_metrics.
+
+    Response keys match the standalone endpoints ("metrics", "activities",
+    "next_cursor", "weeks"). If the activity sync fails, "activities"/"weeks" are omitted
+    and the reason is reported under "errors" — metrics are still returned.
+    The standalone endpoints remain for incremental refreshes (e.g. "Load
+    more" in the activity list). `weeks` is limited like /api/weekly-mileage.
+    """
+    if not 1 <= weeks <= WEEKLY_MILEAGE_MAX_WEEKS:
+        return JSONResponse(status_code=400, content={
+            "error": f"weeks must be between 1 and {WEEKLY_MILEAGE_MAX_WEEKS}."
+        })
+
+    garmin = await _get_async_garmin_client(token, refresh)
+    client = garmin.sync
+    sess = _get_session(token)
+
+    # Same over-fetch as /api/activities for offset 0, and far enough back
+    # for the weekly-mileage window
+    fetch_limit = max(limit * 3, 30)
+    synced = {}
+
+    def fetch_activities():
+        synced["store"] = _sync_activity_store(
+            client, min_count=fetch_limit, since=weekly_start_date(weeks)
+        )
+        return synced["store"]["activities"]
+
+    content = {"metrics": await build_metrics(client, sess, fetch_activities)}
+
+    store = synced.get("store")
+    if store is None:
+        content["errors"] = {"activities": "Failed to fetch activities."}
+    else:
+        content.update(build_activities(store["activities"], limit, more=not store["complete"]))
+        content["weeks"] = build_weekly_mileage(store["weekly"], weeks)
+    return JSONResponse(content=content)
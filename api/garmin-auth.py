@@ -1,6 +1,5 @@
 """POST /api/garmin-auth — Authenticate with Garmin Connect and create a session."""
 
-from fastapi.responses import JSONResponse
 from datetime import datetime
 import uuid
 import re
@@ -15,7 +14,11 @@ from garminconnect import (
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from lib._shared import GarminAuthRequest, _save_session, _update_session, create_app
+from lib._shared import GarminAuthRequest, JSONResponse, _metric, _save_session, _run_blocking, _span, _user_id, create_app
+from lib._garmin import (
+    _GarminBackoff, _call_garmin, _dump_garmin_tokens, _garmin_outcome, _login_blocked,
+    _record_login_failure,
+)
 
 # create_app() wraps the app with prefix-stripping + CORS middleware for
 # Vercel file-based mode (strips /api/garmin-auth so routes at "/" match)
@@ -26,19 +29,56 @@ app = create_app("garmin-auth")
 async def garmin_auth(body: GarminAuthRequest):
     """Authenticate with Garmin Connect and create a session.
 
-    On success, stores the live Garmin client + credentials in the session store
-    so the client can be lazily re-created after a server restart. Also fetches
+    On success, stores the serialized Garmin OAuth tokens + credentials in the
+    session store so later requests can resume the client without another SSO
+    login (credentials are only the last-resort fallback). Also fetches
     the user's display name, profile image, and primary device for the dashboard.
     """
+    # Answer recently rejected credentials and active lockouts locally —
+    # another SSO attempt would only extend Garmin's lockout
+    blocked = _login_blocked(body.email, body.password)
+    if blocked:
+        _metric("race_goal_garmin_calls_total", {"method": "login", "outcome": "backoff"})
+    if blocked == "locked":
+        return JSONResponse(status_code=429, content={
+            "error": "Garmin is temporarily blocking login attempts.",
+            "detail": "Too many attempts. Please wait 10–15 minutes before trying again."
+        })
+    if blocked == "auth":
+        return JSONResponse(status_code=401, content={
+            "error": "Invalid Garmin credentials.",
+            "detail": "Please double-check your email and password."
+        })
+
+    # Same call policy as every other Garmin call (see _call_garmin): the
+    # shared throttle and breaker, and retries of transient errors (but not
+    # 429s) under a deadline — so the library's own retries are off
+    user_key = _user_id({"email": body.email})
     try:
-        client = Garmin(body.email, body.password)
-        client.login()
-    except GarminConnectAuthenticationError:
+        client = Garmin(body.email, body.password, retry_attempts=0)
+        # The SSO login is blocking network I/O — run it off the event loop
+        try:
+            with _span("garmin-login"):
+                await _run_blocking(_call_garmin, user_key, client.login, retry_429=False)
+        except Exception as e:
+            _metric("race_goal_garmin_calls_total", {"method": "login", "outcome": _garmin_outcome(e)})
+            raise
+        _metric("race_goal_garmin_calls_total", {"method": "login", "outcome": "ok"})
+    except _GarminBackoff:
+        # Our breaker or request budget, not a lockout of this account —
+        # nothing to remember against these credentials
+        return JSONResponse(status_code=429, content={
+            "error": "Garmin is rate limiting requests.",
+            "detail": "Please wait a few minutes before trying again."
+        })
+    except GarminConnectAuthenticationError as e:
+        _record_login_failure(body.email, body.password, e)
         return JSONResponse(status_code=401, content={
             "error": "Invalid Garmin credentials.",
             "detail": "Please double-check your email and password."
         })
-    except GarminConnectTooManyRequestsError:
+    except GarminConnectTooManyRequestsError as e:
+        _record_login_failure(body.email, body.password, e)
         return JSONResponse(status_code=429, content={
             "error": "Garmin is temporarily blocking login attempts.",
             "detail": "Too many attempts. Please wait 10–15 minutes before trying again."
@@ -46,6 +86,7 @@ async def garmin_auth(body: GarminAuthRequest):
     except GarminConnectConnectionError as e:
         err_msg = str(e).lower()
         if "429" in err_msg or "rate" in err_msg:
+            _record_login_failure(body.email, body.password, GarminConnectTooManyRequestsError(str(e)))
             return JSONResponse(status_code=429, content={
                 "error": "Garmin is temporarily blocking login attempts.",
                 "detail": "Too many attempts. Please wait 10–15 minutes before trying again."
@@ -60,17 +101,6 @@ async def garmin_auth(body: GarminAuthRequest):
             "detail": str(e)
         })
 
-    # Create a session — store credentials for lazy re-authentication.
-    # The Garmin client object is NOT stored (can't be serialized for Redis);
-    # it is re-created from email+password by _get_garmin_client when needed.
-    token = str(uuid.uuid4())
-    _save_session(token, {
-        "email": body.email,
-        "password": body.password,
-        "race_goal": None,
-        "created_at": datetime.now().isoformat(),
-    })
-
     # Fetch display name — fallback to email username if Garmin doesn't provide one
     display_name = getattr(client, "display_name", None) or body.email.split("@")[0]
     full_name = ""
@@ -79,7 +109,10 @@ async def garmin_auth(body: GarminAuthRequest):
 
     # Social profile for full name + profile image
     try:
-        profile = client.connectapi("/userprofile-service/socialProfile")
+        with _span("garmin.connectapi"):
+            profile = await _run_blocking(
+                _call_garmin, user_key, client.connectapi, "/userprofile-service/socialProfile",
+            )
         if isinstance(profile, dict):
             raw_display = profile.get("displayName") or ""
             full_name = profile.get("fullName") or ""
@@ -103,7 +136,8 @@ async def garmin_auth(body: GarminAuthRequest):
 
     # Device info — prefer primary device
     try:
-        devices = client.get_devices()
+        with _span("garmin.get_devices"):
+            devices = await _run_blocking(_call_garmin, user_key, client.get_devices)
         if isinstance(devices, list) and devices:
             primary = next((d for d in devices if d.get("primary")), devices[0])
             device_name = (
@@ -114,8 +148,19 @@ async def garmin_auth(body: GarminAuthRequest):
     except Exception:
         pass
 
-    # Store profile info in session for later use (check-session returns these)
-    _update_session(token, {
+    # Create the session in one write, now that the profile info is known
+    # (check-session returns it). Only the OAuth tokens are needed for lazy
+    # re-authentication: the Garmin client object is NOT stored (can't be
+    # serialized for Redis); _get_garmin_client resumes it from
+    # garmin_tokens when needed, falling back to email+password only if the
+    # tokens are rejected.
+    token = str(uuid.uuid4())
+    _save_session(token, {
+        "email": body.email,
+        "password": body.password,
+        "garmin_tokens": _dump_garmin_tokens(client),
+        "race_goal": None,
+        "created_at": datetime.now().isoformat(),
         "display_name": display_name,
         "full_name": full_name,
         "profile_image_url": profile_image_url,
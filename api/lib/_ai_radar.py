@@ -0,0 +1,353 @@
+"""Shared pieces of the AI race-readiness analysis (/api/ai-radar*).
+
+/api/ai-radar returns the full 6-dimension JSON in one response and
+/api/ai-radar-stream streams it dimension by dimension. Both build the same
+prompt from the same activity data and share one result cache, so a rating
+produced by either endpoint is served instantly by the other.
+"""
+
+import re
+import json
+import time
+import hashlib
+from typing import Optional
+
+from lib._shared import _get_user_data, _metric, _set_user_data
+from lib._garmin import _sync_activities
+
+# Bump whenever the prompt, model or generation settings change so results
+# cached under the old prompt are no longer served.
+AI_RADAR_PROMPT_VERSION = "2"
+AI_RADAR_CACHE_TTL = 3600 * 24 * 30  # 30 days
+AI_RADAR_DIMENSION_COUNT = 6  # dimensions the prompt asks for
+
+# Activities sent to the model. The tabular encoding (encode_activities) is
+# roughly a third the size of the old indented JSON per activity, so 50 rows
+# still cost fewer prompt tokens than the 30 we used to send.
+AI_RADAR_ACTIVITY_COUNT = 50
+
+AI_RADAR_SYSTEM_PROMPT = "You are an expert running coach and sports scientist. Return only valid JSON."
+
+# gpt-5.6-luna only supports max_completion_tokens + reasoning_effort (no temperature)
+# Increased from 1024 to 4096 — 6 dimensions × 4-5 sentences each requires more tokens
+AI_RADAR_COMPLETION_PARAMS = {
+    "model": "gpt-5.6-luna",
+    "response_format": {"type": "json_object"},
+    "max_completion_tokens": 4096,
+    "reasoning_effort": "medium",
+}
+
+
+def collect_activity_data(client) -> list:
+    """The most recent activities, reduced to the fields the AI needs."""
+    activities_data = []
+    acts = _sync_activities(client, min_count=AI_RADAR_ACTIVITY_COUNT)[:AI_RADAR_ACTIVITY_COUNT]
+    for a in acts:
+        activities_data.append({
+            "name": a.get("activityName", ""),
+            "type": a.get("activityType", {}).get("typeKey", ""),
+            "date": a.get("startTimeLocal", ""),
+            "distance_km": round(a.get("distance", 0) / 1000, 2),
+            "duration_min": round(a.get("duration", 0) / 60, 1),
+            "avg_hr": a.get("averageHR"),
+            "max_hr": a.get("maxHR"),
+            "calories": a.get("calories"),
+            "elevation_gain": round(a.get("elevationGain", 0), 1),
+            "avg_pace_ms": a.get("averageSpeed"),
+            "avg_cadence": a.get("averageRunningCadenceInStepsPerMinute"),
+            "training_effect": a.get("aerobicTrainingEffect"),
+        })
+    return activities_data
+
+
+# Column header for encode_activities — names carry the units so each row
+# is bare values. Order matches _activity_row.
+ACTIVITY_TABLE_HEADER = (
+    "date|type|name|dist_km|dur_min|avg_hr|max_hr|kcal|elev_gain_m|pace_min_per_km|cadence_spm|aerobic_te"
+)
+
+
+def _num(value, digits: int = 1) -> str:
+    """Compact number: rounded, no trailing zeros, "" when missing."""
+    if value is None:
+        return ""
+    text = f"{round(float(value), digits):.{digits}f}"
+    return text.rstrip("0").rstrip(".") if "." in text else text
+
+
+def _pace(speed_ms) -> str:
+    """m/s → "m:ss" per km, the unit runners (and the model) reason in."""
+    if not speed_ms:
+        return ""
+    total = round(1000 / speed_ms)
+    return f"{total // 60}:{total % 60:02d}"
+
+
+def _activity_row(act: dict) -> str:
+    name = " ".join(str(act.get("name") or "").replace("|", "/").split())
+    return "|".join([
+        (act.get("date") or "")[:16],  # minute precision is plenty
+        act.get("type") or "",
+        name,
+        _num(act.get("distance_km"), 2),
+        _num(act.get("duration_min")),
+        _num(act.get("avg_hr"), 0),
+        _num(act.get("max_hr"), 0),
+        _num(act.get("calories"), 0),
+        _num(act.get("elevation_gain"), 0),
+        _pace(act.get("avg_pace_ms")),
+        _num(act.get("avg_cadence"), 0),
+        _num(act.get("training_effect")),
+    ])
+
+
+def encode_activities(activities_data: list) -> str:
+    """Encode the activity history as a pipe-separated table.
+
+    The schema is stated once in the header instead of repeating every key
+    per activity; units are fixed by the column names and missing values
+    are empty cells rather than nulls. This is most of the prompt, so it is
+    most of the per-call token cost.
+    """
+    return "\n".join([ACTIVITY_TABLE_HEADER] + [_activity_row(a) for a in activities_data])
+
+
+def build_prompt(activities_data: list, race_goal: Optional[dict]) -> str:
+    """The user prompt asking for the 6-dimension ratings."""
+    # Build race goal context for the prompt if the user has set one
+    race_goal_text = ""
+    if race_goal:
+        race_goal_text = f"""
+            RACE GOAL (this is the target the runner is training toward — evaluate all dimensions in context of this goal):
+            - Race Type: {race_goal.get('purpose', 'N/A')}
+            - Distance: {race_goal.get('distance', 'N/A')}
+            - Time Target: {race_goal.get('time_target', 'N/A')}
+            - Race Date: {race_goal.get('race_date', 'N/A')}
+            - Current Weekly Mileage: {race_goal.get('weekly_mileage', 'N/A')} {race_goal.get('mileage_unit', 'km')}
+        """
+
+    prompt = f"""You are an expert running coach and sports scientist. 
+    Evaluate this runner's recent training data and rate their readiness across 6 performance dimensions on a scale of 0–10 (decimals allowed in increment of 0.5, e.g. 7.5). 
+    Address the runner directly as "you" throughout your analysis.
+
+    SCORING PHILOSOPHY (strictly follow this):
+- Be conservative and evidence-based. Only award high scores when the workout data clearly supports them.
+- A score of 7.0 means the runner is roughly on track for the stated race goal with normal training progression.
+- 8.0–8.5 means they are ahead of schedule or showing strong specific fitness for the goal.
+- 9.0+ is rare and requires clear, repeated evidence of superior readiness.
+- Below 6.0 indicates a meaningful gap that needs addressing before race day.
+- Do not inflate scores out of politeness. Prefer under-rating when evidence is weak, missing, or inconsistent.
+- Always interpret the data relative to the specific race goal and time target provided above.
+
+{race_goal_text}
+
+RECENT ACTIVITIES (last {len(activities_data)}, newest first; one per row, "|"-separated, empty = not recorded):
+{encode_activities(activities_data)}
+
+1. **Lactate Threshold** — Ability to sustain near-goal intensity without excessive fatigue accumulation.
+    Scoring anchors:
+    - 9–10: Multiple recent sessions clearly showing ability to hold goal race pace (or faster) for meaningful durations with controlled heart rate.
+    - 7–8: Solid tempo/threshold work near goal pace, or ability to hold goal pace for 20–40 minutes.
+    - 5–6: Some threshold work exists but is too short, too slow relative to goal, or shows significant HR drift.
+    - ≤4: Little to no quality work near goal intensity.
+
+2. **Aerobic Endurance** — Cardiovascular base and ability to sustain long-duration efforts at conversational effort.
+    Scoring anchors:
+    - 9–10: Strong weekly volume + consistent long runs that clearly support the race distance and time goal.
+    - 7–8: Adequate volume and long-run frequency for the goal, with mostly controlled easy effort.
+    - 5–6: Volume or long-run quality is only borderline for the goal distance/time.
+    - ≤4: Clearly insufficient aerobic volume or long-run stimulus for the target race.
+
+3. **Running Economy** — Movement efficiency at a given pace, especially near goal pace.
+    Scoring anchors:
+    - 9–10: Stable, efficient mechanics (cadence + pace consistency) at or near goal pace across multiple sessions.
+    - 7–8: Generally good efficiency on easy and moderate runs, with reasonable economy at goal intensity.
+    - 5–6: Noticeable variability in cadence or rising HR at paces close to goal.
+    - ≤4: Clear signs of poor efficiency or high energy cost at relevant paces.
+
+4. **Strength / Durability** — Musculoskeletal resilience and ability to handle training load without breakdown.
+    Scoring anchors:
+    - 9–10: Consistent training load, good elevation/hill work, and evidence of structural resilience.
+    - 7–8: Solid load consistency and some strength stimulus (hills, longer efforts).
+    - 5–6: Training is present but lacks variety, progression, or shows early signs of strain.
+    - ≤4: Inconsistent load, limited strength stimulus, or concerning fatigue patterns.
+
+5. **VO₂max / Speed** — Maximal aerobic capacity and speed reserve above goal pace.
+    Scoring anchors:
+    - 9–10: Clear, repeated high-intensity work showing meaningful speed reserve above goal pace.
+    - 7–8: Some quality interval or speed work that demonstrates useful speed reserve.
+    - 5–6: Limited true high-intensity stimulus; speed reserve is unclear or marginal.
+    - ≤4: Almost no dedicated speed/VO₂max development relevant to the goal.
+
+6. **Fatigue Resistance** — Ability to maintain performance quality under accumulated fatigue.
+    Scoring anchors:
+    - 9–10: Strong evidence of maintaining pace/effort on tired legs (back-to-back hard days, late-run stability).
+    - 7–8: Reasonable ability to absorb training and still perform on subsequent days.
+    - 5–6: Performance drops noticeably when fatigue accumulates.
+    - ≤4: Clear inability to handle consecutive quality sessions or late-race fatigue.
+
+For each dimension, provide:
+- "score": number from 0–10 (0.5 increments allowed)
+- "summary": 3 sentences giving a high-level overview of your rating for this dimension. Do NOT cite specific paces, distances, heart rates, cadences, or workout names — keep it general and qualitative (e.g. "Your threshold work is developing but needs longer efforts"). This summary is shown as a quick read on the home dashboard.
+- "strengths": 2–3 sentences describing what the recent data shows as positive. You must reference specific paces, distances, heart rates, cadences, or workout patterns from the activities above.
+- "gaps": 2–3 sentences describing the shortfalls relative to the race goal. Again, reference specific data. Explain how far the current level is from what the goal requires.
+
+Important rules:
+- Be specific in strengths and gaps. Generic comments without numbers from the data are not acceptable.
+- Keep the summary general — no specific numbers. It should give the runner a quick sense of where they stand without the detailed evidence.
+- Keep strengths and gaps focused only on that dimension.
+- Do not invent data that is not present in the activities list.
+
+Return ONLY valid JSON:
+{{"dimensions": [{{"name": "Lactate Threshold", "score": 0, "summary": "", "strengths": "", "gaps": ""}}, ...]}}"""
+    return prompt
+
+
+def build_messages(activities_data: list, race_goal: Optional[dict]) -> list:
+    """Chat messages for the completion call."""
+    return [
+        {"role": "system", "content": AI_RADAR_SYSTEM_PROMPT},
+        {"role": "user", "content": build_prompt(activities_data, race_goal)},
+    ]
+
+
+def usage_summary(usage, started: float, messages: list) -> dict:
+    """Per-call accounting returned alongside the ratings.
+
+    Token counts come from the API's usage block (None if it wasn't sent);
+    latency is wall time from the request to the last token.
+    """
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "prompt_chars": sum(len(m["content"]) for m in messages),
+        "latency_ms": int((time.perf_counter() - started) * 1000),
+    }
+
+
+# --- Result cache ---
+
+def analysis_key(activities_data: list, race_goal: Optional[dict]) -> str:
+    """Content hash of everything the AI ratings depend on.
+
+    A new activity changes activities_data and an onboarding edit changes the
+    race goal, so either yields a new key and the cached result is simply not
+    found. saved_at is dropped so re-saving an unchanged goal keeps the cache.
+    """
+    goal = {k: v for k, v in (race_goal or {}).items() if k != "saved_at"}
+    payload = json.dumps(
+        {"v": AI_RADAR_PROMPT_VERSION, "activities": activities_data, "race_goal": goal},
+        sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_cached_analysis(user_id: Optional[str], key: str) -> Optional[dict]:
+    """The cached result for key with "cached"/"cache_age_s", or None.
+
+    Only the latest analysis is kept per user, so a changed key replaces it
+    on the next save.
+    """
+    cached = _get_user_data(user_id, "ai_radar") if user_id else None
+    if not cached or cached.get("key") != key:
+        _metric("race_goal_cache_lookups_total", {"cache": "ai_radar", "result": "miss"})
+        return None
+    _metric("race_goal_cache_lookups_total", {"cache": "ai_radar", "result": "hit"})
+    return {
+        **cached["result"],
+        "cached": True,
+        "cache_age_s": int(time.time() - cached["created_at"]),
+    }
+
+
+def _well_formed(result: dict) -> bool:
+    """Whether result holds all AI_RADAR_DIMENSION_COUNT complete dimensions."""
+    dims = result.get("dimensions")
+    return (
+        isinstance(dims, list) and len(dims) == AI_RADAR_DIMENSION_COUNT
+        and all(
+            isinstance(d, dict)
+            and isinstance(d.get("score"), (int, float)) and not isinstance(d.get("score"), bool)
+            and all(isinstance(d.get(k), str) for k in ("name", "summary", "strengths", "gaps"))
+            for d in dims
+        )
+    )
+
+
+def save_analysis(user_id: Optional[str], key: str, result: dict):
+    """Cache a result — only well-formed ones, so a malformed reply is retried.
+
+    A reply missing a dimension (e.g. cut off by max_completion_tokens) or
+    with a dimension missing its score or text is not cached either.
+    """
+    if user_id and _well_formed(result):
+        _set_user_data(user_id, "ai_radar", {
+            "key": key, "result": result, "created_at": time.time(),
+        }, ttl=AI_RADAR_CACHE_TTL)
+
+
+# --- Streaming ---
+
+_DIMENSIONS_START = re.compile(r'"dimensions"\s*:\s*\[')
+
+
+class DimensionParser:
+    """Pulls completed dimension objects out of a partially streamed reply.
+
+    feed() takes each text delta as it arrives and returns the dimension
+    objects ({name, score, summary, strengths, gaps}) that became complete
+    with it. A small brace/string scanner tracks nesting inside the
+    "dimensions" array, so each character is looked at once no matter how
+    the model splits its output into chunks.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0           # next character to scan
+        self._in_array = False  # inside the "dimensions" array
+        self._done = False      # array closed — ignore the rest
+        self._depth = 0         # brace depth relative to the array
+        self._in_string = False
+        self._escape = False
+        self._start = 0         # start of the object being scanned
+
+    def feed(self, delta: str) -> list:
+        self.text += delta
+        if self._done:
+            return []
+        if not self._in_array:
+            match = _DIMENSIONS_START.search(self.text)
+            if not match:
+                return []
+            self._in_array = True
+            self._pos = match.end()
+
+        found = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        found.append(json.loads(text[self._start:i + 1]))
+                    except ValueError:
+                        pass
+            elif c == "]" and self._depth == 0:
+                self._done = True
+                break
+        self._pos = len(text)
+        return found
@@ -0,0 +1,1209 @@
+"""Garmin helpers shared by the race-goal endpoints that talk to Garmin.
+
+Split out of lib._shared so that importing garminconnect — together with
+the requests/garth stack under it, one of the heaviest imports in the
+project — is only paid by the serverless functions that actually call
+Garmin. check-session, logout, onboarding and analyse import lib._shared
+alone and cold-start without it.
+
+Contains the response cache, the call policy (retries, per-user slots,
+cross-function throttle and circuit breaker), the login negative cache,
+the sync and async client factories, the VO2max index and the incremental
+activity store.
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import asyncio
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+from typing import Callable, Dict, Optional
+from fastapi import HTTPException
+from garminconnect import (
+    Garmin,
+    GarminConnectConnectionError,
+    GarminConnectAuthenticationError,
+    GarminConnectTooManyRequestsError,
+)
+
+from lib._shared import (
+    _count, _garmin_clients, _get_session, _get_user_data, _metric, _redis,
+    _run_blocking, _set_user_data, _span, _update_session, _user_id,
+)
+
+
+# --- Shared Garmin response cache ---
+#
+# metrics, radar and ai-radar all fetch the same Garmin data (the last 30
+# activities, today's HRV, readiness, ...) on every dashboard load. Responses
+# are cached read-through per (user, method, arguments) in the same Upstash
+# Redis as sessions, or an in-memory LRU locally. TTLs depend on the date the
+# data is for: wellness data for days before yesterday is effectively
+# immutable, yesterday's is still settling while the watch syncs, and today's
+# data and activity lists change throughout the day.
+GARMIN_CACHE_PREFIX = "race:garmin:"
+GARMIN_CACHE_TODAY_TTL = 300  # 5 minutes — today's wellness data
+GARMIN_CACHE_YESTERDAY_TTL = 3600  # 1 hour — late syncs can still change it
+GARMIN_CACHE_PAST_TTL = 3600 * 24 * 3  # 3 days — older days don't change
+GARMIN_CACHE_ACTIVITIES_TTL = 120  # 2 minutes — a new run should show up quickly
+GARMIN_CACHE_STATIC_TTL = 3600 * 24  # 1 day — devices and similar
+GARMIN_CACHE_LOCAL_MAX = 512  # entries in the local (no Redis) fallback
+
+# Methods whose first argument is the calendar date the data is for
+_GARMIN_DAILY_METHODS = {
+    "get_max_metrics", "get_fitnessage_data", "get_training_readiness",
+    "get_hrv_data", "get_body_battery", "get_sleep_data", "get_all_day_stress",
+    "get_user_summary",
+}
+# Methods taking a (start, end) date range — cached like a daily method for
+# the range's last day
+_GARMIN_RANGE_METHODS = {"get_hrv_data_range", "get_max_metrics_range"}
+_GARMIN_ACTIVITY_METHODS = {"get_activities", "get_activities_by_date"}
+_GARMIN_STATIC_METHODS = {"get_devices"}
+
+
+def _garmin_cache_ttl(method: str, args: tuple, result) -> int:
+    """Pick a TTL (seconds) for a Garmin response, or 0 to not cache it.
+
+    Empty responses always get the short TTL — "no data yet" for a past day
+    usually means the watch hasn't synced, not that the day is empty.
+    """
+    if method in _GARMIN_ACTIVITY_METHODS:
+        return GARMIN_CACHE_ACTIVITIES_TTL
+    if method in _GARMIN_STATIC_METHODS:
+        return GARMIN_CACHE_STATIC_TTL
+    if method not in _GARMIN_DAILY_METHODS and method not in _GARMIN_RANGE_METHODS:
+        return 0
+    try:
+        qdate = date.fromisoformat(str(args[1] if method in _GARMIN_RANGE_METHODS else args[0]))
+    except (IndexError, ValueError):
+        return GARMIN_CACHE_TODAY_TTL
+    today = date.today()
+    if qdate >= today or result in (None, [], {}):
+        return GARMIN_CACHE_TODAY_TTL
+    if qdate == today - timedelta(days=1):
+        return GARMIN_CACHE_YESTERDAY_TTL
+    return GARMIN_CACHE_PAST_TTL
+
+
+class _GarminResponseCache:
+    """Read-through store for Garmin responses.
+
+    Uses Redis when configured, otherwise a bounded in-memory LRU with
+    per-entry expiry. Values are wrapped as {"v": ...} so a cached None/[]
+    can be told apart from a miss. Store errors are swallowed — the cache
+    must never turn a working Garmin call into a failed request.
+
+    Lookups are counted in race_goal_cache_lookups_total
+    (cache="garmin_response") by _GarminProxy.
+    """
+
+    def __init__(self, local_max: int):
+        self.local_max = local_max
+        self._local: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(user_id: str, method: str, args: tuple, kwargs: dict) -> str:
+        raw = json.dumps([args, kwargs], sort_keys=True, default=str)
+        digest = hashlib.sha1(raw.encode()).hexdigest()[:16]
+        return f"{GARMIN_CACHE_PREFIX}{user_id}:{method}:{digest}"
+
+    def get(self, key: str):
+        """Return (found, value)."""
+        raw = None
+        try:
+            if _redis:
+                raw = _redis.get(key)
+                if isinstance(raw, bytes):
+                    raw = raw.decode()
+            else:
+                with self._lock:
+                    entry = self._local.get(key)
+                    if entry and entry[0] > time.monotonic():
+                        self._local.move_to_end(key)
+                        raw = entry[1]
+                    elif entry:
+                        del self._local[key]
+        except Exception:
+            raw = None
+        if raw is None:
+            return False, None
+        return True, json.loads(raw)["v"]
+
+    def get_many(self, keys: list) -> dict:
+        """{key: (found, value)} for all keys — one round trip (MGET).
+
+        Returns {} on a store error, so callers fall back to get().
+        """
+        try:
+            if _redis:
+                raws = _redis.mget(*keys)
+            else:
+                return {key: self.get(key) for key in keys}
+        except Exception:
+            return {}
+        found = {}
+        for key, raw in zip(keys, raws):
+            if isinstance(raw, bytes):
+                raw = raw.decode()
+            found[key] = (False, None) if raw is None else (True, json.loads(raw)["v"])
+        return found
+
+    def set(self, key: str, value, ttl: int):
+        try:
+            raw = json.dumps({"v": value})
+            if _redis:
+                _redis.set(key, raw, ex=ttl)
+            else:
+                with self._lock:
+                    self._local[key] = (time.monotonic() + ttl, raw)
+                    self._local.move_to_end(key)
+                    while len(self._local) > self.local_max:
+                        self._local.popitem(last=False)
+        except Exception:
+            pass
+
+
+_garmin_responses = _GarminResponseCache(GARMIN_CACHE_LOCAL_MAX)
+
+
+# --- Garmin call policy ---
+#
+# Every upstream call made through _GarminProxy runs under one policy:
+# - at most GARMIN_PER_USER_CONCURRENCY calls per Garmin account in flight
+#   on this instance (fan-out jobs and concurrent requests for the same user
+#   share the slots), so one dashboard can't trip Garmin's rate limiter;
+# - 429s and transient failures (network errors, 5xx) are retried with
+#   full-jitter exponential backoff, honouring Retry-After when given;
+# - the whole thing — waiting for a slot, attempts and backoff sleeps —
+#   stays within GARMIN_CALL_DEADLINE, after which _GarminDeadlineExceeded
+#   is raised instead of retrying.
+# The library's own retry loop is switched off (retry_attempts=0) so there
+# is a single, deadline-aware retry layer.
+GARMIN_PER_USER_CONCURRENCY = int(os.getenv("GARMIN_PER_USER_CONCURRENCY", "4"))
+GARMIN_RETRY_ATTEMPTS = int(os.getenv("GARMIN_RETRY_ATTEMPTS", "3"))
+GARMIN_RETRY_BASE_WAIT = float(os.getenv("GARMIN_RETRY_BASE_WAIT", "0.5"))  # seconds
+GARMIN_RETRY_MAX_WAIT = float(os.getenv("GARMIN_RETRY_MAX_WAIT", "4"))  # seconds
+GARMIN_CALL_DEADLINE = float(os.getenv("GARMIN_CALL_DEADLINE", "20"))  # seconds per call
+
+
+class _GarminDeadlineExceeded(GarminConnectConnectionError):
+    """A Garmin call (including retries) ran past its deadline.
+
+    A GarminConnectConnectionError subclass, so existing handlers treat it
+    like any other upstream failure.
+    """
+
+
+# Weak values: a user's semaphore lives only while some call holds a
+# reference to it, so idle users don't accumulate on a long-lived instance.
+# A fresh semaphore for a user with no calls in flight loses nothing.
+_user_slots: "weakref.WeakValueDictionary[str, threading.BoundedSemaphore]" = weakref.WeakValueDictionary()
+_user_slots_lock = threading.Lock()
+
+
+def _user_slot(user_key: str) -> threading.BoundedSemaphore:
+    with _user_slots_lock:
+        slot = _user_slots.get(user_key)
+        if slot is None:
+            slot = _user_slots[user_key] = threading.BoundedSemaphore(GARMIN_PER_USER_CONCURRENCY)
+        return slot
+
+
+def _is_transient(exc: Exception) -> bool:
+    """Whether a failed Garmin call is worth retrying."""
+    if isinstance(exc, GarminConnectTooManyRequestsError):
+        return True
+    if isinstance(exc, _GarminDeadlineExceeded) or not isinstance(exc, GarminConnectConnectionError):
+        return False
+    # No response means the request never completed (DNS, reset, timeout);
+    # 4xx (including 404 "not found") won't change on a retry
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status is None or status >= 500
+
+
+def _retry_wait(attempt: int, exc: Exception) -> float:
+    """Seconds to sleep before retry number attempt (0-based)."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        retry_after = 0.0
+    backoff = random.uniform(0, min(GARMIN_RETRY_MAX_WAIT, GARMIN_RETRY_BASE_WAIT * 2 ** attempt))
+    return max(retry_after, backoff)
+
+
+# --- Cross-function Garmin throttle ---
+#
+# Every api/*.py file is its own function with its own memory, so the
+# per-instance limits above don't stop a burst of dashboard loads (spread
+# over many instances) from tripping Garmin's 10–15 minute lockout. These
+# limits live in Redis and are shared by all functions and instances:
+# - token buckets per Garmin account and for the whole app — a call takes
+#   one token from both, or waits until both have one;
+# - a circuit breaker — GARMIN_BREAKER_THRESHOLD 429s within
+#   GARMIN_BREAKER_WINDOW seconds open it for GARMIN_BREAKER_COOLDOWN
+#   seconds, during which calls fail fast with _GarminBackoff instead of
+#   adding to the pile-up (cached responses are still served, see
+#   _GarminProxy and _sync_activity_store).
+# Checking the breaker and both buckets is a single EVAL per upstream call
+# (cache hits never get here). Without Redis the same logic runs in-process.
+GARMIN_USER_RATE = float(os.getenv("GARMIN_USER_RATE", "3"))  # calls/second per account
+GARMIN_USER_BURST = float(os.getenv("GARMIN_USER_BURST", "30"))
+GARMIN_GLOBAL_RATE = float(os.getenv("GARMIN_GLOBAL_RATE", "20"))  # calls/second overall
+GARMIN_GLOBAL_BURST = float(os.getenv("GARMIN_GLOBAL_BURST", "60"))
+GARMIN_BREAKER_THRESHOLD = int(os.getenv("GARMIN_BREAKER_THRESHOLD", "3"))
+GARMIN_BREAKER_WINDOW = int(os.getenv("GARMIN_BREAKER_WINDOW", "60"))  # seconds
+GARMIN_BREAKER_COOLDOWN = int(os.getenv("GARMIN_BREAKER_COOLDOWN", "120"))  # seconds
+
+THROTTLE_PREFIX = "race:throttle:"
+_BREAKER_KEY = f"{THROTTLE_PREFIX}breaker"
+_BREAKER_COUNT_KEY = f"{THROTTLE_PREFIX}429s"
+_GLOBAL_BUCKET_KEY = f"{THROTTLE_PREFIX}bucket:global"
+
+
+class _GarminBackoff(GarminConnectTooManyRequestsError):
+    """Refused locally — breaker open or rate budget spent — without calling Garmin.
+
+    A GarminConnectTooManyRequestsError subclass so callers handle it like a
+    429, but never retried by _call_garmin (it's raised before an attempt).
+    """
+
+
+# Returns -1 if the breaker is open, 0 if a token was taken from both
+# buckets, otherwise the milliseconds until both buckets have a token.
+# KEYS: breaker, user bucket, global bucket.
+# ARGV: now_ms, user_rate, user_burst, global_rate, global_burst.
+_THROTTLE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return -1 end
+local now = tonumber(ARGV[1])
+local function level(key, rate, burst)
+  local v = redis.call('HMGET', key, 't', 'ts')
+  local tokens = tonumber(v[1]) or burst
+  local ts = tonumber(v[2]) or now
+  return math.min(burst, tokens + math.max(0, now - ts) / 1000 * rate)
+end
+local ur, ub = tonumber(ARGV[2]), tonumber(ARGV[3])
+local gr, gb = tonumber(ARGV[4]), tonumber(ARGV[5])
+local u, g = level(KEYS[2], ur, ub), level(KEYS[3], gr, gb)
+if u < 1 or g < 1 then
+  return math.ceil(math.max((1 - u) / ur, (1 - g) / gr) * 1000)
+end
+redis.call('HSET', KEYS[2], 't', tostring(u - 1), 'ts', ARGV[1])
+redis.call('HSET', KEYS[3], 't', tostring(g - 1), 'ts', ARGV[1])
+redis.call('PEXPIRE', KEYS[2], math.ceil(ub / ur * 1000))
+redis.call('PEXPIRE', KEYS[3], math.ceil(gb / gr * 1000))
+return 0
+"""
+
+# Count a 429; open the breaker once the window's count hits the threshold.
+# KEYS: counter, breaker. ARGV: window_s, threshold, cooldown_s.
+_TRIP_SCRIPT = """
+local n = redis.call('INCR', KEYS[1])
+if n == 1 then redis.call('EXPIRE', KEYS[1], tonumber(ARGV[1])) end
+if n >= tonumber(ARGV[2]) then
+  redis.call('SET', KEYS[2], '1', 'EX', tonumber(ARGV[3]))
+  redis.call('DEL', KEYS[1])
+end
+return n
+"""
+
+
+class _GarminThrottle:
+    """Shared rate limiter + circuit breaker for upstream Garmin calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, tuple] = {}  # local fallback: key -> (tokens, ts)
+        self._recent_429s: list = []
+        self._open_until = 0.0
+
+    def _local_level(self, key: str, rate: float, burst: float, now: float) -> float:
+        tokens, ts = self._buckets.get(key, (burst, now))
+        return min(burst, tokens + max(0.0, now - ts) * rate)
+
+    def _try_take(self, user_key: str) -> float:
+        """-1 if the breaker is open, 0 if taken, else seconds to wait."""
+        user_bucket = f"{THROTTLE_PREFIX}bucket:{user_key}"
+        if _redis:
+            res = _redis.eval(
+                _THROTTLE_SCRIPT,
+                keys=[_BREAKER_KEY, user_bucket, _GLOBAL_BUCKET_KEY],
+                args=[str(int(time.time() * 1000)), str(GARMIN_USER_RATE), str(GARMIN_USER_BURST),
+                      str(GARMIN_GLOBAL_RATE), str(GARMIN_GLOBAL_BURST)],
+            )
+            res = int(res)
+            return res if res <= 0 else res / 1000
+        now = time.time()
+        with self._lock:
+            if now < self._open_until:
+                return -1
+            u = self._local_level(user_bucket, GARMIN_USER_RATE, GARMIN_USER_BURST, now)
+            g = self._local_level(_GLOBAL_BUCKET_KEY, GARMIN_GLOBAL_RATE, GARMIN_GLOBAL_BURST, now)
+            if u < 1 or g < 1:
+                return max((1 - u) / GARMIN_USER_RATE, (1 - g) / GARMIN_GLOBAL_RATE)
+            self._buckets[user_bucket] = (u - 1, now)
+            self._buckets[_GLOBAL_BUCKET_KEY] = (g - 1, now)
+            return 0
+
+    def acquire(self, user_key: str, deadline: float):
+        """Take a token for one call, waiting for refill up to the deadline.
+
+        Raises _GarminBackoff if the breaker is open or no token frees up
+        before the deadline. A store error lets the call through — the
+        throttle must never be the thing that takes Garmin access down.
+        """
+        while True:
+            try:
+                wait = self._try_take(user_key)
+            except Exception:
+                return
+            if wait == 0:
+                return
+            if wait < 0:
+                _count("garmin_breaker_rejections")
+                raise _GarminBackoff("Garmin is rate limiting us; backing off for a few minutes")
+            if time.monotonic() + wait >= deadline:
+                _count("garmin_throttled")
+                raise _GarminBackoff("Garmin request budget exhausted; try again shortly")
+            _count("garmin_throttle_waits")
+            time.sleep(wait)
+
+    def record_429(self):
+        """Count a 429 from Garmin toward opening the breaker."""
+        try:
+            if _redis:
+                _redis.eval(
+                    _TRIP_SCRIPT,
+                    keys=[_BREAKER_COUNT_KEY, _BREAKER_KEY],
+                    args=[str(GARMIN_BREAKER_WINDOW), str(GARMIN_BREAKER_THRESHOLD),
+                          str(GARMIN_BREAKER_COOLDOWN)],
+                )
+                return
+            now = time.time()
+            with self._lock:
+                self._recent_429s = [t for t in self._recent_429s if t > now - GARMIN_BREAKER_WINDOW]
+                self._recent_429s.append(now)
+                if len(self._recent_429s) >= GARMIN_BREAKER_THRESHOLD:
+                    self._open_until = now + GARMIN_BREAKER_COOLDOWN
+                    self._recent_429s = []
+        except Exception:
+            pass
+
+
+_garmin_throttle = _GarminThrottle()
+
+
+def _call_garmin(user_key: str, fn: Callable, *args, retry_429: bool = True, **kwargs):
+    """Run one Garmin call under the call policy and the shared throttle.
+
+    Pass retry_429=False for logins: a 429 there means Garmin is locking the
+    account out, and every further attempt extends the lockout.
+    """
+    deadline = time.monotonic() + GARMIN_CALL_DEADLINE
+    slot = _user_slot(user_key)
+    attempt = 0
+    while True:
+        # Shared (cross-function) budget first, then this instance's slots
+        _garmin_throttle.acquire(user_key, deadline)
+        if not slot.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise _GarminDeadlineExceeded("Timed out waiting for a Garmin request slot")
+        try:
+            _count("garmin_calls")
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if isinstance(e, GarminConnectTooManyRequestsError):
+                _garmin_throttle.record_429()
+            if attempt >= GARMIN_RETRY_ATTEMPTS or not _is_transient(e):
+                raise
+            if not retry_429 and isinstance(e, GarminConnectTooManyRequestsError):
+                raise
+            wait = _retry_wait(attempt, e)
+            if time.monotonic() + wait >= deadline:
+                raise
+        finally:
+            slot.release()
+        # Sleep without holding the slot so other calls for the user proceed
+        _count("garmin_retries")
+        time.sleep(wait)
+        attempt += 1
+
+
+def _garmin_outcome(exc: Optional[Exception]) -> str:
+    """Outcome label of a Garmin call for race_goal_garmin_calls_total."""
+    if exc is None:
+        return "ok"
+    if isinstance(exc, _GarminBackoff):
+        return "backoff"
+    if isinstance(exc, GarminConnectTooManyRequestsError):
+        return "429"
+    if isinstance(exc, GarminConnectAuthenticationError):
+        return "auth_fail"
+    return "error"
+
+
+class _GarminProxy:
+    """Per-request proxy around a live Garmin client.
+
+    Endpoints call Garmin methods on this exactly as on the real client.
+    Every method call is forwarded under the call policy (per-user
+    concurrency limit, retry with backoff, deadline — see _call_garmin),
+    with two additions:
+
+    - Cacheable methods (see _garmin_cache_ttl) are served read-through from
+      the shared response cache, keyed by user + method + arguments. With
+      refresh=True the read is skipped (forced refresh) but the fresh
+      response is still written back. prefetch() reads the entries a
+      fan-out is about to need in one round trip, instead of one GET each.
+    - If a call raises GarminConnectAuthenticationError, the warm client
+      cache entry for the session is dropped before the error propagates, so
+      the next request re-authenticates instead of reusing a dead client.
+    """
+
+    def __init__(self, client: Garmin, token: str, user_id: Optional[str] = None, refresh: bool = False):
+        self._client = client
+        self._token = token
+        self._user_id = user_id
+        self._refresh = refresh
+        # Cache entries read ahead by prefetch(): key -> (found, value)
+        self._prefetched: Dict[str, tuple] = {}
+        # Exposed so helpers like _sync_activities can key per-user data
+        # without another session read
+        self.user_id = user_id
+
+    def prefetch(self, calls: list):
+        """Read the cached responses of upcoming calls in one round trip.
+
+        calls is a list of (method name, args) pairs, with args exactly as
+        the calls will pass them. Each call then takes its cache entry (or
+        its known miss) from here instead of making its own GET. A no-op
+        with refresh=True, where cached reads are skipped anyway.
+        """
+        if self._refresh or not self._user_id:
+            return
+        keys = [_garmin_responses.key(self._user_id, name, tuple(args), {}) for name, args in calls]
+        self._prefetched.update(_garmin_responses.get_many(keys))
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            error = None
+            try:
+                # Throttle waits and retries included — the cost as seen by the endpoint
+                with _span(f"garmin.{name}"):
+                    return _call_garmin(self._user_id or self._token, attr, *args, **kwargs)
+            except Exception as e:
+                error = e
+                if isinstance(e, GarminConnectAuthenticationError):
+                    _garmin_clients.invalidate(self._token)
+                raise
+            finally:
+                _metric("race_goal_garmin_calls_total", {"method": name, "outcome": _garmin_outcome(error)})
+
+        cacheable = (
+            self._user_id
+            and (name in _GARMIN_DAILY_METHODS
+                 or name in _GARMIN_RANGE_METHODS
+                 or name in _GARMIN_ACTIVITY_METHODS
+                 or name in _GARMIN_STATIC_METHODS)
+        )
+        if not cacheable:
+            return call
+
+        def cached_call(*args, **kwargs):
+            key = _garmin_responses.key(self._user_id, name, args, kwargs)
+            if self._refresh:
+                _metric("race_goal_cache_lookups_total", {"cache": "garmin_response", "result": "bypass"})
+            else:
+                prefetched = self._prefetched.pop(key, None)
+                found, value = prefetched or _garmin_responses.get(key)
+                _metric("race_goal_cache_lookups_total", {
+                    "cache": "garmin_response", "result": "hit" if found else "miss",
+                })
+                if found:
+                    return value
+            result = call(*args, **kwargs)
+            ttl = _garmin_cache_ttl(name, args, result)
+            if ttl:
+                _garmin_responses.set(key, result, ttl)
+            return result
+
+        return cached_call
+
+
+# --- Login negative cache ---
+#
+# A session whose stored credentials Garmin rejects would otherwise retry
+# the SSO login on every request, and an account Garmin has locked out for
+# too many attempts would keep extending its own lockout. Both outcomes are
+# remembered in Redis (shared by all functions) and answered locally until
+# they expire: rejected credentials by a hash of email + password (so
+# logging in with a corrected password isn't blocked), lockouts by account.
+LOGIN_BLOCK_PREFIX = "race:loginblock:"
+LOGIN_AUTH_FAILURE_TTL = int(os.getenv("LOGIN_AUTH_FAILURE_TTL", "900"))  # 15 minutes
+LOGIN_LOCKOUT_TTL = int(os.getenv("LOGIN_LOCKOUT_TTL", "900"))  # Garmin locks for 10–15 minutes
+
+_local_login_blocks: Dict[str, float] = {}  # key -> expiry (time.time())
+
+
+def _login_block_keys(email: str, password: str) -> tuple:
+    account = hashlib.sha256(email.strip().lower().encode()).hexdigest()[:24]
+    creds = hashlib.sha256(f"{email.strip().lower()}\0{password}".encode()).hexdigest()[:32]
+    return f"{LOGIN_BLOCK_PREFIX}auth:{creds}", f"{LOGIN_BLOCK_PREFIX}locked:{account}"
+
+
+def _login_blocked(email: str, password: str) -> Optional[str]:
+    """"auth" if these credentials were just rejected, "locked" if the account
+    is in a Garmin login lockout, else None. One round trip (MGET)."""
+    auth_key, lock_key = _login_block_keys(email, password)
+    try:
+        if _redis:
+            auth, locked = _redis.mget(auth_key, lock_key)
+        else:
+            now = time.time()
+            auth = _local_login_blocks.get(auth_key, 0) > now
+            locked = _local_login_blocks.get(lock_key, 0) > now
+    except Exception:
+        return None
+    if locked:
+        return "locked"
+    return "auth" if auth else None
+
+
+def _record_login_failure(email: str, password: str, exc: Exception):
+    """Remember a rejected login (auth failure) or a Garmin lockout (429)."""
+    auth_key, lock_key = _login_block_keys(email, password)
+    if isinstance(exc, GarminConnectAuthenticationError):
+        key, ttl = auth_key, LOGIN_AUTH_FAILURE_TTL
+    elif isinstance(exc, GarminConnectTooManyRequestsError):
+        key, ttl = lock_key, LOGIN_LOCKOUT_TTL
+    else:
+        return
+    try:
+        if _redis:
+            _redis.set(key, "1", ex=ttl)
+        else:
+            _local_login_blocks[key] = time.time() + ttl
+    except Exception:
+        pass
+
+
+def _login_block_error(reason: str) -> HTTPException:
+    if reason == "locked":
+        return HTTPException(
+            status_code=429,
+            detail="Garmin is temporarily blocking login attempts. Please wait 10–15 minutes.",
+        )
+    return HTTPException(
+        status_code=401,
+        detail="Garmin re-authentication failed. Please log in again.",
+    )
+
+
+def _dump_garmin_tokens(client: Garmin) -> Optional[str]:
+    """Serialize an authenticated client's Garmin tokens to a JSON string.
+
+    garminconnect keeps its DI OAuth access + refresh tokens on the inner
+    native client (client.client). Returns None if they can't be dumped
+    (e.g. an older library version or a half-initialised client).
+    """
+    try:
+        return client.client.dumps()
+    except Exception:
+        return None
+
+
+def _get_garmin_client(token: str, refresh: bool = False) -> Garmin:
+    """Return an authenticated Garmin client for the session.
+
+    Checks the per-process warm client cache first — on a hit the login is
+    skipped entirely. On a miss, the client is resumed from the serialized
+    OAuth tokens in the session (garmin_tokens) via login(tokenstore=...).
+    That skips the SSO handshake — the library refreshes the access token
+    itself when it is about to expire, and only falls back to a full
+    password login if the tokens are missing or rejected. If the tokens
+    changed (refresh or fallback login), the new ones are written back to
+    the session so the next cold request resumes from them.
+
+    The session is always read first (even on a cache hit) so logged-out or
+    expired sessions are rejected and active ones get their TTL refreshed.
+
+    The returned client is a _GarminProxy, so cacheable calls go through the
+    shared response cache. Pass refresh=True (endpoints expose it as the
+    ?refresh=true query flag) to bypass cached responses for this request.
+
+    Raises HTTPException(401) if credentials are missing or login fails, and
+    HTTPException(429) while Garmin is locking the account out (see the
+    login negative cache above).
+    """
+    sess = _get_session(token)
+    tokens = sess.get("garmin_tokens") or None
+
+    client = _garmin_clients.get(token)
+    _metric("race_goal_cache_lookups_total", {
+        "cache": "garmin_client", "result": "miss" if client is None else "hit",
+    })
+    if client is None:
+        email = sess.get("email", "")
+        password = sess.get("password", "")
+        if not tokens and (not email or not password):
+            raise HTTPException(
+                status_code=401,
+                detail="Garmin session not found. Please log in again."
+            )
+
+        # Don't retry a login Garmin just rejected or is locking out
+        blocked = _login_blocked(email, password)
+        if blocked:
+            _metric("race_goal_garmin_calls_total", {"method": "login", "outcome": "backoff"})
+            raise _login_block_error(blocked)
+        try:
+            # Retries are handled by _call_garmin, under a deadline
+            client = Garmin(email, password, retry_attempts=0)
+            with _span("garmin-login"):
+                client.login(tokenstore=tokens)
+            _metric("race_goal_garmin_calls_total", {"method": "login", "outcome": "ok"})
+        except Exception as e:
+            _metric("race_goal_garmin_calls_total", {"method": "login", "outcome": _garmin_outcome(e)})
+            _record_login_failure(email, password, e)
+            if isinstance(e, GarminConnectTooManyRequestsError):
+                raise _login_block_error("locked")
+            raise HTTPException(
+                status_code=401,
+                detail="Garmin re-authentication failed. Please log in again."
+            )
+        _garmin_clients.put(token, client)
+
+    # Persist refreshed tokens so the next cold request doesn't repeat the
+    # refresh (or worse, the password login) the library just had to do.
+    fresh_tokens = _dump_garmin_tokens(client)
+    if fresh_tokens and fresh_tokens != tokens:
+        _update_session(token, {"garmin_tokens": fresh_tokens})
+    return _GarminProxy(client, token, _user_id(sess), refresh)
+
+
+# --- Async Garmin facade ---
+#
+# The endpoints are async def, but garminconnect is synchronous: calling it
+# directly holds the worker's event loop for the whole upstream chain, so an
+# instance serves one dashboard at a time. Endpoints use _AsyncGarmin
+# instead, which runs every call (and blocking helpers like
+# _sync_activity_store) on the shared pool and awaits it with a deadline.
+GARMIN_CHAIN_DEADLINE = float(os.getenv("GARMIN_CHAIN_DEADLINE", "45"))  # seconds per helper
+
+
+class _AsyncGarmin:
+    """Async facade over a _GarminProxy.
+
+        garmin = await _get_async_garmin_client(token, refresh)
+        tr = await garmin.get_training_readiness(today)
+        store = await garmin.run(_sync_activity_store, since=start)
+
+    Method calls are awaited with GARMIN_CALL_DEADLINE (the proxy applies
+    the per-user limit, retries and backoff in the worker thread); run()
+    awaits a blocking helper that takes the sync client as its first
+    argument, with GARMIN_CHAIN_DEADLINE. A timed-out thread can't be
+    killed — it finishes in the background and its result is discarded.
+    The sync proxy stays available as .sync for code that already runs off
+    the loop (e.g. fan-out jobs).
+    """
+
+    def __init__(self, proxy: _GarminProxy):
+        self.sync = proxy
+        self.user_id = proxy.user_id
+
+    @staticmethod
+    async def _await(fn: Callable, deadline: float, *args, **kwargs):
+        try:
+            return await asyncio.wait_for(_run_blocking(fn, *args, **kwargs), deadline)
+        except asyncio.TimeoutError:
+            raise _GarminDeadlineExceeded(f"Garmin call exceeded {deadline:g}s")
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self._await(attr, GARMIN_CALL_DEADLINE, *args, **kwargs)
+
+        return call
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        return await self._await(fn, GARMIN_CHAIN_DEADLINE, self.sync, *args, **kwargs)
+
+
+async def _get_async_garmin_client(token: str, refresh: bool = False) -> _AsyncGarmin:
+    """Async counterpart of _get_garmin_client — the login runs off the loop.
+
+    Raises HTTPException(401) like _get_garmin_client.
+    """
+    return _AsyncGarmin(await _run_blocking(_get_garmin_client, token, refresh))
+
+
+# --- Last-known VO2max index ---
+#
+# Garmin only records a VO2max on days with a qualifying run, so finding the
+# current value used to mean probing get_max_metrics day by day for up to 30
+# days — 30 serial upstream calls per endpoint for a runner who hasn't done
+# a qualifying run lately. Instead, the last-known value + date is stored per
+# user along with the day it was checked through and the newest run seen.
+# Later lookups only probe days after that, plus the date of any new run.
+VO2MAX_LOOKBACK_DAYS = 30
+
+# Garmin activity typeKeys that count as running
+RUNNING_TYPES = {"running", "trail_running", "track_running", "treadmill_running", "virtual_run"}
+
+
+def _parse_vo2max(mm) -> Optional[float]:
+    """Extract the generic VO2max value from a get_max_metrics response."""
+    if isinstance(mm, list) and mm:
+        return mm[0].get("generic", {}).get("vo2MaxValue")
+    elif isinstance(mm, dict):
+        return mm.get("generic", {}).get("vo2MaxValue")
+    return None
+
+
+def _latest_run(activities: Optional[list]) -> Optional[dict]:
+    """Return {"id", "date"} of the newest running activity, or None."""
+    for a in activities or []:
+        type_key = (a.get("activityType", {}).get("typeKey") or "").lower()
+        start = a.get("startTimeLocal") or a.get("startTimeGMT") or ""
+        if type_key in RUNNING_TYPES and len(start) >= 10:
+            # Garmin returns activities newest first
+            return {"id": a.get("activityId"), "date": start[:10]}
+    return None
+
+
+def _lookup_vo2max(client: Garmin, user_id: Optional[str], activities: Optional[list] = None) -> dict:
+    """Return {"vo2max": value, "vo2max_date": date} via the last-known index.
+
+    The first lookup for a user does the full 30-day probe (newest first) and
+    records the result — even "not found" — so it never has to run again.
+    After that, only days after the recorded checked_through date are probed
+    (none at all if it was already checked today), unless a new run appears
+    in `activities` (Garmin's recent activity list), in which case the probe
+    goes back to that run's date since it may have produced a new value.
+
+    Returns {} if no VO2max is known. Upstream errors propagate and leave the
+    stored record untouched so the days are rechecked next time.
+    """
+    today = date.today()
+    oldest = today - timedelta(days=VO2MAX_LOOKBACK_DAYS - 1)
+    record = _get_user_data(user_id, "vo2max") if user_id else None
+    latest_run = _latest_run(activities)
+
+    if record is None:
+        probe_from = oldest
+    else:
+        probe_from = date.fromisoformat(record["checked_through"]) + timedelta(days=1)
+        if latest_run and latest_run["id"] != record.get("latest_run_id"):
+            probe_from = min(probe_from, date.fromisoformat(latest_run["date"]))
+        probe_from = max(probe_from, oldest)
+
+    value = record.get("value") if record else None
+    value_date = record.get("date") if record else None
+    qdate = today
+    while qdate >= probe_from:
+        vo2 = _parse_vo2max(client.get_max_metrics(qdate.isoformat()))
+        if vo2 is not None:
+            # Never replace a newer stored value with an older one
+            if value_date is None or qdate.isoformat() >= value_date:
+                value, value_date = vo2, qdate.isoformat()
+            break
+        qdate -= timedelta(days=1)
+
+    if user_id:
+        updated = {
+            "value": value,
+            "date": value_date,
+            "checked_through": today.isoformat(),
+            "latest_run_id": latest_run["id"] if latest_run else (record or {}).get("latest_run_id"),
+        }
+        if updated != record:
+            _set_user_data(user_id, "vo2max", updated)
+
+    if value is None:
+        return {}
+    return {"vo2max": value, "vo2max_date": value_date}
+
+
+# --- Incremental per-user activity store ---
+#
+# activities, weekly-mileage, radar, ai-radar and metrics all need the
+# user's recent activity list. Instead of each re-downloading 30–90
+# activities from Garmin, a per-user store (in the per-user data store)
+# keeps a trimmed copy of every activity seen, unique by activityId and
+# ordered newest first. Each sync only fetches activities newer than the
+# newest stored one — normally a single small page — and older history is
+# backfilled only when an endpoint asks for more than is stored.
+ACTIVITY_DELTA_PAGE = 10  # first delta page; fixed so it hits the response cache
+ACTIVITY_BACKFILL_PAGE = 50
+ACTIVITY_STORE_MAX = 1500  # cap so one Redis value stays well under the size limit
+
+# Fields kept from Garmin's activity summaries (Garmin's own key names, so
+# endpoint code reads stored activities exactly like raw API responses)
+_ACTIVITY_FIELDS = (
+    "activityId", "activityName", "startTimeLocal", "startTimeGMT",
+    "distance", "duration", "elapsedDuration", "averageSpeed", "averageHR",
+    "maxHR", "calories", "elevationGain", "aerobicTrainingEffect",
+    "averageRunningCadenceInStepsPerMinute",
+)
+
+
+def _slim_activity(a: dict) -> dict:
+    """Trim a Garmin activity summary down to the fields endpoints use."""
+    slim = {k: a.get(k) for k in _ACTIVITY_FIELDS if a.get(k) is not None}
+    slim["activityType"] = {"typeKey": (a.get("activityType") or {}).get("typeKey", "unknown")}
+    return slim
+
+
+def _activity_start(a: dict) -> str:
+    return a.get("startTimeLocal") or a.get("startTimeGMT") or ""
+
+
+def _activity_sort_key(a: dict) -> tuple:
+    """(start time, activityId) — total order used for the store and cursors."""
+    return (_activity_start(a), a.get("activityId") or 0)
+
+
+def _week_of(a: dict) -> Optional[str]:
+    """ISO date of the Monday of the week an activity started in."""
+    try:
+        day = date.fromisoformat(_activity_start(a)[:10])
+    except ValueError:
+        return None
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def _rollup_weeks(activities: list, weeks: Optional[set] = None) -> dict:
+    """Sum running distance, count, duration and elevation per week.
+
+    Only the weeks in `weeks` are computed (all weeks if None). Returns
+    {monday: {"mileage_km", "run_count", "duration_min", "elevation_m"}};
+    weeks without runs are left out.
+    """
+    rollups = {}
+    for a in activities:
+        if (a.get("activityType", {}).get("typeKey") or "").lower() not in RUNNING_TYPES:
+            continue
+        week = _week_of(a)
+        if week is None or (weeks is not None and week not in weeks):
+            continue
+        bucket = rollups.setdefault(week, {
+            "mileage_km": 0.0, "run_count": 0, "duration_min": 0.0, "elevation_m": 0.0,
+        })
+        bucket["mileage_km"] += (a.get("distance") or 0) / 1000
+        bucket["run_count"] += 1
+        bucket["duration_min"] += (a.get("duration") or 0) / 60
+        bucket["elevation_m"] += a.get("elevationGain") or 0
+    for bucket in rollups.values():
+        for k in ("mileage_km", "duration_min", "elevation_m"):
+            bucket[k] = round(bucket[k], 2)
+    return rollups
+
+
+def _sync_activities(
+    client: Garmin, min_count: int = 0, since: Optional[date] = None, delta: bool = True,
+) -> list:
+    """Return the user's stored activities (newest first) after a delta sync.
+
+    See _sync_activity_store — this returns just its activity list.
+    """
+    return _sync_activity_store(client, min_count, since, delta)["activities"]
+
+
+def _fetch_activities_page(client: Garmin, start: int, limit: int = ACTIVITY_BACKFILL_PAGE) -> list:
+    """One page of activities straight from Garmin, slimmed like stored ones.
+
+    For history older than the activity store holds (it keeps at most
+    ACTIVITY_STORE_MAX): start is the offset from the account's newest
+    activity. Nothing is stored — the response cache still dedupes repeats.
+    """
+    return [_slim_activity(a) for a in client.get_activities(start, limit) or []]
+
+
+def _sync_activity_store(
+    client: Garmin, min_count: int = 0, since: Optional[date] = None, delta: bool = True,
+) -> dict:
+    """Delta-sync the user's activity store and return it.
+
+    Fetches only activities newer than the newest stored one, then backfills
+    older history if the store holds fewer than min_count activities or
+    doesn't reach back to `since`. The stored list is always a contiguous
+    run of the account's history starting at the newest activity; the store
+    also records from which date it is known to be complete (covered_since)
+    and whether the entire history has been fetched (complete), so each
+    backfill happens at most once per range. Once the store is full
+    (ACTIVITY_STORE_MAX) nothing older than its oldest day is backfilled.
+
+    The store also holds materialized weekly rollups ("weekly", see
+    _rollup_weeks). They are maintained incrementally: only the weeks that
+    received new activities in this sync are recomputed — normally just the
+    current week, and nothing at all when no new activity arrived.
+
+    delta=False skips the newest-activity check — for callers that only
+    need older history (e.g. "load more" pages behind a cursor). While the
+    Garmin throttle refuses calls (_GarminBackoff) the delta is skipped and
+    the stored activities are served as they are.
+
+    client must come from _get_garmin_client (uses its user_id). Without a
+    user id the activities are fetched directly and nothing is stored.
+    """
+    user_id = getattr(client, "user_id", None)
+    if not user_id:
+        if since:
+            acts = client.get_activities_by_date(since.isoformat(), date.today().isoformat())
+        else:
+            acts = client.get_activities(0, max(min_count, ACTIVITY_DELTA_PAGE))
+        acts = sorted((_slim_activity(a) for a in acts or []), key=_activity_sort_key, reverse=True)
+        return {"activities": acts, "weekly": _rollup_weeks(acts),
+                "covered_since": since.isoformat() if since else None, "complete": False}
+
+    store = _get_user_data(user_id, "activities") or {
+        "activities": [], "covered_since": None, "complete": False,
+    }
+    # A full store can't hold anything older — backfilling past it would
+    # only be truncated again, so clamp the targets to what it keeps
+    min_count = min(min_count, ACTIVITY_STORE_MAX)
+    if since and store["covered_since"] and len(store["activities"]) >= ACTIVITY_STORE_MAX:
+        since = max(since, date.fromisoformat(store["covered_since"]))
+    first_sync = not store["activities"]
+    by_id = {a["activityId"]: a for a in store["activities"]}
+    added = []
+
+    def add(a: dict):
+        if a.get("activityId") is not None and a["activityId"] not in by_id:
+            by_id[a["activityId"]] = _slim_activity(a)
+            added.append(by_id[a["activityId"]])
+            return True
+        return False
+
+    # Delta — page from the newest activity until we reach one already stored
+    start, limit = 0, ACTIVITY_DELTA_PAGE
+    while delta or first_sync:
+        try:
+            page = client.get_activities(start, limit) or []
+        except _GarminBackoff:
+            # Garmin is rate limiting us — serve what's stored rather than
+            # fail (any partial delta still saves; the next sync resumes)
+            if first_sync:
+                raise
+            break
+        new_count = sum(add(a) for a in page)
+        if len(page) < limit:
+            # Paged contiguously from the newest to the very first activity
+            store["complete"] = True
+            break
+        if new_count < len(page) or (first_sync and len(by_id) >= min_count):
+            break
+        start += limit
+        limit = ACTIVITY_BACKFILL_PAGE
+
+    # Backfill by count — older pages by offset past what's stored (valid
+    # because the stored list is contiguous from the newest activity)
+    while len(by_id) < min_count and not store["complete"]:
+        page = client.get_activities(len(by_id), ACTIVITY_BACKFILL_PAGE) or []
+        for a in page:
+            add(a)
+        if len(page) < ACTIVITY_BACKFILL_PAGE:
+            store["complete"] = True
+
+    acts = sorted(by_id.values(), key=_activity_sort_key, reverse=True)
+
+    # Whole days covered by the stored list — the oldest stored day may be
+    # partial, so coverage starts the day after it
+    if acts:
+        oldest = date.fromisoformat(_activity_start(acts[-1])[:10]) + timedelta(days=1)
+        covered = store["covered_since"]
+        store["covered_since"] = min(covered, oldest.isoformat()) if covered else oldest.isoformat()
+
+    # Backfill by date — everything between `since` and the stored range
+    covered = store["covered_since"]
+    backfilled_range = False
+    if since and not store["complete"] and (covered is None or since.isoformat() < covered):
+        end = covered or date.today().isoformat()
+        for a in client.get_activities_by_date(since.isoformat(), end) or []:
+            add(a)
+        store["covered_since"] = since.isoformat()
+        acts = sorted(by_id.values(), key=_activity_sort_key, reverse=True)
+        backfilled_range = True
+
+    # Weekly rollups — recompute only the weeks that gained activities (all
+    # weeks if the store predates rollups)
+    changed = first_sync or bool(added) or backfilled_range
+    if "weekly" not in store:
+        store["weekly"] = _rollup_weeks(acts)
+        changed = True
+    elif added:
+        touched = {w for w in map(_week_of, added) if w}
+        store["weekly"].update(_rollup_weeks(acts, touched))
+
+    if len(acts) > ACTIVITY_STORE_MAX:
+        # Rollups for weeks that fall off the end stay — they were complete
+        acts = acts[:ACTIVITY_STORE_MAX]
+        store["complete"] = False
+        # The oldest day kept — its weekly rollup was computed in full above
+        store["covered_since"] = _activity_start(acts[-1])[:10]
+
+    if changed:
+        store["activities"] = acts
+        store["synced_at"] = datetime.now().isoformat()
+        _set_user_data(user_id, "activities", store)
+    return store
+
+
+# --- Incremental per-user daily wellness store ---
+#
+# The radar history (/api/radar?weeks=N) needs HRV, VO2max and training
+# readiness for every week, not just today. The store keeps them as dense
+# per-day arrays starting at "start" (None where there's no data), so a
+# history is a slice of the arrays instead of a call per day. HRV and
+# VO2max come from Garmin's range endpoints, one call per
+# WELLNESS_RANGE_DAYS chunk. Each sync re-fetches only from the day before
+# the last synced day up to today. Training readiness has no range
+# endpoint, so it is fetched only for the days callers ask for (one per
+# week for the radar history). Past days are fetched once and never
+# again; today is re-fetched through the response cache.
+WELLNESS_RANGE_DAYS = 28  # days per range request
+WELLNESS_MAX_DAYS = 400  # cap so one Redis value stays small
+
+_WELLNESS_SERIES = ("hrv_weekly_avg", "hrv_status", "vo2max", "readiness", "readiness_level", "readiness_checked")
+
+
+def _parse_hrv_range(data) -> Dict[str, dict]:
+    """{day: hrv summary} from a get_hrv_data_range response."""
+    summaries = data.get("hrvSummaries") if isinstance(data, dict) else data
+    return {
+        s["calendarDate"]: s for s in summaries or []
+        if isinstance(s, dict) and s.get("calendarDate")
+    }
+
+
+def _parse_vo2max_range(data) -> Dict[str, float]:
+    """{day: VO2max} from a get_max_metrics_range response."""
+    days = {}
+    for m in data if isinstance(data, list) else [data] if isinstance(data, dict) else []:
+        generic = m.get("generic") or {}
+        day = generic.get("calendarDate") or m.get("calendarDate")
+        if day and generic.get("vo2MaxValue") is not None:
+            days[day] = generic["vo2MaxValue"]
+    return days
+
+
+def _sync_wellness_store(client: Garmin, since: date, readiness_days: tuple = ()) -> dict:
+    """Sync the user's daily wellness arrays back to `since` and return them.
+
+    HRV (weekly average and status) and VO2max are fetched for days after
+    the last sync (the last synced day is refetched because it may have been
+    partial) and for days before the stored range. Training readiness
+    (score and level) is fetched for each day in readiness_days that hasn't
+    been checked yet. Today is always checked again.
+
+    While the Garmin throttle refuses calls (_GarminBackoff), the fetching
+    stops and the arrays are returned as they are. Each chunk that already
+    arrived is saved. The returned dict has "start" (ISO date of index 0)
+    and one list per series, running to today.
+
+    client must come from _get_garmin_client (uses its user_id). Without a
+    user id nothing is stored.
+    """
+    user_id = getattr(client, "user_id", None)
+    today = date.today()
+    since = max(since, today - timedelta(days=WELLNESS_MAX_DAYS - 1))
+    store = (_get_user_data(user_id, "wellness") if user_id else None) or {
+        "start": today.isoformat(), "synced_from": None, "synced_through": None,
+        **{k: [None] for k in _WELLNESS_SERIES},
+    }
+    loaded = json.dumps(store, sort_keys=True)
+
+    # Re-base the arrays: back to `since`, forward to today, and no longer
+    # than WELLNESS_MAX_DAYS
+    start = date.fromisoformat(store["start"])
+    if since < start:
+        pad = (start - since).days
+        for k in _WELLNESS_SERIES:
+            store[k] = [None] * pad + store[k]
+        start = since
+    length = (today - start).days + 1
+    drop = max(0, length - WELLNESS_MAX_DAYS)
+    for k in _WELLNESS_SERIES:
+        store[k] = (store[k] + [None] * length)[drop:length]
+    start += timedelta(days=drop)
+    length -= drop
+    store["start"] = start.isoformat()
+    if store["synced_through"] and store["synced_through"] < store["start"]:
+        # Everything synced fell off the front — start over
+        store["synced_from"] = store["synced_through"] = None
+    elif store["synced_from"] and store["synced_from"] < store["start"]:
+        store["synced_from"] = store["start"]
+
+    def index(day: str) -> Optional[int]:
+        i = (date.fromisoformat(day) - start).days
+        return i if 0 <= i < length else None
+
+    # Days still to fetch, as chunks in an order that keeps the synced days
+    # contiguous if the sync stops early: forward from the last synced day,
+    # then backward from the first one (the first sync is all backward, so
+    # recent weeks come first)
+    def chunks(first: date, last: date, backward: bool):
+        size = timedelta(days=WELLNESS_RANGE_DAYS - 1)
+        while first <= last:
+            if backward:
+                yield max(first, last - size), last
+                last = max(first, last - size) - timedelta(days=1)
+            else:
+                yield first, min(last, first + size)
+                first = min(last, first + size) + timedelta(days=1)
+
+    synced_through = store["synced_through"]
+    if synced_through is None:
+        spans = list(chunks(start, today, backward=True))
+    else:
+        resume = max(start, date.fromisoformat(synced_through) - timedelta(days=1))
+        spans = list(chunks(resume, today, backward=False))
+        spans += chunks(start, date.fromisoformat(store["synced_from"]) - timedelta(days=1), backward=True)
+
+    try:
+        for chunk_start, chunk_end in spans:
+            span = (chunk_start.isoformat(), chunk_end.isoformat())
+            hrv = _parse_hrv_range(client.get_hrv_data_range(*span))
+            vo2 = _parse_vo2max_range(client.get_max_metrics_range(*span))
+            day = chunk_start
+            while day <= chunk_end:
+                i, key = index(day.isoformat()), day.isoformat()
+                summary = hrv.get(key)
+                store["hrv_weekly_avg"][i] = summary.get("weeklyAvg") if summary else None
+                store["hrv_status"][i] = (summary.get("status") or "").upper() if summary else None
+                store["vo2max"][i] = vo2.get(key)
+                day += timedelta(days=1)
+            # Record progress per chunk so a backoff mid-way resumes here
+            store["synced_from"] = min(store["synced_from"] or span[0], span[0])
+            store["synced_through"] = max(store["synced_through"] or span[1], span[1])
+
+        # Newest first, so a backoff leaves the recent weeks filled in
+        for day in sorted(set(readiness_days), reverse=True):
+            i = index(day)
+            if i is None or (store["readiness_checked"][i] and day != today.isoformat()):
+                continue
+            tr = client.get_training_readiness(day)
+            present = isinstance(tr, list) and bool(tr)
+            # Same reading as the radar snapshot: a missing score counts as 0
+            store["readiness"][i] = tr[0].get("score", 0) if present else None
+            store["readiness_level"][i] = (tr[0].get("level") or "").upper() if present else None
+            store["readiness_checked"][i] = 1
+    except _GarminBackoff:
+        pass
+
+    if user_id and json.dumps(store, sort_keys=True) != loaded:
+        _set_user_data(user_id, "wellness", store)
+    return store
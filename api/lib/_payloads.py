@@ -0,0 +1,492 @@
+"""Payload builders shared by the dashboard data endpoints.
+
+Each function builds the JSON body of one of the standalone endpoints
+(metrics, activities, weekly-mileage) from an authenticated Garmin client or
+from an already-synced activity list. The standalone endpoints are thin
+wrappers around these, and /api/dashboard calls all three from one client
+and one activity sync — so the response shapes can never drift apart.
+"""
+
+import math
+import json
+import base64
+from datetime import datetime, date, timedelta
+from typing import Callable, Optional
+
+from lib._shared import _run_blocking, _run_concurrently, _user_id
+from lib._garmin import (
+    Garmin, RUNNING_TYPES, VO2MAX_LOOKBACK_DAYS, _activity_sort_key, _activity_start,
+    _lookup_vo2max, _sync_activities,
+)
+
+
+# --- /api/metrics ---
+
+# The per-day Garmin methods behind the metric groups below
+DAILY_METRIC_METHODS = (
+    "get_fitnessage_data", "get_training_readiness", "get_hrv_data", "get_body_battery",
+    "get_sleep_data", "get_all_day_stress", "get_user_summary",
+)
+
+def _fetch_fitness_age(client, dates: list) -> dict:
+    """Fitness Age — floored to nearest 0.5."""
+    for qdate in dates:
+        age_data = client.get_fitnessage_data(qdate)
+        if isinstance(age_data, dict):
+            fitness_age = age_data.get("fitnessAge")
+            if fitness_age is not None:
+                return {"fitness_age": math.floor(fitness_age * 2) / 2}
+    return {}
+
+
+def _fetch_training_readiness(client, dates: list) -> dict:
+    """Training readiness."""
+    for qdate in dates:
+        tr = client.get_training_readiness(qdate)
+        if isinstance(tr, list) and tr:
+            score = tr[0].get("score")
+            if score is not None:
+                recovery_sec = tr[0].get("recoveryTime", 0)
+                return {
+                    "training_readiness_score": score,
+                    "training_readiness_level": tr[0].get("level"),
+                    "recovery_time_hrs": round(recovery_sec / 3600, 1) if recovery_sec else None,
+                }
+    return {}
+
+
+def _fetch_hrv(client, dates: list) -> dict:
+    """HRV."""
+    for qdate in dates:
+        hrv = client.get_hrv_data(qdate)
+        if isinstance(hrv, dict) and "hrvSummary" in hrv:
+            s = hrv["hrvSummary"]
+            avg = s.get("lastNightAvg") or s.get("weeklyAvg")
+            if avg is not None:
+                return {
+                    "hrv_last_night_avg": s.get("lastNightAvg"),
+                    "hrv_weekly_avg": s.get("weeklyAvg"),
+                    "hrv_status": s.get("status"),
+                }
+    return {}
+
+
+def _fetch_body_battery(client, dates: list) -> dict:
+    """Body Battery — latest non-null reading of the day."""
+    for qdate in dates:
+        bb = client.get_body_battery(qdate)
+        if isinstance(bb, list) and bb:
+            values = bb[0].get("bodyBatteryValuesArray", [])
+            for pair in reversed(values):
+                if len(pair) >= 2 and pair[1] is not None:
+                    return {"body_battery": pair[1]}
+    return {}
+
+
+def _fetch_sleep_score(client, dates: list) -> dict:
+    """Sleep Score."""
+    for qdate in dates:
+        sleep = client.get_sleep_data(qdate)
+        if isinstance(sleep, dict):
+            overall = sleep.get("sleepScores", {}).get("overall")
+            if isinstance(overall, dict):
+                score = overall.get("value")
+            elif isinstance(overall, (int, float)):
+                score = overall
+            else:
+                dto = sleep.get("dailySleepDTO", {})
+                overall = dto.get("sleepScores", {}).get("overall", {})
+                score = overall.get("value") if isinstance(overall, dict) else overall
+            if score is not None:
+                return {"sleep_score": score}
+    return {}
+
+
+def _fetch_stress_level(client, dates: list) -> dict:
+    """Stress Level."""
+    for qdate in dates:
+        stress = client.get_all_day_stress(qdate)
+        if isinstance(stress, dict):
+            avg = stress.get("avgStressLevel")
+            if avg is not None and avg > 0:
+                return {"stress_level": avg}
+    return {}
+
+
+def _fetch_resting_hr(client, dates: list) -> dict:
+    """Resting HR — fallback to yesterday if today's data isn't available yet
+    (common early in the morning before the watch syncs)."""
+    for qdate in dates:
+        summary = client.get_user_summary(qdate)
+        rhr = summary.get("restingHeartRate")
+        if rhr is not None:
+            return {"resting_hr": rhr}
+    return {}
+
+
+def _weekly_stats(activities: list) -> dict:
+    """Weekly stats from the last 30 activities."""
+    now = datetime.now()
+    week_ago = now.timestamp() - 7 * 86400
+    weekly_acts = []
+    for a in activities:
+        start_str = a.get("startTimeLocal") or a.get("startTimeGMT") or ""
+        try:
+            act_dt = datetime.strptime(start_str[:19], "%Y-%m-%d %H:%M:%S")
+            if act_dt.timestamp() > week_ago:
+                weekly_acts.append(a)
+        except (ValueError, IndexError):
+            continue
+    return {
+        "total_activities": len(activities),
+        "weekly_runs": len(weekly_acts),
+        "weekly_distance": round(sum(a.get("distance", 0) for a in weekly_acts) / 1000, 1),
+        "weekly_duration": round(sum(a.get("duration", 0) for a in weekly_acts) / 3600, 1),
+    }
+
+
+async def build_metrics(client: Garmin, sess: dict, fetch_activities: Optional[Callable[[], list]] = None) -> dict:
+    """Fetch aggregated performance metrics — Bodily patterns for Garmin data.
+
+    Each metric group (fitness age, readiness, HRV, body battery, sleep,
+    stress, resting HR, recent activities) is independent, so the groups
+    are fetched concurrently on the shared thread pool with a per-group
+    timeout. A group that fails or times out simply leaves its fields at
+    their defaults, exactly as the old sequential try/except blocks did.
+
+    fetch_activities overrides how the recent activity list is obtained
+    (default: the last 30 from the activity store) so /api/dashboard can
+    run one larger sync and reuse it for the other payloads.
+    """
+    if fetch_activities is None:
+        fetch_activities = lambda: _sync_activities(client, min_count=30)
+    today = date.today().isoformat()
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    dates = [today, yesterday]
+
+    metrics = {
+        "vo2max": None, "vo2max_date": None, "fitness_age": None,
+        "training_readiness_score": None, "training_readiness_level": None,
+        "recovery_time_hrs": None, "hrv_status": None, "hrv_last_night_avg": None,
+        "hrv_weekly_avg": None, "resting_hr": None, "body_battery": None,
+        "sleep_score": None, "stress_level": None,
+        "weekly_distance": 0, "weekly_duration": 0, "weekly_runs": 0,
+        "total_activities": 0, "device_name": "",
+        # Date of the most recent data across all metrics — used by the
+        # frontend to show "Last updated: XX date" when data is from a
+        # previous day rather than today
+        "metrics_date": None,
+    }
+
+    # Every group starts with today's (then yesterday's) cached response —
+    # read them all in one round trip rather than one GET per call
+    await _run_blocking(client.prefetch, [
+        (method, (qdate,)) for method in DAILY_METRIC_METHODS for qdate in dates
+    ])
+    groups = await _run_concurrently({
+        "fitness_age": lambda: _fetch_fitness_age(client, dates),
+        "training_readiness": lambda: _fetch_training_readiness(client, dates),
+        "hrv": lambda: _fetch_hrv(client, dates),
+        "body_battery": lambda: _fetch_body_battery(client, dates),
+        "sleep_score": lambda: _fetch_sleep_score(client, dates),
+        "stress_level": lambda: _fetch_stress_level(client, dates),
+        "resting_hr": lambda: _fetch_resting_hr(client, dates),
+        "activities": lambda: {"activities": fetch_activities()},
+    })
+    activities = groups.pop("activities").get("activities")
+    for result in groups.values():
+        metrics.update(result)
+    if activities is not None:
+        # Weekly stats and total_activities cover the last 30 activities
+        activities = activities[:30]
+        metrics.update(_weekly_stats(activities))
+
+    # VO2max — resolved from the per-user last-known index after the fan-out
+    # because a new run in the activity list is what triggers a recheck.
+    # Usually this costs zero upstream calls.
+    vo2 = await _run_concurrently({
+        "vo2max": lambda: _lookup_vo2max(client, _user_id(sess), activities),
+    })
+    metrics.update(vo2["vo2max"])
+
+    # Device name from session
+    metrics["device_name"] = sess.get("device_name", "")
+
+    # Determine metrics_date — the most recent date that data was
+    # successfully fetched from. Most metrics try today then yesterday,
+    # so we check which date produced data. VO2max already has its own
+    # date field (vo2max_date) since it can be up to 30 days old.
+    # We use the most recent date across all metrics that found data.
+    if metrics["vo2max_date"]:
+        metrics["metrics_date"] = metrics["vo2max_date"]
+    # For all other metrics, they were fetched from today or yesterday.
+    # If any metric has a value, we know at least one date worked.
+    # Check if today's data was available (any non-VO2max metric has a value)
+    has_any_metric = any([
+        metrics["fitness_age"], metrics["training_readiness_score"],
+        metrics["hrv_last_night_avg"], metrics["body_battery"],
+        metrics["sleep_score"], metrics["stress_level"],
+        metrics["resting_hr"],
+    ])
+    if has_any_metric:
+        # We can't know for certain which date each metric came from
+        # without tracking per-metric, but since they all try today first,
+        # if any succeeded from today, metrics_date is today.
+        # If they all fell back to yesterday, metrics_date is yesterday.
+        # Simplest approach: use today if any metric has data, since the
+        # fallback loop tries today first and breaks on success.
+        metrics["metrics_date"] = today
+    elif metrics["metrics_date"] is None:
+        # No metrics found at all — leave as None
+        pass
+
+    # Record the server timestamp when the data was fetched — tells the
+    # frontend how fresh the data is. Combined with metrics_date, the UI
+    # can show "Last updated: today, 3:45 PM" or "Last updated: Aug 15, 9:30 AM"
+    metrics["fetched_at"] = datetime.now().isoformat()
+
+    return metrics
+
+
+# --- /api/activities ---
+
+def encode_cursor(position: tuple, offset: Optional[int] = None) -> str:
+    """Opaque "load more" cursor pointing just past the given sort key.
+
+    offset, when known, is how many activities (of any type) in the
+    account's history precede the next one — where a page past the end of
+    the activity store starts paging Garmin.
+    """
+    parts = list(position) + ([offset] if offset is not None else [])
+    raw = json.dumps(parts, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor to ((start time, activityId) sort key, offset or None).
+
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        start, activity_id, *rest = json.loads(raw)
+        offset = int(rest[0]) if rest else None
+        if len(rest) > 1 or (offset is not None and offset < 0):
+            raise ValueError(cursor)
+        return (str(start), int(activity_id)), offset
+    except Exception as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def build_activities(
+    activities: list, limit: int, after: Optional[tuple] = None, skip: int = 0,
+    first_offset: int = 0, more: bool = False,
+) -> dict:
+    """Return one page of running activities plus the cursor for the next.
+
+    activities must be newest first and contiguous in the account's history,
+    activities[0] being preceded by first_offset others (0 for the activity
+    store, which starts at the newest activity). Only running activities
+    strictly older than the `after` sort key are considered; `skip` drops
+    that many running activities first (legacy offset paging, which counts
+    running activities like the frontend does).
+
+    next_cursor is None when the page came back short and nothing older
+    exists. With more=True — older history exists but wasn't fetched (the
+    store is capped, or the request's backfill budget ran out) — a short
+    page still gets a cursor, just past the oldest activity scanned, so
+    "load more" carries on from there instead of dead-ending.
+    """
+    runs = []
+    for i, a in enumerate(activities):
+        # Filter to running activities only — exclude hiking, cycling, walking, etc.
+        type_key = a.get("activityType", {}).get("typeKey", "unknown")
+        if type_key.lower() not in RUNNING_TYPES:
+            continue
+        if after is not None and _activity_sort_key(a) >= after:
+            continue
+        runs.append((i, a))
+    page = runs[skip:skip + limit]
+
+    slim = []
+    for _, a in page:
+        type_key = a.get("activityType", {}).get("typeKey", "unknown")
+        slim.append({
+            "id": a.get("activityId"),
+            "name": a.get("activityName", "Unnamed"),
+            "type": type_key,
+            "start_time": a.get("startTimeLocal"),
+            "distance": round(a.get("distance", 0) / 1000, 2),
+            "duration": round(a.get("duration", 0) / 60, 1),
+            "avg_pace": a.get("averageSpeed", 0),
+            "avg_hr": a.get("averageHR"),
+            "max_hr": a.get("maxHR"),
+            "calories": a.get("calories"),
+            "elevation_gain": round(a.get("elevationGain", 0), 1),
+            "training_effect": a.get("aerobicTrainingEffect"),
+            "avg_cadence": a.get("averageRunningCadenceInStepsPerMinute"),
+            "elapsed_duration": round(a.get("elapsedDuration", 0) / 60, 1) if a.get("elapsedDuration") else None,
+        })
+    next_cursor = None
+    if page and len(page) == limit:
+        i, last = page[-1]
+        next_cursor = encode_cursor(_activity_sort_key(last), first_offset + i + 1)
+    elif more and activities:
+        # Everything scanned may still be newer than the cursor — never move it back
+        position = _activity_sort_key(activities[-1])
+        if after is not None:
+            position = min(position, after)
+        next_cursor = encode_cursor(position, first_offset + len(activities))
+    return {"activities": slim, "next_cursor": next_cursor}
+
+
+# --- /api/weekly-mileage ---
+
+# Longest window one request may ask for — each longer window backfills
+# the activity store further back (up to ACTIVITY_STORE_MAX activities)
+WEEKLY_MILEAGE_MAX_WEEKS = 104
+
+def weekly_start_date(weeks: int, today: Optional[date] = None) -> date:
+    """Monday of the oldest week in an N-week window ending this week."""
+    today = today or date.today()
+    return today - timedelta(days=today.weekday() + (weeks - 1) * 7)
+
+
+def build_weekly_mileage(weekly: dict, weeks: int) -> list:
+    """List the last N weeks from the materialized weekly rollups.
+
+    weekly is the activity store's {monday: rollup} dict (see
+    _sync_activity_store), so this is O(weeks) — no activities are
+    re-bucketed. Weeks without runs come back as zeros.
+    """
+    start_date = weekly_start_date(weeks)
+    result = []
+    for i in range(weeks):
+        week_start = (start_date + timedelta(days=i * 7)).isoformat()
+        bucket = weekly.get(week_start, {})
+        result.append({
+            "week_start": week_start,
+            "mileage_km": round(bucket.get("mileage_km", 0.0), 1),
+            "run_count": bucket.get("run_count", 0),
+            "duration_min": round(bucket.get("duration_min", 0.0), 1),
+            "elevation_m": round(bucket.get("elevation_m", 0.0), 1),
+        })
+    return result
+
+
+# --- /api/radar?weeks=N ---
+
+RADAR_HISTORY_MAX_WEEKS = 26
+RADAR_NO_DATA = 30  # score for a dimension without data, as in the snapshot
+
+
+def radar_history_days(weeks: int, today: Optional[date] = None) -> tuple:
+    """(first day of data the history needs, closing day of every week).
+
+    A week closes on its Sunday, or today for the current week. Mileage
+    looks 7 days back from the closing day and VO2max VO2MAX_LOOKBACK_DAYS,
+    so the data starts that far before the oldest Monday.
+    """
+    today = today or date.today()
+    first_monday = weekly_start_date(weeks, today)
+    closing = [
+        min(first_monday + timedelta(days=7 * i + 6), today).isoformat() for i in range(weeks)
+    ]
+    return first_monday - timedelta(days=VO2MAX_LOOKBACK_DAYS - 1), closing
+
+
+def build_radar_history(activities: list, wellness: dict, weeks: int, today: Optional[date] = None) -> list:
+    """Radar scores for each of the last N weeks, in one vectorized pass.
+
+    activities is the activity store's list (back to the history's first
+    day, see radar_history_days) and wellness the daily wellness store
+    (see _sync_wellness_store). Activities are binned into per-day distance
+    and count arrays. Each week is then scored at its closing day with the
+    same rules as the /api/radar snapshot:
+    - mileage and activity count over the last 7 days drive aerobic
+      endurance and strength/durability;
+    - the latest HRV reading in those 7 days drives lactate threshold;
+    - the latest training readiness in those 7 days drives fatigue
+      resistance and running economy;
+    - the latest VO2max in the last VO2MAX_LOOKBACK_DAYS drives VO2max
+      speed.
+    A dimension without data scores RADAR_NO_DATA.
+    """
+    import numpy as np
+
+    today = today or date.today()
+    origin, closing = radar_history_days(weeks, today)
+    days = (today - origin).days + 1
+    ends = np.array([(date.fromisoformat(d) - origin).days for d in closing])
+
+    def day_of(a: dict) -> int:
+        try:
+            return date.fromisoformat(_activity_start(a)[:10]).toordinal()
+        except ValueError:
+            return -1
+
+    # Per-day distance (km) and activity count, as offsets from origin
+    offsets = np.array([day_of(a) for a in activities], dtype=np.int64) - origin.toordinal()
+    valid = (offsets >= 0) & (offsets < days)
+    distance = np.array([a.get("distance") or 0 for a in activities], dtype=float) / 1000
+    daily_km = np.bincount(offsets[valid], weights=distance[valid], minlength=days)
+    daily_count = np.bincount(offsets[valid], minlength=days)
+
+    def last_7_days(daily):
+        total = np.concatenate(([0], np.cumsum(daily)))
+        return total[ends + 1] - total[np.maximum(ends - 6, 0)]
+
+    # Wellness arrays re-aligned to origin (None -> NaN for numbers)
+    shift = (origin - date.fromisoformat(wellness["start"])).days
+
+    def aligned(name: str, dtype):
+        values = np.array(wellness.get(name) or [], dtype=dtype)
+        values = values[shift:] if shift >= 0 else np.concatenate((np.full(-shift, None, dtype), values))
+        return np.concatenate((values, np.full(max(0, days - len(values)), None, dtype)))[:days]
+
+    def latest(known, window: int):
+        """Index of the newest known day within `window` days of each closing day (-1 if none)."""
+        last = np.maximum.accumulate(np.where(known, np.arange(days), -1))[ends]
+        return np.where(last > ends - window, last, -1)
+
+    def pick(values, at):
+        """values at each index in `at`, NaN (or None) where it is -1."""
+        return np.where(at >= 0, values[np.maximum(at, 0)], np.nan if values.dtype == float else None)
+
+    km, count = last_7_days(daily_km), last_7_days(daily_count)
+
+    hrv_status = aligned("hrv_status", object)
+    hrv_at = latest(np.not_equal(hrv_status, None), 7)
+    hrv_avg, status = pick(aligned("hrv_weekly_avg", float), hrv_at), pick(hrv_status, hrv_at)
+
+    readiness = aligned("readiness", float)
+    ready_at = latest(~np.isnan(readiness), 7)
+    score, level = pick(readiness, ready_at), pick(aligned("readiness_level", object), ready_at)
+
+    vo2max = aligned("vo2max", float)
+    vo2 = pick(vo2max, latest(~np.isnan(vo2max), VO2MAX_LOOKBACK_DAYS))
+
+    scores = {
+        "lactate_threshold": np.select(
+            [(status == "BALANCED") & ~np.isnan(hrv_avg), (status == "UNBALANCED") & ~np.isnan(hrv_avg)],
+            [np.clip(np.trunc(hrv_avg * 2.5), 20, 100), np.clip(np.trunc(hrv_avg * 2), 15, 70)],
+            RADAR_NO_DATA,
+        ),
+        "aerobic_endurance": np.clip(np.trunc(km * 1.3), 5, 100),
+        "running_economy": np.where(
+            np.isnan(score), RADAR_NO_DATA,
+            np.select([level == "HIGH", level == "MODERATE"], [75, 55], 35),
+        ),
+        "strength_durability": np.select([(count >= 5) & (km > 30), count >= 3], [70, 50], 25),
+        "vo2max_speed": np.where(np.isnan(vo2), RADAR_NO_DATA, np.clip(np.trunc((vo2 - 28) * 2.2), 10, 100)),
+        "fatigue_resistance": np.where(np.isnan(score), RADAR_NO_DATA, np.clip(score, 10, 100)),
+    }
+    first_monday = weekly_start_date(weeks, today)
+    return [
+        {
+            "week_start": (first_monday + timedelta(days=7 * i)).isoformat(),
+            "as_of": closing[i],
+            "radar": {dim: int(values[i]) for dim, values in scores.items()},
+        }
+        for i in range(weeks)
+    ]
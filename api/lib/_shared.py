@@ -2,37 +2,55 @@
 
 This file lives in api/lib/ so Vercel doesn't treat it as a serverless
 function (only .py files directly in api/ become functions). It contains
-the session store (backed by Upstash Redis), Garmin client helpers, and
-Pydantic models used across all race-goal endpoint files.
+the session store (backed by Upstash Redis), the app factory, caches,
+fan-out and OpenAI helpers, and Pydantic models used across all race-goal
+endpoint files. Everything that needs garminconnect lives in lib._garmin.
 
 Session storage architecture:
   In Vercel's file-based serverless mode, each api/*.py file is a separate
   function with its own isolated memory and /tmp directory. To share session
   state across functions, we use Upstash Redis as an external store. Only
-  serializable data (credentials, race goal, profile info) is stored — the
-  live Garmin client object is re-created from credentials on each request
-  that needs it (see _get_garmin_client).
+  serializable data (credentials, Garmin OAuth tokens, race goal, profile
+  info) is stored — the live Garmin client object is resumed from the stored
+  tokens on each request that needs it (see lib._garmin._get_garmin_client).
 
   For local development without Redis configured, an in-memory dict fallback
   is used automatically when UPSTASH env vars are not present.
 """
 
 import os
+import sys
+import hmac
 import json
+import time
 import uuid
-from datetime import datetime, date, timedelta
-from typing import Dict, Optional
+import hashlib
+import asyncio
+import functools
+import threading
+import types
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+from urllib.parse import parse_qs
 from pydantic import BaseModel
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse as _JSONResponse
 from dotenv import load_dotenv
-from garminconnect import (
-    Garmin,
-    GarminConnectConnectionError,
-    GarminConnectAuthenticationError,
-    GarminConnectTooManyRequestsError,
-)
+
+# garminconnect (and the requests/garth stack under it) is only imported by
+# lib._garmin, so functions that never talk to Garmin don't pay for it on a
+# cold start. It's needed here for type hints only.
+if TYPE_CHECKING:
+    from garminconnect import Garmin
+
+# Load environment variables (from .env locally, from Vercel dashboard in
+# production) before any module-level setting below reads them
+load_dotenv()
 
 
 class _StripPrefixMiddleware:
@@ -67,20 +85,711 @@ class _StripPrefixMiddleware:
         await self.app(scope, receive, send)
 
 
-def create_app(function_name: str) -> FastAPI:
+class _BodyLimitMiddleware:
+    """ASGI middleware that refuses request bodies over max_bytes with a 413.
+
+    Starlette spools a multipart body to a temp file before the endpoint
+    runs, so a per-file check in the endpoint only fires after the whole
+    upload has been received. This sits in front of the parser instead: a
+    declared Content-Length past the cap is refused without reading the
+    body, and a chunked (or understated) body is cut off as soon as the
+    running total passes the cap — the app sees a disconnect, and whatever
+    error it answers with is replaced by the 413.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, scope, receive, send):
+        limit_mb = self.max_bytes / (1024 * 1024)
+        response = JSONResponse(
+            status_code=413,
+            content={"error": f"Request body is larger than {limit_mb:g} MB."},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        declared = dict(scope.get("headers", [])).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = rejected = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def limited_send(message):
+            nonlocal rejected
+            if not exceeded:
+                await send(message)
+            elif not rejected:
+                rejected = True
+                await self._reject(scope, receive, send)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except Exception:
+            if not exceeded:
+                raise
+            if not rejected:
+                rejected = True
+                await self._reject(scope, receive, send)
+
+
+# --- Per-request counters ---
+#
+# Each request gets a fresh counter dict in a ContextVar (installed by
+# _RequestStatsMiddleware). Helpers call _count("redis_round_trips") etc.;
+# outside a request the counts are simply dropped. Jobs run by
+# _run_concurrently copy the request context, so counts made on worker
+# threads land in the same dict.
+_request_counters: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "request_counters", default=None
+)
+_counters_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1):
+    """Add n to the named counter of the current request (no-op outside one)."""
+    counters = _request_counters.get()
+    if counters is not None:
+        with _counters_lock:
+            counters[name] = counters.get(name, 0) + n
+
+
+# --- Per-request spans ---
+#
+# Named wall-clock spans — session load/save, Garmin login and each Garmin
+# method, OpenAI calls, Redis, JSON rendering — are summed per name for the
+# request (same ContextVar scheme as the counters) and reported by
+# _RequestStatsMiddleware as a Server-Timing header, which shows up in the
+# browser's network panel, and as one structured log line. Spans that
+# overlap (e.g. Garmin calls fanned out in parallel) each count in full, so
+# they can add up to more than the request took. Spans that end after the
+# response has started (a streamed model reply) are only in the log line.
+REQUEST_LOG = os.getenv("REQUEST_LOG", "1") != "0"
+
+_request_spans: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+
+@contextmanager
+def _span(name: str):
+    """Time the enclosed block as the named span of the current request."""
+    spans = _request_spans.get()
+    if spans is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _counters_lock:
+            total_ms, n = spans.get(name, (0.0, 0))
+            spans[name] = (total_ms + elapsed_ms, n + 1)
+
+
+def _server_timing(spans: dict, total_ms: float, cold: bool) -> str:
+    """Format spans as a Server-Timing header value, slowest first."""
+    entries = []
+    for name, (ms, n) in sorted(spans.items(), key=lambda kv: kv[1][0], reverse=True):
+        entry = f"{name};dur={ms:.1f}"
+        if n > 1:
+            entry += f';desc="{n} calls"'
+        entries.append(entry)
+    entries.append(f"total;dur={total_ms:.1f}")
+    if cold:
+        entries.append('cold;desc="first request on this instance"')
+    return ", ".join(entries)
+
+
+class JSONResponse(_JSONResponse):
+    """JSONResponse that times its serialization as the "json" span.
+
+    create_app makes it the default response class; endpoints that build
+    responses explicitly import it from here instead of fastapi.responses.
+    """
+
+    def render(self, content) -> bytes:
+        with _span("json"):
+            return super().render(content)
+
+
+# --- Aggregate operational metrics ---
+#
+# Server-Timing and the log line describe single requests, and in-memory
+# totals belong to one instance and vanish with it. For fleet-wide numbers
+# every request also records a few Prometheus-style series: request latency
+# histograms, Garmin calls by method and outcome, OpenAI tokens and latency,
+# Redis round trips and cache lookups by result. Each instance buffers
+# them and, at most once per METRICS_FLUSH_INTERVAL seconds, adds the buffer
+# to one Redis hash in a single EVAL. The flush happens just before the last
+# chunk of a response is sent: Vercel may freeze the function as soon as the
+# response is complete, so anything written after it can be silently lost.
+# Every api/*.py instance adds to the same hash, so /api/ops-metrics
+# exports totals across all of them. Without Redis they only add up
+# within the local process.
+#
+# The hash rotates every METRICS_WINDOW seconds (race:metrics:<window
+# start>) and each one expires a window after it closes, so old series
+# don't pile up. Prometheus treats the rollover like any counter reset.
+METRICS_KEY = "race:metrics"
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "30"))  # seconds
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", str(7 * 24 * 3600)))  # 7 days
+
+REQUEST_DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # seconds
+OPENAI_DURATION_BUCKETS = (1, 2.5, 5, 10, 20, 40, 60)  # seconds
+
+# name -> (Prometheus type, help text)
+METRICS = {
+    "race_goal_requests_total": ("counter", "Requests by function and status code."),
+    "race_goal_request_duration_seconds": ("histogram", "Request latency by function, until the last response chunk is ready."),
+    "race_goal_redis_round_trips_total": ("counter", "Upstash round trips by function."),
+    "race_goal_garmin_calls_total": ("counter", "Garmin calls by method and outcome (ok, 429, auth_fail, backoff, error)."),
+    "race_goal_openai_requests_total": ("counter", "OpenAI chat completions by outcome (ok, error)."),
+    "race_goal_openai_tokens_total": ("counter", "OpenAI tokens by type (prompt, completion)."),
+    "race_goal_openai_duration_seconds": ("histogram", "OpenAI call latency, to the last token."),
+    "race_goal_cache_lookups_total": ("counter", "Cache lookups by cache and result (hit, miss, bypass)."),
+}
+
+# Add each (field, increment) pair after ARGV[1] to the hash in KEYS[1],
+# then (re)set its expiry to ARGV[1] seconds
+_METRICS_SCRIPT = """
+for i = 2, #ARGV, 2 do
+  redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+_request_metrics: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "request_metrics", default=None
+)
+
+
+def _metric(name: str, labels: Optional[dict] = None, value: float = 1):
+    """Add value to a series of the current request (no-op outside one).
+
+    The function label is added when the request's series are recorded, so
+    helpers only pass the labels they know about.
+    """
+    metrics = _request_metrics.get()
+    if metrics is not None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with _counters_lock:
+            metrics[key] = metrics.get(key, 0) + value
+
+
+def _observe(name: str, labels: Optional[dict], value: float, buckets: tuple):
+    """Record one histogram observation (cumulative buckets, sum and count)."""
+    labels = labels or {}
+    for le in buckets:
+        # Zero increments still create the bucket, so every series has them all
+        _metric(f"{name}_bucket", {**labels, "le": str(le)}, 1 if value <= le else 0)
+    _metric(f"{name}_bucket", {**labels, "le": "+Inf"})
+    _metric(f"{name}_sum", labels, value)
+    _metric(f"{name}_count", labels)
+
+
+def _series_name(name: str, labels: tuple) -> str:
+    """Prometheus sample name, e.g. race_goal_requests_total{function="metrics"}."""
+    if not labels:
+        return name
+    escaped = (
+        f'{k}="' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"' for k, v in labels
+    )
+    return f"{name}{{{','.join(escaped)}}}"
+
+
+def _metrics_window(now: Optional[float] = None) -> int:
+    """Start (unix seconds) of the METRICS_WINDOW the given time falls in."""
+    now = time.time() if now is None else now
+    return int(now // METRICS_WINDOW) * METRICS_WINDOW
+
+
+class _MetricsBuffer:
+    """Per-instance buffer of series increments, flushed to Redis."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, float] = {}
+        self._local: Dict[str, float] = {}  # totals when Redis isn't configured
+        self._last_flush = 0.0
+
+    def add(self, function_name: str, metrics: dict):
+        with self._lock:
+            for (name, labels), value in metrics.items():
+                series = _series_name(name, (("function", function_name),) + labels)
+                self._pending[series] = self._pending.get(series, 0) + value
+
+    def flush_due(self) -> bool:
+        """Whether METRICS_FLUSH_INTERVAL has passed since the last flush."""
+        return time.time() - self._last_flush >= METRICS_FLUSH_INTERVAL
+
+    def flush(self):
+        """Add the pending increments to the shared totals.
+
+        Failures are swallowed and the batch dropped — metrics must never
+        fail (or retry-storm) a request.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.time()
+        if not pending:
+            return
+        try:
+            if _redis:
+                window = _metrics_window()
+                # Keep each window readable for one more window after it closes
+                expire = window + 2 * METRICS_WINDOW - int(time.time())
+                args = [str(expire)]
+                for series, value in pending.items():
+                    args += [series, repr(float(value))]
+                _redis.eval(_METRICS_SCRIPT, keys=[f"{METRICS_KEY}:{window}"], args=args)
+            else:
+                with self._lock:
+                    for series, value in pending.items():
+                        self._local[series] = self._local.get(series, 0) + value
+        except Exception:
+            pass
+
+    def totals(self) -> Dict[str, float]:
+        """Totals of the current window across all instances.
+
+        Without Redis, totals of this process since it started.
+        """
+        if _redis:
+            raw = _redis.hgetall(f"{METRICS_KEY}:{_metrics_window()}") or {}
+            return {
+                (k.decode() if isinstance(k, bytes) else k): float(v)
+                for k, v in raw.items()
+            }
+        with self._lock:
+            return dict(self._local)
+
+
+_metrics_buffer = _MetricsBuffer()
+
+
+def _sample_order(sample: tuple) -> tuple:
+    """Sort key keeping a series' buckets in numeric le order, +Inf last."""
+    series, _ = sample
+    head, sep, le = series.partition(',le="')
+    if not sep:
+        head, sep, le = series.partition('{le="')
+    bound = le.split('"', 1)[0]
+    return (head, float("inf") if bound == "+Inf" else float(bound or 0))
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _render_prometheus(totals: Dict[str, float]) -> str:
+    """Totals in the Prometheus text exposition format (version 0.0.4)."""
+    families: Dict[str, list] = {}
+    for series, value in totals.items():
+        name = series.split("{", 1)[0]
+        family = name
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix) and name[: -len(suffix)] in METRICS:
+                family = name[: -len(suffix)]
+        families.setdefault(family, []).append((series, value))
+    lines = []
+    for family in sorted(families):
+        kind, help_text = METRICS.get(family, ("untyped", ""))
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for series, value in sorted(families[family], key=_sample_order):
+            lines.append(f"{series} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class _RequestStatsMiddleware:
+    """ASGI middleware that scopes per-request counters and spans and reports them.
+
+    Starts each HTTP request with empty counter and span dicts. When the
+    response starts, the Redis round-trip count is added as an
+    X-Redis-Round-Trips header and the spans so far as a Server-Timing
+    header. Just before the last chunk of the response is sent, the
+    request's metric series are added to the fleet-wide totals (see
+    _MetricsBuffer) — while the function is certain to still be running.
+    When the request is done, one JSON log line with the function name,
+    status, duration, spans and counters is printed (Vercel keeps stdout as
+    the function log) unless REQUEST_LOG=0. The query string is never
+    logged — it carries the session token.
+    """
+
+    def __init__(self, app, function_name: str):
+        self.app = app
+        self.function_name = function_name
+        # The first request an instance serves paid for its cold start
+        self._cold = True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        counters, spans, metrics = {}, {}, {}
+        reset_counters = _request_counters.set(counters)
+        reset_spans = _request_spans.set(spans)
+        reset_metrics = _request_metrics.set(metrics)
+        cold, self._cold = self._cold, False
+        started = time.perf_counter()
+        status = None
+        duration = None
+
+        async def record():
+            """Add the request's series to the buffer; flush it if due."""
+            nonlocal duration
+            duration = time.perf_counter() - started
+            flushing = METRICS_ENABLED and _metrics_buffer.flush_due()
+            # The flush is one more round trip for this request
+            round_trips = counters.get("redis_round_trips", 0) + (1 if flushing and _redis else 0)
+            _metric("race_goal_requests_total", {"status": str(status or 500)})
+            _observe("race_goal_request_duration_seconds", None, duration, REQUEST_DURATION_BUCKETS)
+            _metric("race_goal_redis_round_trips_total", None, round_trips)
+            if METRICS_ENABLED:
+                _metrics_buffer.add(self.function_name, metrics)
+            if flushing:
+                await _run_blocking(_metrics_buffer.flush)
+
+        async def send_with_stats(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total_ms = (time.perf_counter() - started) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"x-redis-round-trips",
+                    str(counters.get("redis_round_trips", 0)).encode(),
+                ))
+                headers.append((b"server-timing", _server_timing(spans, total_ms, cold).encode()))
+                message = {**message, "headers": headers}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                if duration is None:
+                    await record()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            # Covers requests that fail without completing a response
+            if duration is None:
+                await record()
+            _request_counters.reset(reset_counters)
+            _request_spans.reset(reset_spans)
+            _request_metrics.reset(reset_metrics)
+            if REQUEST_LOG:
+                print(json.dumps({
+                    "function": self.function_name,
+                    "method": scope.get("method"),
+                    "status": status or 500,
+                    "duration_ms": round(duration * 1000, 1),
+                    "cold": cold,
+                    "spans": {name: {"ms": round(ms, 1), "n": n} for name, (ms, n) in spans.items()},
+                    "counters": counters,
+                }), flush=True)
+
+
+class _SessionContextMiddleware:
+    """ASGI middleware that gives each HTTP request its own session context.
+
+    Sessions read during the request are memoized (see _find_session) and
+    updates are buffered (see _update_session), then written back in one
+    round trip per token just before the response starts — so the write is
+    done (or has failed with a 500) by the time the client sees a status.
+    The write goes through _run_blocking, so it doesn't stall the event loop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        ctx = _SessionContext()
+        reset = _request_sessions.set(ctx)
+
+        async def send_after_flush(message):
+            if message["type"] == "http.response.start":
+                await _run_blocking(ctx.flush)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_after_flush)
+        finally:
+            # Covers requests that fail without ever starting a response
+            try:
+                await _run_blocking(ctx.flush)
+            finally:
+                _request_sessions.reset(reset)
+
+
+# --- Opt-in request profiler ---
+#
+# Server-Timing shows which span of a request was slow; a profile shows
+# why. A request that carries PROFILE_TOKEN, either as an X-Profile-Token
+# header or as ?profile=<token>, is run under a sampling profiler. A
+# background thread snapshots the stacks every PROFILE_INTERVAL_MS. It
+# samples the event loop thread and every pool thread that is running
+# work for the request (see _run_blocking). Each sample counts toward the
+# wall-clock profile. It also counts toward the CPU profile if its thread
+# used CPU for at least half the interval.
+#
+# The profile is stored under race:profile:<id> for PROFILE_TTL seconds
+# (in /tmp/race-profiles/ without Redis), and the id is returned in an
+# X-Profile-Id header. Read it with profile-report.py. Without
+# PROFILE_TOKEN the middleware isn't installed at all. With it, requests
+# that don't ask to be profiled only pay for a header lookup.
+#
+# The loop thread is shared by every request an instance is serving, so
+# concurrent requests on the same instance show up in its samples too.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_TTL = int(os.getenv("PROFILE_TTL", "86400"))  # 1 day
+PROFILE_PREFIX = "race:profile:"
+PROFILE_DIR = "/tmp/race-profiles"
+PROFILE_MAX_DEPTH = 64
+
+_API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _frame_label(code) -> str:
+    """Frame as "function (path:first line)", paths relative to api/ or site-packages."""
+    path = code.co_filename
+    if "site-packages" + os.sep in path:
+        path = path.split("site-packages" + os.sep, 1)[1]
+    elif path.startswith(_API_DIR + os.sep):
+        path = os.path.relpath(path, _API_DIR)
+    else:
+        path = os.path.basename(path)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class _SamplingProfiler:
+    """Samples the stacks of the threads working for one request.
+
+    Stacks are kept in the "folded" format flame graph tools read: frames
+    root-first, joined with ";", starting with the thread's role (loop or
+    worker), mapped to the number of samples.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.wall: Dict[str, int] = {}
+        self.cpu: Dict[str, int] = {}
+        self.cpu_ms = 0.0
+        self.samples = 0
+        self._threads: Dict[int, str] = {}  # thread ident -> role
+        self._cpu_seen: Dict[int, float] = {}  # thread ident -> CPU seconds at the last sample
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start sampling, with the calling thread (the event loop) included."""
+        with self._lock:
+            self._threads[threading.get_ident()] = "loop"
+        self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def run_in_thread(self, fn: Callable, *args, **kwargs):
+        """Call fn with the current (pool) thread sampled for the duration."""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = "worker"
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._threads.pop(ident, None)
+                self._cpu_seen.pop(ident, None)
+
+    def _cpu_delta(self, ident: int) -> Optional[float]:
+        """CPU seconds the thread used since its last sample (None if unknown)."""
+        try:
+            used = time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except (AttributeError, OSError):
+            # Not available on every platform, or the thread just exited
+            return None
+        last = self._cpu_seen.get(ident)
+        self._cpu_seen[ident] = used
+        return None if last is None else used - last
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, role in self._threads.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    labels = []
+                    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+                        labels.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    stack = ";".join([role] + labels[::-1])
+                    self.wall[stack] = self.wall.get(stack, 0) + 1
+                    used = self._cpu_delta(ident)
+                    if used is not None:
+                        self.cpu_ms += used * 1000
+                        if used >= self.interval / 2:
+                            self.cpu[stack] = self.cpu.get(stack, 0) + 1
+                self.samples += 1
+
+
+_request_profile: contextvars.ContextVar[Optional[_SamplingProfiler]] = contextvars.ContextVar(
+    "request_profile", default=None
+)
+
+
+def _folded(stacks: Dict[str, int]) -> str:
+    """Folded stacks, one "stack count" line each, most samples first."""
+    return "".join(
+        f"{stack} {n}\n" for stack, n in sorted(stacks.items(), key=lambda kv: kv[1], reverse=True)
+    )
+
+
+def _save_profile(profile_id: str, record: dict):
+    """Store a profile in Redis, or under PROFILE_DIR if that fails or isn't configured."""
+    try:
+        if _redis:
+            _redis.set(f"{PROFILE_PREFIX}{profile_id}", json.dumps(record), ex=PROFILE_TTL)
+            return
+    except Exception:
+        pass
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+            json.dump(record, f)
+    except Exception:
+        pass
+
+
+class _ProfileMiddleware:
+    """ASGI middleware that profiles requests carrying PROFILE_TOKEN.
+
+    Only installed by create_app when PROFILE_TOKEN is set. The profile id
+    goes out in an X-Profile-Id header when the response starts. The
+    profile itself is stored once the request is done, off the event loop.
+    """
+
+    def __init__(self, app, function_name: str):
+        self.app = app
+        self.function_name = function_name
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        supplied = ""
+        for name, value in scope.get("headers", []):
+            if name == b"x-profile-token":
+                supplied = value.decode("latin-1")
+        if not supplied and b"profile=" in scope.get("query_string", b""):
+            query = parse_qs(scope["query_string"].decode("latin-1"))
+            supplied = (query.get("profile") or [""])[0]
+        return bool(supplied) and hmac.compare_digest(supplied.encode(), PROFILE_TOKEN.encode())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid.uuid4().hex
+        profiler = _SamplingProfiler(PROFILE_INTERVAL_MS / 1000)
+        reset = _request_profile.set(profiler)
+        started_at = datetime.now().isoformat()
+        started = time.perf_counter()
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            _request_profile.reset(reset)
+            # The query string is left out on purpose — it carries the session token
+            await _run_blocking(_save_profile, profile_id, {
+                "id": profile_id,
+                "function": self.function_name,
+                "method": scope.get("method"),
+                "status": status or 500,
+                "started_at": started_at,
+                "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+                "cpu_ms": round(profiler.cpu_ms, 1),
+                "interval_ms": PROFILE_INTERVAL_MS,
+                "samples": profiler.samples,
+                "wall": _folded(profiler.wall),
+                "cpu": _folded(profiler.cpu),
+            })
+
+
+def create_app(function_name: str, max_body_bytes: Optional[int] = None) -> FastAPI:
     """Create a FastAPI app configured for Vercel file-based serverless mode.
 
-    Wraps the app with two middlewares (CORS outermost, prefix-stripping inner):
+    JSONResponse (the span-timed one above) is the default response class.
+    Wraps the app with four middlewares (CORS outermost, session context inner):
     1. CORSMiddleware — handles cross-origin requests from the frontend.
     2. _StripPrefixMiddleware — strips any path prefix ending with
        /<function_name> so routes defined at "/" match what Vercel sends,
        whether from direct /api/<name> or rewritten /projects/.../api/<name>.
+    3. _RequestStatsMiddleware — per-request counters and timed spans,
+       reported as X-Redis-Round-Trips and Server-Timing headers and one
+       structured log line per request. Helpers record spans with _span(),
+       so any endpoint built on create_app gets them without changes.
+    4. _SessionContextMiddleware — loads each session at most once per
+       request and writes buffered updates back once at the end.
+    With PROFILE_TOKEN set, _ProfileMiddleware sits between 2 and 3 and
+    profiles requests that ask for it (see the request profiler above).
+    With max_body_bytes set, _BodyLimitMiddleware sits innermost and
+    refuses larger request bodies with a 413 before they're parsed.
 
     Args:
         function_name: The filename without .py (e.g. "garmin-auth"). Used to
                        match the suffix to strip from the request path.
+        max_body_bytes: Optional cap on the request body size, for
+                        endpoints that accept uploads.
     """
-    app = FastAPI()
+    app = FastAPI(default_response_class=JSONResponse)
+
+    if max_body_bytes:
+        app.add_middleware(_BodyLimitMiddleware, max_bytes=max_body_bytes)
+
+    # Innermost — flushes buffered session writes before the stats
+    # middleware reads the final counts
+    app.add_middleware(_SessionContextMiddleware)
+    app.add_middleware(_RequestStatsMiddleware, function_name=function_name)
+    if PROFILE_TOKEN:
+        app.add_middleware(_ProfileMiddleware, function_name=function_name)
 
     # Add prefix-stripping first (becomes inner middleware — runs after CORS,
     # before FastAPI's router sees the path).
@@ -103,9 +812,6 @@ def create_app(function_name: str) -> FastAPI:
 
     return app
 
-# Load environment variables (from .env locally, from Vercel dashboard in production)
-load_dotenv()
-
 # --- Pydantic models ---
 
 class GarminAuthRequest(BaseModel):
@@ -143,12 +849,55 @@ _redis_token = (
     or os.getenv("STORAGE_REDIS_REST_TOKEN")
 )
 
+
+
+class _CountingRedis:
+    """Thin wrapper over the Upstash client that counts HTTPS round trips.
+
+    Every Upstash command is its own HTTPS request, so each direct command
+    counts as one round trip; a pipeline counts once, when it is exec()'d.
+    """
+
+    def __init__(self, redis):
+        self._redis = redis
+
+    def pipeline(self):
+        return _CountingPipeline(self._redis.pipeline())
+
+    def __getattr__(self, name):
+        attr = getattr(self._redis, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            _count("redis_round_trips")
+            with _span("redis"):
+                return attr(*args, **kwargs)
+
+        return counted
+
+
+class _CountingPipeline:
+    """Pipeline wrapper — queued commands are free, exec() is one round trip."""
+
+    def __init__(self, pipeline):
+        self._pipeline = pipeline
+
+    def exec(self):
+        _count("redis_round_trips")
+        with _span("redis"):
+            return self._pipeline.exec()
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+
 # Initialize Redis client if env vars are present (production / preview envs).
 # Falls back to None for local dev — _local_sessions dict is used instead.
 _redis = None
 if _redis_url and _redis_token:
     from upstash_redis import Redis
-    _redis = Redis(url=_redis_url, token=_redis_token)
+    _redis = _CountingRedis(Redis(url=_redis_url, token=_redis_token))
 
 # In-memory fallback for local development when Redis is not configured.
 # This is NOT shared across processes — only use for local testing.
@@ -159,19 +908,92 @@ SESSION_PREFIX = "race:session:"
 SESSION_TTL = 3600 * 12  # 12 hours — refreshed on each successful access
 
 
+
+class _SessionContext:
+    """Sessions loaded and modified during one request.
+
+    sessions maps token -> session dict (None = known missing), so every
+    _get_session/_find_session in the request after the first is free, and
+    all callers share (and see mutations to) the same dict. pending maps
+    token -> fields changed by _update_session that flush() has yet to
+    write. Fan-out workers run in a copy of the request context and share
+    this object, hence the lock.
+    """
+
+    def __init__(self):
+        self.sessions: Dict[str, Optional[dict]] = {}
+        self.pending: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def flush(self):
+        """Write buffered updates back — one round trip per modified token."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for token, updates in pending.items():
+            # A session deleted mid-request (logout race) stays deleted
+            _write_session_updates(token, updates)
+
+
+# The current request's session context; None outside a request (scripts,
+# background work), where reads and writes go straight to the store.
+_request_sessions: contextvars.ContextVar[Optional[_SessionContext]] = (
+    contextvars.ContextVar("request_sessions", default=None)
+)
+
 def _save_session(token: str, data: dict, ttl: int = SESSION_TTL):
     """Save a session to Redis (or local fallback).
 
     Strips the garmin_client field before saving since the Garmin client
-    object is not JSON-serializable. The client is lazily re-created from
-    stored credentials by _get_garmin_client when needed.
+    object is not JSON-serializable. The client is lazily resumed from the
+    stored garmin_tokens by _get_garmin_client when needed.
     """
     # Remove any non-serializable fields before persisting
     clean = {k: v for k, v in data.items() if k != "garmin_client"}
-    if _redis:
-        _redis.set(f"{SESSION_PREFIX}{token}", json.dumps(clean), ex=ttl)
-    else:
-        _local_sessions[token] = clean
+    with _span("session-save"):
+        if _redis:
+            _redis.set(f"{SESSION_PREFIX}{token}", json.dumps(clean), ex=ttl)
+        else:
+            _local_sessions[token] = clean
+    ctx = _request_sessions.get()
+    if ctx is not None:
+        # The full session was just written — nothing left to flush
+        with ctx.lock:
+            ctx.sessions[token] = clean
+            ctx.pending.pop(token, None)
+
+
+def _find_session(token: str) -> Optional[dict]:
+    """Retrieve a session, or None if the token doesn't exist or has expired.
+
+    Uses GETEX so reading the session and refreshing its TTL (sliding
+    expiration) is a single Redis round trip. Within a request the result is
+    memoized, so only the first lookup per token touches the store.
+    """
+    if not token:
+        return None
+    ctx = _request_sessions.get()
+    if ctx is not None and token in ctx.sessions:
+        return ctx.sessions[token]
+    sess = _load_session(token)
+    if ctx is not None:
+        with ctx.lock:
+            # Another fan-out worker may have loaded it first — keep one dict
+            sess = ctx.sessions.setdefault(token, sess)
+    return sess
+
+
+def _load_session(token: str) -> Optional[dict]:
+    """Read a session from the store, bypassing the request context."""
+    with _span("session-load"):
+        if _redis:
+            raw = _redis.getex(f"{SESSION_PREFIX}{token}", ex=SESSION_TTL)
+            if not raw:
+                return None
+            # upstash-redis may return the value as a string or bytes
+            if isinstance(raw, bytes):
+                raw = raw.decode()
+            return json.loads(raw)
+        return _local_sessions.get(token)
 
 
 def _get_session(token: str) -> dict:
@@ -181,90 +1003,443 @@ def _get_session(token: str) -> dict:
     Refreshes the TTL on each successful access (sliding expiration) so
     active sessions stay alive while inactive ones expire after 12 hours.
     """
-    if _redis:
-        raw = _redis.get(f"{SESSION_PREFIX}{token}")
-        if not raw:
-            raise HTTPException(
-                status_code=401,
-                detail="Session expired or invalid. Please log in again."
-            )
-        # upstash-redis may return the value as a string or bytes
-        if isinstance(raw, bytes):
-            raw = raw.decode()
-        sess = json.loads(raw)
-        # Sliding expiration — refresh TTL on each successful access
-        _redis.expire(f"{SESSION_PREFIX}{token}", SESSION_TTL)
-        return sess
-    else:
-        sess = _local_sessions.get(token)
-        if not sess:
-            raise HTTPException(
-                status_code=401,
-                detail="Session expired or invalid. Please log in again."
-            )
-        return sess
+    sess = _find_session(token)
+    if not sess:
+        raise HTTPException(
+            status_code=401,
+            detail="Session expired or invalid. Please log in again."
+        )
+    return sess
+
+
+# Merge a JSON object of updates into the stored session and re-save it with
+# a fresh TTL, entirely server-side — one round trip instead of GET + EXPIRE
+# + SET (a pipeline can't feed a read into a write). Returns nil if the
+# session doesn't exist. Note cjson re-encodes empty arrays as {} — sessions
+# only hold scalars and objects.
+_UPDATE_SESSION_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then return nil end
+local sess = cjson.decode(raw)
+for k, v in pairs(cjson.decode(ARGV[1])) do sess[k] = v end
+redis.call('SET', KEYS[1], cjson.encode(sess), 'EX', tonumber(ARGV[2]))
+return 1
+"""
 
 
 def _update_session(token: str, updates: dict):
     """Merge updates into an existing session and re-save.
 
-    Reads the current session, applies the updates dict, and saves back.
     Used by endpoints like onboarding that modify part of a session
     (e.g. setting race_goal after the session was created by garmin-auth).
+    Within a request the updates are applied to the memoized session at once
+    and buffered; _SessionContextMiddleware writes them back in one round
+    trip when the response starts, however many updates the request made.
+    Outside a request they're written immediately.
+
+    Raises HTTPException(401) if the session doesn't exist.
     """
-    sess = _get_session(token)
-    sess.update({k: v for k, v in updates.items() if k != "garmin_client"})
-    if _redis:
-        _redis.set(f"{SESSION_PREFIX}{token}", json.dumps(sess), ex=SESSION_TTL)
-    else:
-        _local_sessions[token] = sess
+    clean = {k: v for k, v in updates.items() if k != "garmin_client"}
+    ctx = _request_sessions.get()
+    if ctx is not None:
+        sess = _get_session(token)
+        with ctx.lock:
+            sess.update(clean)
+            ctx.pending.setdefault(token, {}).update(clean)
+        return
+    if not _write_session_updates(token, clean):
+        raise HTTPException(
+            status_code=401,
+            detail="Session expired or invalid. Please log in again."
+        )
+
+
+def _write_session_updates(token: str, updates: dict) -> bool:
+    """Merge updates into the stored session with a refreshed TTL.
+
+    A single round trip (see _UPDATE_SESSION_SCRIPT). Returns False if the
+    session doesn't exist.
+    """
+    with _span("session-save"):
+        if _redis:
+            return bool(_redis.eval(
+                _UPDATE_SESSION_SCRIPT,
+                keys=[f"{SESSION_PREFIX}{token}"],
+                args=[json.dumps(updates), str(SESSION_TTL)],
+            ))
+        sess = _local_sessions.get(token)
+        if sess is not None:
+            sess.update(updates)
+        return sess is not None
 
 
 def _delete_session(token: str):
-    """Remove a session from Redis (or local fallback)."""
-    if _redis:
-        _redis.delete(f"{SESSION_PREFIX}{token}")
-    else:
-        _local_sessions.pop(token, None)
+    """Remove a session from Redis (or local fallback).
 
+    Also drops any warm Garmin client cached for the token on this instance.
+    """
+    _garmin_clients.invalidate(token)
+    ctx = _request_sessions.get()
+    if ctx is not None:
+        with ctx.lock:
+            ctx.sessions[token] = None
+            ctx.pending.pop(token, None)
+    with _span("session-delete"):
+        if _redis:
+            _redis.delete(f"{SESSION_PREFIX}{token}")
+        else:
+            _local_sessions.pop(token, None)
+
+
+# --- Per-user data store ---
+#
+# Some derived data belongs to the Garmin account rather than to a login
+# session (e.g. the last-known VO2max), so it must survive logout/re-login.
+# It is keyed by a hash of the account email — never the raw address — and
+# stored under its own prefix with a long TTL. Same Redis / local-dict
+# fallback as sessions.
+USER_PREFIX = "race:user:"
+USER_DATA_TTL = 3600 * 24 * 90  # 90 days
 
-def _session_exists(token: str) -> bool:
-    """Check if a session token exists without raising 401.
+_local_user_data: Dict[str, dict] = {}
 
-    Used by check-session which returns a JSON {valid: false} response
-    instead of an error when the token is missing.
+
+def _user_id(sess: dict) -> Optional[str]:
+    """Stable, non-reversible id for the Garmin account behind a session.
+
+    Returns None if the session has no email (per-user data is then skipped).
     """
+    email = (sess.get("email") or "").strip().lower()
+    if not email:
+        return None
+    return hashlib.sha256(email.encode()).hexdigest()[:24]
+
+
+def _get_user_data(user_id: str, name: str) -> Optional[dict]:
+    """Read a named per-user record, or None if it doesn't exist."""
+    key = f"{USER_PREFIX}{user_id}:{name}"
     if _redis:
-        return _redis.exists(f"{SESSION_PREFIX}{token}") > 0
+        raw = _redis.get(key)
+        if not raw:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        return json.loads(raw)
+    return _local_user_data.get(key)
+
+
+def _set_user_data(user_id: str, name: str, data: dict, ttl: int = USER_DATA_TTL):
+    """Write a named per-user record (replaces any existing one)."""
+    key = f"{USER_PREFIX}{user_id}:{name}"
+    if _redis:
+        _redis.set(key, json.dumps(data), ex=ttl)
     else:
-        return token in _local_sessions
+        _local_user_data[key] = data
+
+
+# --- Bounded result cache ---
+#
+# For expensive, deterministic results (e.g. an AI analysis of identical
+# inputs) keyed by a content hash. Entries expire by TTL and the number of
+# entries is capped: in Redis via a sorted-set index trimmed on every write,
+# locally via an LRU. Same Redis / local-dict fallback as sessions.
 
+# Store the value (or, with if_missing, only if there's no entry yet), index
+# it by creation time, drop index entries whose TTL has lapsed, then evict
+# the oldest entries past the cap — one round trip. An entry created before
+# now (an alias of an older result) expires when the original would have.
+# KEYS: entry, index. ARGV: value, ttl, now, max_entries, created, if_missing.
+_BOUNDED_SET_SCRIPT = """
+local ttl = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local created = tonumber(ARGV[5])
+local expire = math.max(1, ttl - (now - created))
+if ARGV[6] == '1' then
+  if not redis.call('SET', KEYS[1], ARGV[1], 'EX', expire, 'NX') then
+    return 0
+  end
+else
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', expire)
+end
+redis.call('ZADD', KEYS[2], created, KEYS[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - ttl)
+local excess = redis.call('ZCARD', KEYS[2]) - tonumber(ARGV[4])
+if excess > 0 then
+  local old = redis.call('ZRANGE', KEYS[2], 0, excess - 1)
+  redis.call('DEL', unpack(old))
+  redis.call('ZREM', KEYS[2], unpack(old))
+end
+redis.call('EXPIRE', KEYS[2], ttl)
+return 1
+"""
 
-def _get_garmin_client(token: str) -> Garmin:
-    """Re-create an authenticated Garmin client from stored credentials.
 
-    The Garmin client object cannot be serialized, so it is NOT stored in
-    Redis. Each call re-creates the client by logging in with the email
-    and password stored in the session. This is the correct serverless
-    pattern — stateless functions with external state storage.
+class _BoundedResultCache:
+    """Content-addressed result store evicted by TTL and entry count.
 
-    Raises HTTPException(401) if credentials are missing or login fails.
+    get() returns (value, age_seconds) or None. Store errors are swallowed —
+    a cache failure must only ever cost a recomputation. Lookups are counted
+    in race_goal_cache_lookups_total under the prefix (minus "race:" and the
+    trailing colon) as the cache label.
     """
-    sess = _get_session(token)
-    email = sess.get("email", "")
-    password = sess.get("password", "")
-    if not email or not password:
-        raise HTTPException(
-            status_code=401,
-            detail="Garmin session not found. Please log in again."
+
+    def __init__(self, prefix: str, ttl: int, max_entries: int, local_max: int):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.local_max = local_max
+        self._local: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: str):
+        found = self._lookup(digest)
+        _metric("race_goal_cache_lookups_total", {
+            "cache": self.prefix.removeprefix("race:").rstrip(":"),
+            "result": "hit" if found else "miss",
+        })
+        return found
+
+    def _lookup(self, digest: str):
+        key = f"{self.prefix}{digest}"
+        try:
+            if _redis:
+                raw = _redis.get(key)
+                if not raw:
+                    return None
+                if isinstance(raw, bytes):
+                    raw = raw.decode()
+                entry = json.loads(raw)
+            else:
+                with self._lock:
+                    entry = self._local.get(key)
+                    if entry is None:
+                        return None
+                    if time.time() - entry["t"] > self.ttl:
+                        del self._local[key]
+                        return None
+                    self._local.move_to_end(key)
+        except Exception:
+            return None
+        return entry["v"], int(time.time() - entry["t"])
+
+    def set(self, digest: str, value: dict, age: int = 0, if_missing: bool = False):
+        """Store value under digest.
+
+        age back-dates the entry (for an alias of a result get() returned
+        with that age), so its reported age and expiry follow the original.
+        if_missing leaves an existing entry — and its age — untouched.
+        """
+        key = f"{self.prefix}{digest}"
+        now = time.time()
+        entry = {"v": value, "t": now - age}
+        try:
+            if _redis:
+                _redis.eval(
+                    _BOUNDED_SET_SCRIPT,
+                    keys=[key, f"{self.prefix}index"],
+                    args=[
+                        json.dumps(entry), str(self.ttl), str(int(now)), str(self.max_entries),
+                        str(int(entry["t"])), "1" if if_missing else "0",
+                    ],
+                )
+            else:
+                with self._lock:
+                    if if_missing and key in self._local:
+                        return
+                    self._local[key] = entry
+                    self._local.move_to_end(key)
+                    while len(self._local) > self.local_max:
+                        self._local.popitem(last=False)
+        except Exception:
+            pass
+
+
+# --- Warm Garmin client cache ---
+#
+# Warm serverless instances (and long-running local uvicorn processes) keep
+# module state between requests, so live Garmin clients are cached per
+# session token. Back-to-back dashboard calls that land on the same instance
+# then skip the token resume + profile fetch entirely. Bounded by an idle TTL
+# and LRU eviction so a busy instance can't accumulate clients forever.
+GARMIN_CLIENT_CACHE_SIZE = int(os.getenv("GARMIN_CLIENT_CACHE_SIZE", "32"))
+GARMIN_CLIENT_IDLE_TTL = int(os.getenv("GARMIN_CLIENT_IDLE_TTL", "1800"))  # 30 minutes
+
+
+class _GarminClientCache:
+    """Thread-safe LRU cache of authenticated Garmin clients with an idle TTL.
+
+    Each hit moves the entry to the most-recently-used end and resets its
+    idle timer. Hits and misses are counted in race_goal_cache_lookups_total
+    (cache="garmin_client") by lib._garmin._get_garmin_client.
+    """
+
+    def __init__(self, max_size: int, idle_ttl: int):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[str, tuple[Garmin, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional["Garmin"]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            client, last_used = entry
+            if now - last_used > self.idle_ttl:
+                # Idle too long — treat as a miss and drop it
+                del self._entries[token]
+                return None
+            self._entries[token] = (client, now)
+            self._entries.move_to_end(token)
+            return client
+
+    def put(self, token: str, client: "Garmin"):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (client, time.monotonic())
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        with self._lock:
+            self._entries.pop(token, None)
+
+
+_garmin_clients = _GarminClientCache(GARMIN_CLIENT_CACHE_SIZE, GARMIN_CLIENT_IDLE_TTL)
+
+
+# --- Concurrent upstream fan-out ---
+#
+# garminconnect is synchronous, so calling it straight from an async def
+# blocks the event loop and makes an endpoint's latency the SUM of all its
+# upstream round trips. Independent groups of calls are instead run on a
+# bounded, process-wide thread pool and awaited together, so latency becomes
+# roughly the slowest group. The pool size caps how hard one instance hits
+# Garmin at once.
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "16"))
+FANOUT_GROUP_TIMEOUT = float(os.getenv("FANOUT_GROUP_TIMEOUT", "20"))  # seconds
+
+_fanout_executor = ThreadPoolExecutor(
+    max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="fanout"
+)
+
+
+async def _run_blocking(fn: Callable, *args, **kwargs):
+    """Await a blocking call on the shared pool without blocking the loop.
+
+    Runs in a copy of the request context, so per-request counters and the
+    request's session context still apply inside the worker thread. When
+    the request is being profiled, the worker thread is sampled too.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    profiler = _request_profile.get()
+    if profiler is not None:
+        fn, args = profiler.run_in_thread, (fn, *args)
+    return await loop.run_in_executor(
+        _fanout_executor, functools.partial(ctx.run, fn, *args, **kwargs)
+    )
+
+
+async def _run_concurrently(
+    jobs: Dict[str, Callable[[], dict]],
+    timeout: float = FANOUT_GROUP_TIMEOUT,
+) -> Dict[str, dict]:
+    """Run independent blocking jobs concurrently on the shared thread pool.
+
+    Each job is a zero-argument callable returning a dict of results. Jobs
+    get their own timeout so one slow upstream can't sink the whole
+    response — a job that times out or raises contributes an empty dict
+    (the same as the old "except Exception: pass" behaviour). A timed-out
+    thread can't be killed; it finishes in the background and its result
+    is discarded.
+
+    Returns a dict mapping each job name to its result, in the same order
+    as the input so callers can assemble results deterministically.
+    """
+    async def run(fn: Callable[[], dict]) -> dict:
+        try:
+            return await asyncio.wait_for(_run_blocking(fn), timeout) or {}
+        except Exception:
+            return {}
+
+    results = await asyncio.gather(*(run(fn) for fn in jobs.values()))
+    return dict(zip(jobs.keys(), results))
+
+
+# --- Pooled OpenAI clients ---
+#
+# Constructing AsyncOpenAI per request means a new connection pool — and a
+# new TCP + TLS handshake to the API — on every call, even on a warm
+# instance. Clients are instead created lazily, once per API key (ai-radar
+# may use RACE_GOAL_OPENAI_API_KEY, analyse OPENAI_API_KEY), and reused with
+# a keep-alive pool. The openai package is only imported on first use so
+# endpoints that never call it don't pay for the import.
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))  # seconds, per request
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))  # seconds
+
+# api key -> (event loop, client). An httpx pool is tied to the loop it was
+# created on, so a client is only reused on the same loop (always the case
+# within one serverless instance) and rebuilt if the loop changed.
+_openai_clients: Dict[str, tuple] = {}
+_openai_clients_lock = threading.Lock()
+
+
+def _get_openai_client(api_key: str):
+    """Shared AsyncOpenAI client for api_key, created on first use.
+
+    Must be called from within the running event loop (i.e. from an async
+    endpoint). Timeouts and retries come from the OPENAI_* settings above.
+    """
+    loop = asyncio.get_running_loop()
+    with _openai_clients_lock:
+        entry = _openai_clients.get(api_key)
+        if entry and entry[0] is loop:
+            return entry[1]
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        client = AsyncOpenAI(
+            api_key=api_key,
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+                    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+                ),
+            ),
         )
+        _openai_clients[api_key] = (loop, client)
+        return client
 
+
+@contextmanager
+def _openai_call():
+    """Time and count one chat completion for the request's span and metrics.
+
+    Yields a record whose .usage the caller sets to the API's usage block
+    (when one was sent), so the token counts are recorded too. The call
+    counts as an error if the block raises.
+    """
+    call = types.SimpleNamespace(usage=None)
+    started = time.perf_counter()
+    outcome = "error"
     try:
-        client = Garmin(email, password)
-        client.login()
-        return client
-    except Exception:
-        raise HTTPException(
-            status_code=401,
-            detail="Garmin re-authentication failed. Please log in again."
-        )
+        with _span("openai"):
+            yield call
+        outcome = "ok"
+    finally:
+        _metric("race_goal_openai_requests_total", {"outcome": outcome})
+        _observe("race_goal_openai_duration_seconds", None, time.perf_counter() - started, OPENAI_DURATION_BUCKETS)
+        for kind in ("prompt", "completion"):
+            tokens = getattr(call.usage, f"{kind}_tokens", None)
+            if tokens:
+                _metric("race_goal_openai_tokens_total", {"type": kind}, tokens)
@@ -1,12 +1,11 @@
 """DELETE /api/logout — End a session and remove it from Redis."""
 
-from fastapi.responses import JSONResponse
 # Add the api/ directory to Python's search path so lib._shared can be found
 # when running as a Vercel serverless function (cwd is project root, not api/)
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from lib._shared import _delete_session, create_app
+from lib._shared import JSONResponse, _delete_session, create_app
 
 # create_app() wraps the app with prefix-stripping + CORS middleware for
 # Vercel file-based mode (strips /api/logout so routes at "/" match)
@@ -1,14 +1,13 @@
 """POST /api/onboarding — Save the user's race goal via form data."""
 
 from fastapi import Form
-from fastapi.responses import JSONResponse
 from datetime import datetime
 # Add the api/ directory to Python's search path so lib._shared can be found
 # when running as a Vercel serverless function (cwd is project root, not api/)
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from lib._shared import _get_session, _update_session, create_app
+from lib._shared import JSONResponse, _get_session, _update_session, create_app
 
 # create_app() wraps the app with prefix-stripping + CORS middleware for
 # Vercel file-based mode (strips /api/onboarding so routes at "/" match)
@@ -35,7 +34,8 @@ async def onboarding(
     locally) with a sliding 12-hour TTL. All fields except token are optional
     with empty defaults.
     """
-    # Validate the session exists (raises 401 if not)
+    # Validate the session exists (raises 401 if not). The session is
+    # memoized for the request, so _update_session below doesn't re-read it.
     _get_session(token)
     goal = {
         "purpose": purpose,
@@ -49,6 +49,7 @@ async def onboarding(
         "age": age,
         "saved_at": datetime.now().isoformat(),
     }
-    # Merge the race goal into the existing session and re-save to Redis
+    # Merge the race goal into the session — written back to Redis once,
+    # just before the response is sent
     _update_session(token, {"race_goal": goal})
     return JSONResponse(content={"message": "Race goal saved.", "goal": goal})
@@ -0,0 +1,82 @@
+"""GET /api/ops-metrics — Fleet-wide operational metrics in Prometheus text format."""
+
+import re
+import hmac
+from fastapi import Header
+from fastapi.responses import PlainTextResponse
+# Add the api/ directory to Python's search path so lib._shared can be found
+# when running as a Vercel serverless function (cwd is project root, not api/)
+import sys, os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from lib._shared import JSONResponse, _metrics_buffer, _render_prometheus, create_app
+
+# create_app() wraps the app with prefix-stripping + CORS middleware for
+# Vercel file-based mode (strips /api/ops-metrics so routes at "/" match)
+app = create_app("ops-metrics")
+
+# 'name{a="x",b="y"}' -> name, 'a="x",b="y"'
+SERIES = re.compile(r'^([^{]+)(?:\{(.*)\})?$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _authorized(authorization: str, key: str) -> bool:
+    """Whether the request carries OPS_METRICS_TOKEN as a bearer token or ?key=."""
+    expected = os.getenv("OPS_METRICS_TOKEN", "")
+    supplied = authorization[7:] if authorization.lower().startswith("bearer ") else key
+    return bool(supplied) and hmac.compare_digest(supplied.encode(), expected.encode())
+
+
+def _summary(totals: dict) -> dict:
+    """The headline numbers: requests, errors and cache hit ratios per function."""
+    requests, caches = {}, {}
+    for series, value in totals.items():
+        m = SERIES.match(series)
+        if not m:
+            continue
+        name, labels = m.group(1), dict(LABEL.findall(m.group(2) or ""))
+        if name == "race_goal_requests_total":
+            fn = requests.setdefault(labels.get("function", ""), {"requests": 0, "errors": 0})
+            fn["requests"] += int(value)
+            if labels.get("status", "").startswith("5"):
+                fn["errors"] += int(value)
+        elif name == "race_goal_cache_lookups_total":
+            cache = caches.setdefault(labels.get("cache", ""), {"hit": 0, "miss": 0, "bypass": 0})
+            cache[labels.get("result", "miss")] = cache.get(labels.get("result", "miss"), 0) + int(value)
+    for cache in caches.values():
+        looked_up = cache["hit"] + cache["miss"]
+        cache["hit_ratio"] = round(cache["hit"] / looked_up, 3) if looked_up else None
+    return {"functions": requests, "caches": caches}
+
+
+@app.get("/")
+async def ops_metrics(key: str = "", format: str = "prometheus", authorization: str = Header("")):
+    """Export the request, Garmin, OpenAI, Redis and cache metrics of every function.
+
+    Every api/*.py instance adds its per-request series to one Redis hash
+    (see "Aggregate operational metrics" in lib._shared), so this returns
+    totals across the whole deployment, ready for a Prometheus scrape job
+    or any agent that reads the text format. Totals cover the current
+    METRICS_WINDOW (a week by default) and restart from zero when it rolls
+    over, which rate() and increase() handle as a counter reset. ?format=json instead returns a
+    short summary (requests and 5xx per function, cache hit ratios).
+
+    Requires OPS_METRICS_TOKEN, sent as "Authorization: Bearer <token>" or
+    ?key=<token>. Without OPS_METRICS_TOKEN configured the endpoint doesn't
+    exist (404), so metrics are never public by accident.
+    """
+    if not os.getenv("OPS_METRICS_TOKEN"):
+        return JSONResponse(status_code=404, content={"error": "Not found."})
+    if not _authorized(authorization, key):
+        return JSONResponse(status_code=401, content={"error": "Invalid metrics token."})
+    try:
+        totals = _metrics_buffer.totals()
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"error": f"Failed to read metrics: {str(e)}"})
+    if format == "json":
+        return JSONResponse(content=_summary(totals))
+    return PlainTextResponse(
+        _render_prometheus(totals),
+        media_type="text/plain; version=0.0.4",
+        headers={"Cache-Control": "no-store"},
+    )
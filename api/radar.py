@@ -1,25 +1,62 @@
 """GET /api/radar — Estimated scores for 6 race-goal dimensions from Garmin data."""
 
-from fastapi.responses import JSONResponse
-from datetime import datetime, date, timedelta
+import asyncio
+from datetime import datetime, date
 # Add the api/ directory to Python's search path so lib._shared can be found
 # when running as a Vercel serverless function (cwd is project root, not api/)
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from lib._shared import _get_garmin_client, create_app
+from lib._shared import JSONResponse, _get_session, _user_id, create_app
+from lib._garmin import (
+    _get_async_garmin_client, _lookup_vo2max, _sync_activities, _sync_activity_store, _sync_wellness_store,
+)
+from lib._payloads import RADAR_HISTORY_MAX_WEEKS, build_radar_history, radar_history_days
 
 # create_app() wraps the app with prefix-stripping + CORS middleware for
 # Vercel file-based mode (strips /api/radar so routes at "/" match)
 app = create_app("radar")
 
 
+async def _radar_history(garmin, weeks: int) -> JSONResponse:
+    """Scores for each of the last `weeks` weeks, oldest first.
+
+    The activity store and the daily wellness store are synced concurrently.
+    Both only fetch what they haven't stored yet, and HRV and VO2max come
+    from range endpoints. The weeks are then scored in one numpy pass (see
+    build_radar_history). Once the stores are warm this costs about as many
+    upstream calls as the snapshot.
+    """
+    since, closing = radar_history_days(weeks)
+    try:
+        store, wellness = await asyncio.gather(
+            garmin.run(_sync_activity_store, since=since),
+            garmin.run(_sync_wellness_store, since, tuple(closing)),
+        )
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"error": f"Failed to fetch radar history: {str(e)}"})
+    return JSONResponse(content={"weeks": build_radar_history(store["activities"], wellness, weeks)})
+
+
 @app.get("/")
-async def radar(token: str = ""):
-    """Return estimated scores for the 6 race-goal dimensions based on real Garmin data."""
-    # _get_garmin_client re-creates the Garmin client from stored credentials
+async def radar(token: str = "", refresh: bool = False, weeks: int = 0):
+    """Return estimated scores for the 6 race-goal dimensions based on real Garmin data.
+
+    With ?weeks=N (1–RADAR_HISTORY_MAX_WEEKS) it returns the history instead:
+    {"weeks": [{"week_start", "as_of", "radar"}, ...]}, oldest first. Each
+    week is scored with the same rules as the snapshot at its closing day
+    (Sunday, or today for the current week).
+    """
+    if weeks and not 1 <= weeks <= RADAR_HISTORY_MAX_WEEKS:
+        return JSONResponse(status_code=400, content={
+            "error": f"weeks must be between 1 and {RADAR_HISTORY_MAX_WEEKS}."
+        })
+
+    # Resumes the Garmin client from the stored session, off the event loop
     # (raises 401 if the session is invalid or credentials are missing)
-    client = _get_garmin_client(token)
+    garmin = await _get_async_garmin_client(token, refresh)
+    if weeks:
+        return await _radar_history(garmin, weeks)
 
     today = date.today().isoformat()
     radar = {
@@ -27,25 +64,45 @@ async def radar(token: str = ""):
         "strength_durability": 30, "vo2max_speed": 30, "fatigue_resistance": 30,
     }
 
-    # VO2max
+    # Weekly stats
+    activities = None
+    try:
+        activities = (await garmin.run(_sync_activities, min_count=30))[:30]
+        now = datetime.now()
+        week_ago = now.timestamp() - 7 * 86400
+        weekly_km = 0
+        weekly_runs = 0
+        for a in activities:
+            start_str = a.get("startTimeLocal") or a.get("startTimeGMT") or ""
+            try:
+                act_dt = datetime.strptime(start_str[:19], "%Y-%m-%d %H:%M:%S")
+                if act_dt.timestamp() > week_ago:
+                    weekly_km += a.get("distance", 0) / 1000
+                    weekly_runs += 1
+            except (ValueError, IndexError):
+                continue
+        radar["aerobic_endurance"] = min(100, max(5, int(weekly_km * 1.3)))
+        if weekly_runs >= 5 and weekly_km > 30:
+            radar["strength_durability"] = 70
+        elif weekly_runs >= 3:
+            radar["strength_durability"] = 50
+        else:
+            radar["strength_durability"] = 25
+    except Exception:
+        pass
+
+    # VO2max — from the per-user last-known index (shared with /api/metrics);
+    # the activity list fetched above is what triggers a recheck on new runs
     try:
-        for days_back in range(0, 30):
-            qdate = (date.today() - timedelta(days=days_back)).isoformat()
-            mm = client.get_max_metrics(qdate)
-            vo2 = None
-            if isinstance(mm, list) and mm:
-                vo2 = mm[0].get("generic", {}).get("vo2MaxValue")
-            elif isinstance(mm, dict):
-                vo2 = mm.get("generic", {}).get("vo2MaxValue")
-            if vo2 is not None:
-                radar["vo2max_speed"] = min(100, max(10, int((vo2 - 28) * 2.2)))
-                break
+        vo2 = (await garmin.run(_lookup_vo2max, _user_id(_get_session(token)), activities)).get("vo2max")
+        if vo2 is not None:
+            radar["vo2max_speed"] = min(100, max(10, int((vo2 - 28) * 2.2)))
     except Exception:
         pass
 
     # Training readiness
     try:
-        tr = client.get_training_readiness(today)
+        tr = await garmin.get_training_readiness(today)
         if isinstance(tr, list) and tr:
             score = tr[0].get("score", 0)
             radar["fatigue_resistance"] = min(100, max(10, score))
@@ -61,7 +118,7 @@ async def radar(token: str = ""):
 
     # HRV status
     try:
-        hrv = client.get_hrv_data(today)
+        hrv = await garmin.get_hrv_data(today)
         if hrv and "hrvSummary" in hrv:
             status = (hrv["hrvSummary"].get("status") or "").upper()
             avg = hrv["hrvSummary"].get("weeklyAvg", 0)
@@ -74,30 +131,4 @@ async def radar(token: str = ""):
     except Exception:
         pass
 
-    # Weekly stats
-    try:
-        activities = client.get_activities(0, 30)
-        now = datetime.now()
-        week_ago = now.timestamp() - 7 * 86400
-        weekly_km = 0
-        weekly_runs = 0
-        for a in activities:
-            start_str = a.get("startTimeLocal") or a.get("startTimeGMT") or ""
-            try:
-                act_dt = datetime.strptime(start_str[:19], "%Y-%m-%d %H:%M:%S")
-                if act_dt.timestamp() > week_ago:
-                    weekly_km += a.get("distance", 0) / 1000
-                    weekly_runs += 1
-            except (ValueError, IndexError):
-                continue
-        radar["aerobic_endurance"] = min(100, max(5, int(weekly_km * 1.3)))
-        if weekly_runs >= 5 and weekly_km > 30:
-            radar["strength_durability"] = 70
-        elif weekly_runs >= 3:
-            radar["strength_durability"] = 50
-        else:
-            radar["strength_durability"] = 25
-    except Exception:
-        pass
-
     return JSONResponse(content={"radar": radar})
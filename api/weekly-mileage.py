@@ -1,13 +1,13 @@
 """GET /api/weekly-mileage — Fetch running activities grouped by week."""
 
-from fastapi.responses import JSONResponse
-from datetime import datetime, date, timedelta
 # Add the api/ directory to Python's search path so lib._shared can be found
 # when running as a Vercel serverless function (cwd is project root, not api/)
 import sys, os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from lib._shared import _get_garmin_client, create_app
+from lib._shared import JSONResponse, create_app
+from lib._garmin import _get_async_garmin_client, _sync_activity_store
+from lib._payloads import WEEKLY_MILEAGE_MAX_WEEKS, build_weekly_mileage, weekly_start_date
 
 # create_app() wraps the app with prefix-stripping + CORS middleware for
 # Vercel file-based mode (strips /api/weekly-mileage so routes at "/" match)
@@ -15,50 +15,26 @@ app = create_app("weekly-mileage")
 
 
 @app.get("/")
-async def weekly_mileage(token: str = "", weeks: int = 12):
-    """Fetch running activities for the last N weeks and group by week."""
-    client = _get_garmin_client(token)
+async def weekly_mileage(token: str = "", weeks: int = 12, refresh: bool = False):
+    """Return running distance, count, duration and elevation for the last N weeks.
+
+    Served from the per-user weekly rollups kept in the activity store.
+    The sync only downloads activities it hasn't seen (plus a one-off
+    backfill the first time a longer window is requested) and only
+    recomputes the weeks they fall in, so any `weeks` value is answered in
+    O(weeks) with no upstream call when nothing new has synced. `weeks` is
+    limited to 1–WEEKLY_MILEAGE_MAX_WEEKS.
+    """
+    if not 1 <= weeks <= WEEKLY_MILEAGE_MAX_WEEKS:
+        return JSONResponse(status_code=400, content={
+            "error": f"weeks must be between 1 and {WEEKLY_MILEAGE_MAX_WEEKS}."
+        })
 
-    today = date.today()
-    start_date = today - timedelta(days=today.weekday() + (weeks - 1) * 7)
-    start_str = start_date.isoformat()
-    end_str = today.isoformat()
+    garmin = await _get_async_garmin_client(token, refresh)
 
     try:
-        activities = client.get_activities_by_date(start_str, end_str, activitytype="running")
+        store = await garmin.run(_sync_activity_store, since=weekly_start_date(weeks))
     except Exception as e:
         return JSONResponse(status_code=502, content={"error": f"Failed to fetch activities: {str(e)}"})
 
-    # Build week buckets keyed by Monday date
-    week_buckets = {}
-    for i in range(weeks):
-        week_start = start_date + timedelta(days=i * 7)
-        week_buckets[week_start.isoformat()] = {
-            "week_start": week_start.isoformat(),
-            "mileage_km": 0.0,
-            "run_count": 0,
-        }
-
-    # Sum distance and count per week
-    for a in activities:
-        start_time = a.get("startTimeLocal") or a.get("startTimeGMT") or ""
-        try:
-            act_dt = datetime.strptime(start_time[:19], "%Y-%m-%d %H:%M:%S")
-        except (ValueError, IndexError):
-            continue
-        act_monday = act_dt - timedelta(days=act_dt.weekday())
-        key = act_monday.date().isoformat()
-        if key in week_buckets:
-            week_buckets[key]["mileage_km"] += a.get("distance", 0) / 1000
-            week_buckets[key]["run_count"] += 1
-
-    result = []
-    for key in sorted(week_buckets.keys()):
-        bucket = week_buckets[key]
-        result.append({
-            "week_start": bucket["week_start"],
-            "mileage_km": round(bucket["mileage_km"], 1),
-            "run_count": bucket["run_count"],
-        })
-
-    return JSONResponse(content={"weeks": result})
+    return JSONResponse(content={"weeks": build_weekly_mileage(store["weekly"], weeks)})
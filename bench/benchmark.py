@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""Offline benchmark for the race-goal API functions.
+
+Drives each api/*.py ASGI app in-process, with Garmin, Upstash Redis and
+OpenAI replaced by the stand-ins in bench/fakes.py. No credentials and no
+network: Garmin responses are replayed from a fixture, and every upstream
+call costs a configurable latency, so the number of calls an endpoint
+makes shows up in its latency the way it would in production.
+
+Each function is loaded with its own copy of lib/, the way every api/*.py
+file is an isolated Vercel function with its own memory. They all share
+one fake Redis, as they share the real Upstash database.
+
+For every scenario it reports latency percentiles and the average number
+of Garmin calls (and logins), Redis round trips and model calls per
+request. The first request of a scenario runs against cold caches and is
+reported separately from the rest.
+
+Usage:
+  python bench/benchmark.py                          # every scenario
+  python bench/benchmark.py metrics dashboard-load   # just these
+  python bench/benchmark.py -n 50 --concurrency 5
+  python bench/benchmark.py --fresh-user             # cold caches every time
+  python bench/benchmark.py --garmin-latency 0 --redis-latency 0 --openai-latency-scale 0
+  python bench/benchmark.py --json > before.json     # for comparing runs
+
+Scenarios are the endpoints plus "dashboard-load", which is what the
+dashboard does on page load: check-session, then dashboard, then
+ai-radar-stream, one after another.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from typing import Dict, List
+from urllib.parse import parse_qsl
+
+import httpx
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(BENCH_DIR), "api")
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+sys.path.insert(0, BENCH_DIR)
+
+from fakes import FakeOpenAI, FakeRedis, GarminReplay, track  # noqa: E402
+
+# Race goal saved on every benchmark session (what onboarding would store)
+RACE_GOAL = {
+    "purpose": "race", "distance": "21.1km", "time_target": "1:45:00",
+    "race_date": "2027-03-14", "experience": "intermediate",
+    "weekly_mileage": "40", "mileage_unit": "km", "gender": "", "age": "31",
+    "saved_at": "2026-01-01T00:00:00",
+}
+
+# Stats reported per request, in this order
+STATS = (
+    ("garmin_calls", "garmin"),
+    ("garmin_logins", "logins"),
+    ("redis_commands", "redis"),
+    ("openai_calls", "model"),
+    ("openai_prompt_tokens", "prompt_tok"),
+)
+
+
+# --- Functions ---
+
+class Functions:
+    """Loads api/*.py functions on demand, each isolated, with fakes installed."""
+
+    def __init__(self, redis: FakeRedis, garmin: GarminReplay, openai: FakeOpenAI):
+        self.redis = redis
+        self.garmin_class = garmin.client_class()
+        self.openai = openai
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._shared = None  # any function's lib._shared, for creating sessions
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        if name not in self._clients:
+            app = self._load(name).app
+            self._clients[name] = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None,
+            )
+        return self._clients[name]
+
+    def _load(self, name: str):
+        # Drop any lib modules a previously loaded function imported, so this
+        # function gets its own copy — its own warm client cache, response
+        # cache and so on, like a separate Vercel instance.
+        for mod in [m for m in sys.modules if m == "lib" or m.startswith("lib.")]:
+            del sys.modules[mod]
+        spec = importlib.util.spec_from_file_location(f"bench_{name.replace('-', '_')}", os.path.join(API_DIR, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        shared = sys.modules["lib._shared"]
+        counting = shared._CountingRedis(self.redis)
+        libs = [m for n, m in sys.modules.items() if n.startswith("lib.")]
+        self.redis.register_scripts(*libs)
+        for lib in libs:
+            if hasattr(lib, "_redis"):
+                lib._redis = counting
+            if hasattr(lib, "Garmin"):
+                lib.Garmin = self.garmin_class
+        # garmin-auth imports Garmin itself; the AI endpoints import the
+        # OpenAI client factory by name
+        if hasattr(module, "Garmin"):
+            module.Garmin = self.garmin_class
+        if hasattr(module, "_get_openai_client"):
+            module._get_openai_client = lambda api_key: self.openai
+        self._shared = self._shared or shared
+        return module
+
+    def new_session(self, n: int) -> str:
+        """Create a logged-in session for a distinct benchmark user."""
+        if self._shared is None:
+            self._load("check-session")
+        token = str(uuid.uuid4())
+        self._shared._save_session(token, {
+            "email": f"runner{n}@bench.invalid",
+            "password": "bench",
+            "garmin_tokens": json.dumps({"di_token": "bench", "di_refresh_token": "bench"}),
+            "race_goal": RACE_GOAL,
+            "display_name": "Bench Runner",
+            "full_name": "Bench Runner",
+            "profile_image_url": "",
+            "device_name": "Forerunner 965",
+        })
+        return token
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.aclose()
+
+
+# --- Scenarios ---
+#
+# Each step is (function, method, path, request kwargs builder). The builder
+# gets the session token. A scenario's latency is the wall time of all its
+# steps in order.
+
+def _photo() -> bytes:
+    """A phone-photo-sized JPEG (noise, so it doesn't compress away)."""
+    image = Image.merge("RGB", [Image.effect_noise((3024, 4032), 40 + i * 10) for i in range(3)])
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _scenarios(photo: bytes) -> Dict[str, dict]:
+    # httpx replaces a URL's query string with params, so the query goes in params too
+    get = lambda fn, query="": (
+        fn, "GET", f"/api/{fn}", lambda t: {"params": {**dict(parse_qsl(query.lstrip("?"))), "token": t}},
+    )
+    return {
+        "check-session": {"steps": [get("check-session")]},
+        "metrics": {"steps": [get("metrics")]},
+        "activities": {"steps": [get("activities", "?limit=20")]},
+        "weekly-mileage": {"steps": [get("weekly-mileage", "?weeks=12")]},
+        "radar": {"steps": [get("radar")]},
+        "radar-history": {"steps": [get("radar", "?weeks=12")]},
+        "dashboard": {"steps": [get("dashboard", "?limit=20&weeks=12")]},
+        "ai-radar": {"steps": [get("ai-radar")]},
+        "ai-radar-stream": {"steps": [get("ai-radar-stream")]},
+        "onboarding": {"steps": [(
+            "onboarding", "POST", "/api/onboarding",
+            lambda t: {"data": {**{k: v for k, v in RACE_GOAL.items() if k != "saved_at"}, "token": t}},
+        )]},
+        "analyse": {"steps": [(
+            "analyse", "POST", "/api/analyse",
+            lambda t: {
+                "files": [("images", (f"run{i}.jpg", photo, "image/jpeg")) for i in range(2)],
+                "data": {"profile": json.dumps({"age": 31, "gender": "", "experience": "intermediate"})},
+            },
+        )]},
+        "garmin-auth": {"steps": [(
+            "garmin-auth", "POST", "/api/garmin-auth",
+            lambda t: {"json": {"email": f"{t}@bench.invalid", "password": "bench"}},
+        )]},
+        # Logging out ends the session, so every iteration needs a new one
+        "logout": {"fresh_session": True, "steps": [(
+            "logout", "DELETE", "/api/logout", lambda t: {"params": {"token": t}},
+        )]},
+        "dashboard-load": {"steps": [
+            get("check-session"),
+            get("dashboard", "?limit=20&weeks=12"),
+            get("ai-radar-stream"),
+        ]},
+    }
+
+
+async def _run_once(functions: Functions, steps: list, token: str) -> dict:
+    """Run one iteration of a scenario; returns its latency, stats and statuses."""
+    with track() as stats:
+        statuses = []
+        started = time.perf_counter()
+        for fn, method, path, build in steps:
+            resp = await functions.client(fn).request(method, path, **build(token))
+            statuses.append(resp.status_code)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    return {"ms": elapsed_ms, "stats": dict(stats), "statuses": statuses}
+
+
+def _percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _summarize(runs: List[dict]) -> dict:
+    latencies = [r["ms"] for r in runs]
+    summary = {
+        "requests": len(runs),
+        "p50_ms": round(_percentile(latencies, 50), 1),
+        "p90_ms": round(_percentile(latencies, 90), 1),
+        "p99_ms": round(_percentile(latencies, 99), 1),
+        "max_ms": round(max(latencies), 1),
+        "mean_ms": round(statistics.fmean(latencies), 1),
+        "errors": sum(1 for r in runs if any(s >= 400 for s in r["statuses"])),
+    }
+    for stat, _ in STATS:
+        summary[stat] = round(statistics.fmean(r["stats"].get(stat, 0) for r in runs), 2)
+    # Per-method Garmin call counts (summed), to see where the calls go
+    methods: Dict[str, int] = {}
+    for r in runs:
+        for k, v in r["stats"].items():
+            if k.startswith("garmin:"):
+                methods[k[7:]] = methods.get(k[7:], 0) + v
+    summary["garmin_methods"] = dict(sorted(methods.items(), key=lambda kv: kv[1], reverse=True))
+    return summary
+
+
+async def run_scenario(functions: Functions, scenario: dict, iterations: int,
+                       concurrency: int, fresh_user: bool, user_seq: list) -> dict:
+    """First (cold-cache) request, then the rest in batches of `concurrency`."""
+    fresh = fresh_user or scenario.get("fresh_session", False)
+    # Import the functions up front so import time isn't counted as latency
+    # (import-report.py measures that)
+    for fn, *_ in scenario["steps"]:
+        functions.client(fn)
+
+    def session() -> str:
+        user_seq[0] += 1
+        return functions.new_session(user_seq[0])
+
+    token = session()
+    first = await _run_once(functions, scenario["steps"], token)
+    runs = []
+    remaining = iterations - 1
+    while remaining > 0:
+        batch = min(concurrency, remaining)
+        tokens = [session() if fresh else token for _ in range(batch)]
+        runs += await asyncio.gather(*(_run_once(functions, scenario["steps"], t) for t in tokens))
+        remaining -= batch
+    return {"first": _summarize([first]), "rest": _summarize(runs) if runs else None}
+
+
+# --- Output ---
+
+def _print_table(results: Dict[str, dict]):
+    stat_cols = "".join(f"{label:>11}" for _, label in STATS)
+    print(f"{'scenario':<16}{'':>6}{'n':>5}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{stat_cols}{'errors':>8}")
+    for name, result in results.items():
+        for label, s in (("first", result["first"]), ("warm", result["rest"])):
+            if not s:
+                continue
+            stats = "".join(f"{s[stat]:>11g}" for stat, _ in STATS)
+            print(
+                f"{name if label == 'first' else '':<16}{label:>6}{s['requests']:>5}"
+                f"{s['p50_ms']:>9.0f}{s['p90_ms']:>9.0f}{s['p99_ms']:>9.0f}{s['max_ms']:>9.0f}"
+                f"{stats}{s['errors']:>8}"
+            )
+    print("\nLatencies in ms; counts are per request. 'first' runs against cold caches.")
+
+
+async def main():
+    scenario_names = list(_scenarios(b""))
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("scenarios", nargs="*", help=f"default: all ({', '.join(scenario_names)})")
+    parser.add_argument("-n", "--iterations", type=int, default=20, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent requests after the first")
+    parser.add_argument("--fresh-user", action="store_true",
+                        help="a new user (cold caches) for every request instead of one per scenario")
+    parser.add_argument("--garmin-fixture", default=os.path.join(FIXTURES_DIR, "garmin.json"))
+    parser.add_argument("--openai-fixture", default=os.path.join(FIXTURES_DIR, "openai.json"))
+    parser.add_argument("--garmin-latency", type=float,
+                        help="flat per-call Garmin latency in ms (default: per-method values from the fixture)")
+    parser.add_argument("--redis-latency", type=float, default=4.0, help="per-command Redis latency in ms")
+    parser.add_argument("--openai-latency-scale", type=float, default=1.0,
+                        help="multiplier for the fixture's model latencies (0 to skip them)")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    unknown = [s for s in args.scenarios if s not in scenario_names]
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(unknown)}. Available: {', '.join(scenario_names)}")
+
+    # The AI endpoints refuse to run without a key; the fake client ignores it
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    # One log line per request would drown the report
+    os.environ.setdefault("REQUEST_LOG", "0")
+
+    functions = Functions(
+        FakeRedis(args.redis_latency),
+        GarminReplay(args.garmin_fixture, args.garmin_latency),
+        FakeOpenAI(args.openai_fixture, args.openai_latency_scale),
+    )
+    selected = args.scenarios or scenario_names
+    # Encoding the photo takes a while — do it once, before any timing
+    scenarios = _scenarios(_photo() if "analyse" in selected else b"")
+    results = {}
+    user_seq = [0]
+    try:
+        for name in selected:
+            results[name] = await run_scenario(
+                functions, scenarios[name], max(args.iterations, 1),
+                max(args.concurrency, 1), args.fresh_user, user_seq,
+            )
+            if not args.json:
+                print(f"  {name} done", file=sys.stderr)
+    finally:
+        await functions.close()
+
+    if args.json:
+        print(json.dumps({
+            "settings": {k: v for k, v in vars(args).items() if k != "json"},
+            "results": results,
+        }, indent=2))
+    else:
+        _print_table(results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,444 @@
+"""Offline stand-ins for Garmin, Upstash Redis and OpenAI used by the benchmark.
+
+None of these talk to the network. Each one sleeps for a configurable
+latency per call so that the counts the endpoints make (Garmin calls, Redis
+round trips, model calls) show up in wall time the way they would in
+production, and each one counts its calls into the per-request stats of
+whoever made them (see track()).
+
+  GarminReplay  replays captured garminconnect responses from a fixture file
+                (bench/fixtures/garmin.json, or one made by bench/record.py).
+                Dates are shifted so the recording day replays as "today".
+  FakeRedis     the subset of upstash_redis.Redis that lib/ uses — GET, SET,
+                GETEX, MGET, DELETE and EVAL of lib's own Lua scripts, which
+                are re-implemented in Python (there's no Lua here).
+  FakeOpenAI    an AsyncOpenAI-shaped client returning canned replies from
+                bench/fixtures/openai.json, streamed in chunks when asked.
+"""
+
+import asyncio
+import contextvars
+import copy
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from typing import Optional
+
+
+# --- Per-request stats ---
+#
+# The benchmark runs each request in its own task with a fresh stats dict in
+# this ContextVar. lib's fan-out helpers copy the request context onto worker
+# threads, so Garmin calls made there are counted against the right request.
+_stats: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("bench_stats", default=None)
+_stats_lock = threading.Lock()
+
+
+def count(name: str, n: int = 1):
+    """Add n to the named stat of the current request (no-op outside one)."""
+    stats = _stats.get()
+    if stats is not None:
+        with _stats_lock:
+            stats[name] = stats.get(name, 0) + n
+
+
+@contextmanager
+def track():
+    """Collect stats for everything run inside the block (in this context)."""
+    stats = {}
+    reset = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(reset)
+
+
+# --- Garmin ---
+
+_ACTIVITY_TIME_FIELDS = ("startTimeLocal", "startTimeGMT")
+
+
+class GarminReplay:
+    """Replays a Garmin fixture and hands out Garmin-compatible client classes.
+
+    Fixture layout (see bench/fixtures/garmin.json):
+      recorded_on  the day the fixture was captured (YYYY-MM-DD)
+      latency_ms   per-method latency; "default" for anything not listed,
+                   "login" for a password login, "token_login" for a resume
+                   from stored tokens
+      activities   newest-first activity list, served by get_activities and
+                   get_activities_by_date
+      daily        {method: {days_before_recording: response, "default": ...}}
+      static       {method or "connectapi:<path>": response}
+    """
+
+    def __init__(self, path: str, latency_ms: Optional[float] = None):
+        with open(path) as f:
+            fixture = json.load(f)
+        self.display_name = fixture.get("display_name", "bench")
+        self.daily = fixture.get("daily", {})
+        self.static = fixture.get("static", {})
+        self.latency_ms = dict(fixture.get("latency_ms", {}))
+        if latency_ms is not None:
+            # One flat latency for every call except the two logins
+            self.latency_ms = {
+                k: v for k, v in self.latency_ms.items() if k in ("login", "token_login")
+            }
+            self.latency_ms["default"] = latency_ms
+
+        # Shift every activity so the recording day lines up with today
+        recorded_on = date.fromisoformat(fixture.get("recorded_on", date.today().isoformat()))
+        shift = timedelta(days=(date.today() - recorded_on).days)
+        self.activities = []
+        for a in fixture.get("activities", []):
+            a = dict(a)
+            for field in _ACTIVITY_TIME_FIELDS:
+                if a.get(field):
+                    ts = datetime.strptime(a[field], "%Y-%m-%d %H:%M:%S") + shift
+                    a[field] = ts.strftime("%Y-%m-%d %H:%M:%S")
+            self.activities.append(a)
+
+    def client_class(self):
+        """A drop-in replacement for garminconnect.Garmin bound to this replay."""
+        replay = self
+
+        class Garmin(_ReplayClient):
+            _replay = replay
+
+        return Garmin
+
+    def call(self, method: str, *args, **kwargs):
+        """Serve one upstream call: sleep for its latency, count it, respond."""
+        latency = self.latency_ms.get(method, self.latency_ms.get("default", 0))
+        time.sleep(latency / 1000)
+        count("garmin_logins" if method in ("login", "token_login") else "garmin_calls")
+        count(f"garmin:{method}")
+        return copy.deepcopy(self._respond(method, args, kwargs))
+
+    def _respond(self, method: str, args: tuple, kwargs: dict):
+        if method in ("login", "token_login"):
+            return None
+        if method == "get_activities":
+            start, limit = (list(args) + [0, 20])[:2]
+            start, limit = kwargs.get("start", start), kwargs.get("limit", limit)
+            acts = self._of_type(kwargs.get("activitytype"))
+            return acts[int(start):int(start) + int(limit)]
+        if method == "get_activities_by_date":
+            startdate, enddate = (list(args) + [None, None])[:2]
+            startdate = kwargs.get("startdate", startdate) or "0000-00-00"
+            enddate = kwargs.get("enddate", enddate) or "9999-99-99"
+            acts = [
+                a for a in self._of_type(kwargs.get("activitytype"))
+                if startdate <= (a.get("startTimeLocal") or "")[:10] <= enddate
+            ]
+            return list(reversed(acts)) if kwargs.get("sortorder") == "asc" else acts
+        if method == "connectapi":
+            return self.static.get(f"connectapi:{args[0] if args else kwargs.get('path')}")
+        if method == "get_hrv_data_range":
+            return {"hrvSummaries": [
+                {**r["hrvSummary"], "calendarDate": day}
+                for day, r in self._range("get_hrv_data", *args) if isinstance(r, dict) and r.get("hrvSummary")
+            ]}
+        if method == "get_max_metrics_range":
+            return [
+                {**m, "generic": {**(m.get("generic") or {}), "calendarDate": day}}
+                for day, r in self._range("get_max_metrics", *args) for m in r or []
+            ]
+        if method in self.daily:
+            by_offset = self.daily[method]
+            try:
+                offset = (date.today() - date.fromisoformat(str(args[0]))).days
+            except (IndexError, ValueError):
+                offset = None
+            return by_offset.get(str(offset), by_offset.get("default"))
+        return self.static.get(method)
+
+    def _range(self, method: str, start: str, end: str) -> list:
+        """[(day, response)] of a per-day method over a date range — how the
+        range endpoints are served from the per-day fixture."""
+        day, last, days = date.fromisoformat(start), date.fromisoformat(end), []
+        while day <= last:
+            days.append((day.isoformat(), self._respond(method, (day.isoformat(),), {})))
+            day += timedelta(days=1)
+        return days
+
+    def _of_type(self, activitytype: Optional[str]) -> list:
+        if not activitytype:
+            return self.activities
+        return [a for a in self.activities if a.get("activityType", {}).get("typeKey") == activitytype]
+
+
+class _ReplayTokens:
+    """Stands in for garminconnect's inner native client (client.client)."""
+
+    def dumps(self) -> str:
+        return json.dumps({"di_token": "bench", "di_refresh_token": "bench"})
+
+
+class _ReplayClient:
+    """Everything lib/ and garmin-auth use from garminconnect.Garmin."""
+
+    _replay: GarminReplay
+
+    def __init__(self, email: Optional[str] = None, password: Optional[str] = None, *args, **kwargs):
+        self.display_name = None
+        self.client = _ReplayTokens()
+
+    def login(self, tokenstore: Optional[str] = None):
+        self._replay.call("token_login" if tokenstore else "login")
+        self.display_name = self._replay.display_name
+        return None, None
+
+    def connectapi(self, path: str, **kwargs):
+        return self._replay.call("connectapi", path, **kwargs)
+
+    def __getattr__(self, name: str):
+        if not name.startswith("get_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._replay.call(name, *args, **kwargs)
+
+
+# --- Redis ---
+
+class FakeRedis:
+    """In-memory Redis with Upstash's sync client API, for one benchmark run.
+
+    Shared by every function in the run, like the real Upstash database.
+    Every command sleeps latency_ms (the sync Upstash client blocks too).
+    EVAL only runs scripts registered with register_scripts().
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self._lock = threading.RLock()
+        self._values: dict = {}    # key -> str, dict (hash) or dict (zset: member -> score)
+        self._expires: dict = {}   # key -> absolute expiry (time.time())
+        self._scripts: dict = {}   # script source -> handler(keys, args)
+
+    def register_scripts(self, *modules):
+        """Map lib's Lua scripts (by source text) to their Python equivalents.
+
+        Each function loads its own copy of lib/, but the script text is the
+        same, so registering once per copy is idempotent.
+        """
+        handlers = {
+            "_UPDATE_SESSION_SCRIPT": self._update_session,
+            "_BOUNDED_SET_SCRIPT": self._bounded_set,
+            "_THROTTLE_SCRIPT": self._throttle,
+            "_TRIP_SCRIPT": self._trip,
+            "_METRICS_SCRIPT": self._metrics,
+        }
+        for module in modules:
+            for name, handler in handlers.items():
+                script = getattr(module, name, None)
+                if script:
+                    self._scripts[script] = handler
+
+    # Commands
+
+    def get(self, key):
+        with self._command():
+            return self._get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._command():
+            if nx and self._get(key) is not None:
+                return None
+            self._set(key, str(value), ex)
+            return "OK"
+
+    def getex(self, key, ex=None):
+        with self._command():
+            value = self._get(key)
+            if value is not None and ex:
+                self._expires[key] = time.time() + int(ex)
+            return value
+
+    def mget(self, *keys):
+        with self._command():
+            return [self._get(k) for k in keys]
+
+    def delete(self, *keys):
+        with self._command():
+            return sum(self._del(k) for k in keys)
+
+    def hgetall(self, key):
+        with self._command():
+            return dict(self._container(key)) if self._live(key) else {}
+
+    def eval(self, script, keys=None, args=None):
+        with self._command():
+            handler = self._scripts.get(script)
+            if handler is None:
+                raise NotImplementedError(
+                    "FakeRedis can't run this Lua script — add a Python version "
+                    "to FakeRedis.register_scripts()"
+                )
+            return handler(list(keys or []), [str(a) for a in (args or [])])
+
+    # Internals (callers hold the lock)
+
+    @contextmanager
+    def _command(self):
+        time.sleep(self.latency)
+        count("redis_commands")
+        with self._lock:
+            yield
+
+    def _live(self, key) -> bool:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._del(key)
+        return key in self._values
+
+    def _get(self, key):
+        return self._values[key] if self._live(key) and isinstance(self._values[key], str) else None
+
+    def _set(self, key, value, ex=None):
+        self._values[key] = value
+        if ex:
+            self._expires[key] = time.time() + int(ex)
+        else:
+            self._expires.pop(key, None)
+
+    def _del(self, key) -> int:
+        self._expires.pop(key, None)
+        return 1 if self._values.pop(key, None) is not None else 0
+
+    def _container(self, key) -> dict:
+        if not self._live(key) or not isinstance(self._values[key], dict):
+            self._values[key] = {}
+        return self._values[key]
+
+    # Python versions of lib's Lua scripts — keep in step with the originals
+
+    def _update_session(self, keys, args):
+        raw = self._get(keys[0])
+        if raw is None:
+            return None
+        sess = json.loads(raw)
+        sess.update(json.loads(args[0]))
+        self._set(keys[0], json.dumps(sess), int(float(args[1])))
+        return 1
+
+    def _bounded_set(self, keys, args):
+        value, ttl, now, max_entries = args[0], int(float(args[1])), float(args[2]), int(float(args[3]))
+        created, if_missing = float(args[4]), args[5] == "1"
+        if if_missing and self._get(keys[0]) is not None:
+            return 0
+        self._set(keys[0], value, max(1, ttl - (now - created)))
+        index = self._container(keys[1])
+        index[keys[0]] = created
+        for member in [m for m, score in index.items() if score <= now - ttl]:
+            del index[member]
+        excess = len(index) - max_entries
+        if excess > 0:
+            for member in sorted(index, key=index.get)[:excess]:
+                self._del(member)
+                del index[member]
+        self._expires[keys[1]] = time.time() + ttl
+        return 1
+
+    def _throttle(self, keys, args):
+        if self._live(keys[0]):
+            return -1
+        now = float(args[0])
+        ur, ub, gr, gb = (float(a) for a in args[1:5])
+
+        def level(key, rate, burst):
+            bucket = self._container(key) if self._live(key) else {}
+            tokens = float(bucket.get("t", burst))
+            ts = float(bucket.get("ts", now))
+            return min(burst, tokens + max(0.0, now - ts) / 1000 * rate)
+
+        u, g = level(keys[1], ur, ub), level(keys[2], gr, gb)
+        if u < 1 or g < 1:
+            return math.ceil(max((1 - u) / ur, (1 - g) / gr) * 1000)
+        for key, tokens, rate, burst in ((keys[1], u, ur, ub), (keys[2], g, gr, gb)):
+            self._values[key] = {"t": str(tokens - 1), "ts": args[0]}
+            self._expires[key] = time.time() + burst / rate
+        return 0
+
+    def _trip(self, keys, args):
+        n = int(self._get(keys[0]) or 0) + 1
+        self._values[keys[0]] = str(n)
+        if n == 1:
+            self._expires[keys[0]] = time.time() + int(float(args[0]))
+        if n >= int(float(args[1])):
+            self._set(keys[1], "1", int(float(args[2])))
+            self._del(keys[0])
+        return n
+
+    def _metrics(self, keys, args):
+        totals = self._container(keys[0])
+        for field, increment in zip(args[1::2], args[2::2]):
+            totals[field] = str(float(totals.get(field, 0)) + float(increment))
+        self._expires[keys[0]] = time.time() + int(args[0])
+        return 1
+
+
+# --- OpenAI ---
+
+class FakeOpenAI:
+    """AsyncOpenAI-shaped client replaying canned chat completions.
+
+    The reply is picked by request shape: messages with image parts get the
+    posture ("analyse") reply, anything else the AI radar reply. Token
+    counts are estimates (4 characters per token, a flat 765 per image) —
+    good enough to compare prompt sizes between runs, not to bill.
+    """
+
+    IMAGE_TOKENS = 765
+
+    def __init__(self, path: str, latency_scale: float = 1.0):
+        with open(path) as f:
+            fixture = json.load(f)
+        self.replies = {k: json.dumps(v) for k, v in fixture["replies"].items()}
+        self.latency_ms = {k: v * latency_scale for k, v in fixture.get("latency_ms", {}).items()}
+        self.chunk_chars = fixture.get("stream_chunk_chars", 24)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, *, messages: list, stream: bool = False, **kwargs):
+        kind = "analyse" if any(isinstance(m.get("content"), list) for m in messages) else "ai-radar"
+        text = self.replies[kind]
+        latency = self.latency_ms.get(kind, 0) / 1000
+        usage = SimpleNamespace(
+            prompt_tokens=self._prompt_tokens(messages),
+            completion_tokens=len(text) // 4,
+        )
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        count("openai_calls")
+        count("openai_prompt_tokens", usage.prompt_tokens)
+        count("openai_completion_tokens", usage.completion_tokens)
+
+        if not stream:
+            await asyncio.sleep(latency)
+            message = SimpleNamespace(content=text)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+        return self._stream(text, latency, usage)
+
+    async def _stream(self, text: str, latency: float, usage):
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        for piece in pieces:
+            await asyncio.sleep(latency / len(pieces))
+            delta = SimpleNamespace(content=piece)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+    def _prompt_tokens(self, messages: list) -> int:
+        chars = images = 0
+        for m in messages:
+            content = m.get("content")
+            if isinstance(content, str):
+                chars += len(content)
+                continue
+            for part in content or []:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                else:
+                    images += 1
+        return chars // 4 + images * self.IMAGE_TOKENS
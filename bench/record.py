@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Capture a Garmin replay fixture for bench/benchmark.py from a real account.
+
+Logs in with garminconnect, makes the same kinds of calls the endpoints
+make and writes them in the layout GarminReplay expects. Each method's
+median observed latency is saved too, so replays cost what the real API
+did when the fixture was captured.
+
+Usage:
+  GARMIN_EMAIL=... GARMIN_PASSWORD=... python bench/record.py --out bench/fixtures/mine.json
+  python bench/benchmark.py --garmin-fixture bench/fixtures/mine.json
+
+The output contains your real activities and health data — keep it out of
+the repository. The committed bench/fixtures/garmin.json is synthetic.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from garminconnect import Garmin
+
+# Per-day methods the endpoints call (see lib/_payloads.py, radar.py and
+# lib/_garmin.py's VO2max lookup)
+DAILY_METHODS = (
+    "get_training_readiness", "get_hrv_data", "get_user_summary", "get_fitnessage_data",
+    "get_body_battery", "get_sleep_data", "get_all_day_stress", "get_max_metrics",
+)
+PROFILE_PATH = "/userprofile-service/socialProfile"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--out", required=True, help="fixture file to write")
+    parser.add_argument("--days", type=int, default=14, help="days of daily wellness data to capture")
+    parser.add_argument("--activities", type=int, default=200, help="most recent activities to capture")
+    args = parser.parse_args()
+
+    email, password = os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD")
+    if not email or not password:
+        sys.exit("Set GARMIN_EMAIL and GARMIN_PASSWORD.")
+
+    latencies = {}
+
+    def timed(method: str, fn, *fn_args):
+        started = time.perf_counter()
+        try:
+            return fn(*fn_args)
+        except Exception as e:
+            print(f"  {method}{fn_args}: {e}", file=sys.stderr)
+            return None
+        finally:
+            latencies.setdefault(method, []).append((time.perf_counter() - started) * 1000)
+
+    client = Garmin(email, password)
+    timed("login", client.login)
+    timed("token_login", Garmin(email, password).login, client.client.dumps())
+
+    activities = []
+    while len(activities) < args.activities:
+        page = timed("get_activities", client.get_activities, len(activities), min(100, args.activities - len(activities)))
+        if not page:
+            break
+        activities += page
+    today = date.today()
+    timed("get_activities_by_date", client.get_activities_by_date,
+          (today - timedelta(days=7)).isoformat(), today.isoformat())
+
+    daily = {method: {} for method in DAILY_METHODS}
+    for offset in range(args.days):
+        qdate = (today - timedelta(days=offset)).isoformat()
+        print(f"  {qdate}", file=sys.stderr)
+        for method in DAILY_METHODS:
+            daily[method][str(offset)] = timed(method, getattr(client, method), qdate)
+    for method in DAILY_METHODS:
+        # Older days the fixture doesn't cover look like days without data
+        daily[method]["default"] = [] if isinstance(daily[method].get("0"), list) else {}
+
+    static = {
+        "get_devices": timed("get_devices", client.get_devices),
+        f"connectapi:{PROFILE_PATH}": timed("connectapi", client.connectapi, PROFILE_PATH),
+    }
+
+    fixture = {
+        "recorded_on": today.isoformat(),
+        "display_name": client.display_name,
+        "latency_ms": {
+            "default": round(statistics.median(v for vs in latencies.values() for v in vs)),
+            **{method: round(statistics.median(vs)) for method, vs in latencies.items()},
+        },
+        "activities": activities,
+        "daily": daily,
+        "static": static,
+    }
+    with open(args.out, "w") as f:
+        json.dump(fixture, f, indent=1)
+    print(f"Wrote {len(activities)} activities and {args.days} days of wellness data to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Cold-start import report for the race-goal serverless functions.
+
+Every api/*.py file is its own Vercel function, so each one pays its full
+import cost on a cold start. This imports each function in a fresh
+interpreter under `python -X importtime` and reports the total import time
+plus the packages that cost the most (summing the self time of every
+module in a package, so the numbers add up to the total).
+
+Usage:
+  python import-report.py                  # table for every function
+  python import-report.py metrics logout   # only these functions
+  python import-report.py --json           # machine-readable, for tracking over time
+  python import-report.py --budget 800     # exit 1 if any function exceeds 800 ms
+
+Run it from the project root with the same virtualenv as `start-dev.sh`.
+Timings vary between runs, so each function is imported --repeat times and
+the fastest run is kept.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(ROOT, "api")
+
+# Loads a function file the way Vercel does (by path, api/ on sys.path)
+LOADER = """
+import importlib.util, sys
+sys.path.insert(0, {api!r})
+spec = importlib.util.spec_from_file_location("function", {path!r})
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+"""
+
+# "import time:       123 |        456 |   package.module"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _functions(names: list) -> list:
+    """Function names (file stems in api/) to report on."""
+    available = sorted(f[:-3] for f in os.listdir(API_DIR) if f.endswith(".py"))
+    if not names:
+        return available
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        sys.exit(f"Unknown function(s): {', '.join(unknown)}. Available: {', '.join(available)}")
+    return names
+
+
+def _measure(name: str) -> dict:
+    """Import one function in a fresh interpreter and parse -X importtime."""
+    path = os.path.join(API_DIR, f"{name}.py")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", LOADER.format(api=API_DIR, path=path)],
+        capture_output=True, text=True, cwd=ROOT,
+    )
+    if proc.returncode != 0:
+        # Last line of the traceback is enough to see what's missing
+        lines = [l for l in proc.stderr.splitlines() if not l.startswith("import time:")]
+        return {"error": lines[-1] if lines else f"exit code {proc.returncode}"}
+
+    packages = defaultdict(int)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, indent, module = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        packages[module.split(".")[0]] += self_us
+        if len(indent) == 1:  # top-level import — cumulative covers its children
+            total_us += cumulative_us
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "packages": {
+            pkg: round(us / 1000, 1)
+            for pkg, us in sorted(packages.items(), key=lambda kv: kv[1], reverse=True)
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("functions", nargs="*", help="function names (default: all api/*.py)")
+    parser.add_argument("--top", type=int, default=5, help="heaviest packages to list per function")
+    parser.add_argument("--repeat", type=int, default=3, help="imports per function; the fastest is kept")
+    parser.add_argument("--budget", type=float, help="fail if any function's import time exceeds this (ms)")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    report = {}
+    for name in _functions(args.functions):
+        runs = [_measure(name) for _ in range(max(args.repeat, 1))]
+        ok = [r for r in runs if "error" not in r]
+        report[name] = min(ok, key=lambda r: r["total_ms"]) if ok else runs[0]
+
+    over = [
+        name for name, r in report.items()
+        if "error" in r or (args.budget is not None and r["total_ms"] > args.budget)
+    ]
+
+    if args.json:
+        print(json.dumps({"python": sys.version.split()[0], "budget_ms": args.budget, "functions": report}, indent=2))
+    else:
+        width = max(len(n) for n in report)
+        for name, r in sorted(report.items(), key=lambda kv: kv[1].get("total_ms", float("inf")), reverse=True):
+            if "error" in r:
+                print(f"{name:<{width}}    failed: {r['error']}")
+                continue
+            flag = "  OVER BUDGET" if name in over else ""
+            heaviest = ", ".join(f"{pkg} {ms:.0f}" for pkg, ms in list(r["packages"].items())[:args.top])
+            print(f"{name:<{width}}  {r['total_ms']:7.1f} ms{flag}   {heaviest}")
+
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
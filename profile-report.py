@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Read a request profile captured by the opt-in request profiler.
+
+Deploy with PROFILE_TOKEN set, then profile one request by sending the
+token as an X-Profile-Token header (or ?profile=<token>):
+
+  curl -sD - -H "X-Profile-Token: $PROFILE_TOKEN" \\
+       "https://terrancehah.com/api/metrics?token=<session token>" -o /dev/null
+
+The response's X-Profile-Id header names the stored profile. This reads
+it through lib._shared, so from the same Redis the functions use (any of
+the env var names it accepts, from the environment or .env), or from
+/tmp/race-profiles/ when running locally without Redis.
+
+Usage:
+  python profile-report.py <id>                  # top functions by wall-clock samples
+  python profile-report.py <id> --clock cpu      # ... by on-CPU samples
+  python profile-report.py <id> --folded > p.txt # folded stacks for speedscope / flamegraph.pl
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+# lib._shared loads .env and resolves the Redis env vars on import
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+from lib._shared import PROFILE_DIR, PROFILE_PREFIX, _redis
+
+
+def _load(profile_id: str) -> dict:
+    if _redis:
+        raw = _redis.get(f"{PROFILE_PREFIX}{profile_id}")
+        if raw:
+            return json.loads(raw)
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    sys.exit(f"Profile {profile_id} not found (expired, or stored by another instance's /tmp).")
+
+
+def _parse(folded: str) -> list:
+    """[(frames root-first, samples)] from folded stack lines."""
+    stacks = []
+    for line in folded.splitlines():
+        stack, _, n = line.rpartition(" ")
+        if stack:
+            stacks.append((stack.split(";"), int(n)))
+    return stacks
+
+
+def _top(stacks: list, n: int) -> tuple:
+    """Most-sampled frames by self samples (leaf) and by total (anywhere on the stack)."""
+    own, total = Counter(), Counter()
+    for frames, samples in stacks:
+        own[frames[-1]] += samples
+        for frame in set(frames):
+            total[frame] += samples
+    return own.most_common(n), total.most_common(n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("id", help="the X-Profile-Id of the profiled response")
+    parser.add_argument("--clock", choices=("wall", "cpu"), default="wall", help="which profile to report")
+    parser.add_argument("--top", type=int, default=25, help="frames to list")
+    parser.add_argument("--folded", action="store_true", help="print folded stacks instead of a summary")
+    args = parser.parse_args()
+
+    profile = _load(args.id)
+    if args.folded:
+        sys.stdout.write(profile[args.clock])
+        return
+
+    stacks = _parse(profile[args.clock])
+    samples = sum(n for _, n in stacks)
+    print(f"{profile['method']} /api/{profile['function']} -> {profile['status']} at {profile['started_at']}")
+    print(f"wall {profile['wall_ms']:.0f} ms, cpu {profile['cpu_ms']:.0f} ms, "
+          f"{profile['samples']} samples every {profile['interval_ms']:g} ms "
+          f"({samples} {args.clock} thread samples)")
+    if not samples:
+        return
+    own, total = _top(stacks, args.top)
+    for title, rows in (("self", own), ("total", total)):
+        print(f"\nTop frames by {title} {args.clock} samples:")
+        for frame, n in rows:
+            print(f"  {n:6d}  {n / samples:6.1%}  {frame}")
+
+
+if __name__ == "__main__":
+    main()
@@ -64,7 +64,7 @@ document.addEventListener('DOMContentLoaded', function () {
     // Charts (calendar, pace distribution, HR scatter) use the initial
     // batch only and are never updated by pagination.
     const ACTIVITIES_PAGE_SIZE = 20;
-    let activitiesOffset = 0;      // Garmin API offset for next fetch
+    let activitiesCursor = null;   // opaque next_cursor for the next "Load more" page
     let fullActivitiesLoaded = []; // accumulated activities on the full page
     let isLoadingMore = false;     // prevents duplicate concurrent fetches
 
@@ -693,23 +693,19 @@ document.addEventListener('DOMContentLoaded', function () {
 
         showOverlay('Loading your training data...');
         try {
-            // Fetch the first batch of activities for both the overview
-            // (5 latest) and the activities page (first 20). Charts use
-            // this same batch and are never updated by pagination.
-            const [metricsResp, activitiesResp, mileageResp] = await Promise.all([
-                apiCall('GET', 'metrics'),
-                apiCall('GET', `activities?limit=${ACTIVITIES_PAGE_SIZE}&offset=0`),
-                apiCall('GET', 'weekly-mileage?weeks=12'),
-            ]);
-            const metricsData = await metricsResp.json();
-            const activitiesData = await activitiesResp.json();
-            const mileageData = await mileageResp.json();
-            if (metricsResp.ok && metricsData.metrics) renderMetrics(metricsData.metrics);
-            if (activitiesResp.ok && activitiesData.activities) {
-                const acts = activitiesData.activities;
+            // One combined request returns metrics, the first batch of
+            // activities (overview shows 5 latest; activities page the first
+            // 20) and weekly mileage — one cold start, one Garmin login and
+            // one activity fetch instead of three. Charts use this same batch
+            // and are never updated by pagination.
+            const resp = await apiCall('GET', `dashboard?limit=${ACTIVITIES_PAGE_SIZE}&weeks=12`);
+            const data = await resp.json();
+            if (resp.ok && data.metrics) renderMetrics(data.metrics);
+            if (resp.ok && data.activities) {
+                const acts = data.activities;
                 // Store for the activities page pagination
                 fullActivitiesLoaded = acts;
-                activitiesOffset = acts.length; // advance offset by count returned
+                activitiesCursor = data.next_cursor || null;
                 renderActivities(acts);
                 // Charts use the initial batch only — never updated by "Load more"
                 renderCalendar(acts);
@@ -718,13 +714,13 @@ document.addEventListener('DOMContentLoaded', function () {
                 // Show "Load more" button if we got a full page (more may exist)
                 const loadMoreBtn = $('#rgd-load-more-activities');
                 if (loadMoreBtn) {
-                    loadMoreBtn.hidden = acts.length < ACTIVITIES_PAGE_SIZE;
+                    loadMoreBtn.hidden = !activitiesCursor;
                     loadMoreBtn.textContent = 'Load more';
                 }
             }
-            // Mileage chart uses dedicated weekly-mileage endpoint (not activities list)
-            if (mileageResp.ok && mileageData.weeks) {
-                renderMileageChart(mileageData.weeks);
+            // Mileage chart uses the weekly buckets (not the activities list)
+            if (resp.ok && data.weeks) {
+                renderMileageChart(data.weeks);
             }
         } catch (err) { console.error('Load error:', err); }
         hideOverlay();
@@ -735,7 +731,7 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     // Fetch the next batch of activities for the activities page.
-    // Appends to the existing list and advances the offset. Charts are
+    // Appends to the existing list and advances the cursor. Charts are
     // never affected — this only updates the activities page list.
     async function loadMoreActivities() {
         if (isLoadingMore) return;
@@ -746,12 +742,12 @@ document.addEventListener('DOMContentLoaded', function () {
             loadMoreBtn.disabled = true;
         }
         try {
-            const resp = await apiCall('GET', `activities?limit=${ACTIVITIES_PAGE_SIZE}&offset=${activitiesOffset}`);
+            const resp = await apiCall('GET', `activities?limit=${ACTIVITIES_PAGE_SIZE}&cursor=${encodeURIComponent(activitiesCursor || '')}`);
             const data = await resp.json();
             if (resp.ok && data.activities) {
                 const newActs = data.activities;
                 fullActivitiesLoaded = fullActivitiesLoaded.concat(newActs);
-                activitiesOffset += newActs.length;
+                activitiesCursor = data.next_cursor || null;
                 // Re-render the full activities list with all accumulated activities.
                 // The overview list (5 latest) is not affected since it uses
                 // a separate container and only shows the first 5.
@@ -761,9 +757,9 @@ document.addEventListener('DOMContentLoaded', function () {
                     );
                     attachActivityHeaderHandlers(activitiesFull);
                 }
-                // Hide the button if we got fewer than a full page (no more data)
+                // Hide the button once there's no next page (no more data)
                 if (loadMoreBtn) {
-                    loadMoreBtn.hidden = newActs.length < ACTIVITIES_PAGE_SIZE;
+                    loadMoreBtn.hidden = !activitiesCursor;
                     loadMoreBtn.textContent = 'Load more';
                     loadMoreBtn.disabled = false;
                 }
@@ -2282,7 +2278,7 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     // =========================================================================
-    // 6-Pillar AI Summary — uses /race-goal/ai-radar with localStorage cache
+    // 6-Pillar AI Summary — streams /race-goal/ai-radar-stream with localStorage cache
     // Cache keyed by session token + race goal hash, 6-hour TTL
     // =========================================================================
 
@@ -2348,25 +2344,62 @@ document.addEventListener('DOMContentLoaded', function () {
         summaryErrors.forEach(el => el.hidden = true);
         refreshAnalysisBtn.hidden = true;
 
+        const showSummaryError = (message) => {
+            showRadarSkeleton(false);
+            summaryErrors.forEach(el => {
+                el.textContent = message;
+                el.hidden = false;
+            });
+            pillarsContents.forEach(el => el.hidden = true);
+            refreshAnalysisBtn.hidden = false;
+        };
+
         try {
-            const resp = await apiCall('GET', 'ai-radar');
-            const data = await resp.json();
+            // Streaming variant — each dimension arrives as its own SSE event,
+            // so the radar and pillars fill in while the model is still writing
+            const resp = await apiCall('GET', 'ai-radar-stream');
             if (!resp.ok) {
-                showRadarSkeleton(false);
-                summaryErrors.forEach(el => {
-                    el.textContent = data.error || 'Failed to load insights.';
-                    el.hidden = false;
-                });
-                pillarsContents.forEach(el => el.hidden = true);
-                refreshAnalysisBtn.hidden = false;
+                const data = await resp.json();
+                showSummaryError(data.error || 'Failed to load insights.');
                 return;
             }
-            // Cache the successful response for future loads
-            writeAICache(data);
-            // Render both the radar chart and the insight text from the same AI data
-            showRadarSkeleton(false);
-            renderRadarChart(data);
-            renderPillars(data);
+
+            const reader = resp.body.getReader();
+            const decoder = new TextDecoder();
+            const dims = [];
+            let buffer = '';
+            let finished = false;
+            while (!finished) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                // Events are separated by a blank line; keep any partial tail
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const raw of events) {
+                    const event = (raw.match(/^event: (.*)$/m) || [])[1];
+                    const dataLine = (raw.match(/^data: (.*)$/m) || [])[1];
+                    if (!event || !dataLine) continue;
+                    const payload = JSON.parse(dataLine);
+                    if (event === 'dimension') {
+                        if (dims.length === 0) showRadarSkeleton(false);
+                        dims.push(payload);
+                        renderRadarChart({ dimensions: dims });
+                        renderPillars({ dimensions: dims });
+                    } else if (event === 'done') {
+                        // Cache the complete result for future loads
+                        writeAICache(payload);
+                        showRadarSkeleton(false);
+                        renderRadarChart(payload);
+                        renderPillars(payload);
+                        finished = true;
+                    } else if (event === 'error') {
+                        showSummaryError(payload.error || 'Failed to load insights.');
+                        finished = true;
+                    }
+                }
+            }
+            if (!finished) showSummaryError('Failed to load insights.');
         } catch (err) {
             showRadarSkeleton(false);
             summaryErrors.forEach(el => {